@@ -174,14 +174,24 @@ class APIService: ObservableObject {
         conversationId: String? = nil,
         senderId: String? = nil,
         limit: Int = 50,
-        offset: Int = 0
+        offset: Int = 0,
+        before: String? = nil,
+        after: String? = nil
     ) async throws -> MessagesResponse {
         var components = URLComponents(string: "\(apiBaseURL)/api/messages")!
         var queryItems: [URLQueryItem] = [
-            URLQueryItem(name: "limit", value: "\(limit)"),
-            URLQueryItem(name: "offset", value: "\(offset)")
+            URLQueryItem(name: "limit", value: "\(limit)")
         ]
 
+        // Cursors page from a known message; offset is only used without one
+        if let before = before {
+            queryItems.append(URLQueryItem(name: "before", value: before))
+        } else if let after = after {
+            queryItems.append(URLQueryItem(name: "after", value: after))
+        } else {
+            queryItems.append(URLQueryItem(name: "offset", value: "\(offset)"))
+        }
+
         if let conversationId = conversationId {
             queryItems.append(URLQueryItem(name: "conversation_id", value: conversationId))
         }
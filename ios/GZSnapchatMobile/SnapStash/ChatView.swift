@@ -46,7 +46,9 @@ struct ChatView: View {
     
     // Pagination state
     @State private var hasMoreOlderMessages = true
-    @State private var currentOffset = 0
+    @State private var currentOffset = 0  // Used for locally stored messages (offline)
+    @State private var olderCursor: String? = nil  // Server cursor of the oldest loaded message
+    @State private var newerCursor: String? = nil  // Server cursor of the newest loaded message
     @State private var scrollToMessageId: Int? = nil
     @State private var scrollToAfterLoad: Int? = nil  // Message to scroll to after loading older messages
     @State private var isLoadingAll = false  // Loading all messages in background
@@ -350,44 +352,61 @@ struct ChatView: View {
 
         // Reset pagination state
         currentOffset = 0
+        olderCursor = nil
+        newerCursor = nil
         hasMoreOlderMessages = true
 
         do {
             print("🔍 Loading messages for conversation: \(conversation.id)")
-            let fetchedMessages = try await dataRepository.fetchMessages(for: conversation.id, limit: pageSize, offset: 0, forceRefresh: true)
-            print("✅ Loaded \(fetchedMessages.count) messages")
-            messages = fetchedMessages.sorted { $0.creationTimestamp < $1.creationTimestamp }
-            currentOffset = fetchedMessages.count
-            hasMoreOlderMessages = fetchedMessages.count >= pageSize
+            let page = try await dataRepository.fetchMessagePage(for: conversation.id, limit: pageSize)
+            print("✅ Loaded \(page.messages.count) messages")
+            applyLatestPage(page)
 
             // Sync this conversation in the background
             Task.detached {
                 await SyncManager.shared.syncConversation(self.conversation.id)
             }
-        } catch let error as APIError {
-            print("❌ APIError loading messages: \(error.message)")
-            errorMessage = error.message
         } catch {
-            print("❌ Error loading messages: \(error)")
-            errorMessage = error.localizedDescription
+            // Offline: show the locally stored messages, paged by offset
+            let localMessages = await dataRepository.fetchMessagesFromLocalOnly(conversationId: conversation.id, limit: pageSize, offset: 0)
+            if localMessages.isEmpty {
+                print("❌ Error loading messages: \(error)")
+                errorMessage = (error as? APIError)?.message ?? error.localizedDescription
+            } else {
+                print("📦 Server unavailable - showing \(localMessages.count) local messages")
+                messages = localMessages.sorted { $0.creationTimestamp < $1.creationTimestamp }
+                currentOffset = localMessages.count
+                hasMoreOlderMessages = localMessages.count >= pageSize
+            }
         }
 
         isLoading = false
         didLoadInitialMessages = true
     }
 
+    private func applyLatestPage(_ page: MessagesResponse) {
+        messages = page.messages.sorted { $0.creationTimestamp < $1.creationTimestamp }
+        currentOffset = page.messages.count
+        olderCursor = page.cursors?.before
+        newerCursor = page.cursors?.after
+        hasMoreOlderMessages = page.pagination.hasNext
+    }
+
     private func refreshMessagesInBackground() async {
         // Silently refresh from server without blocking UI or showing loading state
         do {
             print("🔄 Background refresh for conversation: \(conversation.id)")
-            let fetchedMessages = try await dataRepository.fetchMessages(for: conversation.id, limit: pageSize, offset: 0, forceRefresh: true)
+            if let cursor = newerCursor {
+                // Already showing server pages: only fetch what is newer, keeping loaded history
+                await loadNewerMessages(from: cursor)
+            } else {
+                let page = try await dataRepository.fetchMessagePage(for: conversation.id, limit: pageSize)
 
-            await MainActor.run {
-                if !fetchedMessages.isEmpty {
-                    messages = fetchedMessages.sorted { $0.creationTimestamp < $1.creationTimestamp }
-                    currentOffset = fetchedMessages.count
-                    hasMoreOlderMessages = fetchedMessages.count >= pageSize
-                    print("✅ Background refresh completed: \(fetchedMessages.count) messages")
+                await MainActor.run {
+                    if !page.messages.isEmpty {
+                        applyLatestPage(page)
+                        print("✅ Background refresh completed: \(page.messages.count) messages")
+                    }
                 }
             }
 
@@ -401,11 +420,56 @@ struct ChatView: View {
         }
     }
     
+    private func loadNewerMessages(from cursor: String) async {
+        var cursor = cursor
+        var newerMessages: [Message] = []
+        var hasMore = true
+
+        // Page forward from the newest loaded message until caught up
+        while hasMore && !Task.isCancelled {
+            do {
+                let page = try await dataRepository.fetchMessagePage(for: conversation.id, limit: pageSize, after: cursor)
+                newerMessages += page.messages.sorted { $0.creationTimestamp < $1.creationTimestamp }
+                cursor = page.cursors?.after ?? cursor
+                hasMore = page.pagination.hasPrev
+            } catch {
+                print("⚠️ Loading newer messages failed: \(error)")
+                break
+            }
+        }
+
+        if !newerMessages.isEmpty {
+            let loadedIds = Set(messages.map { $0.id })
+            messages += newerMessages.filter { !loadedIds.contains($0.id) }
+            currentOffset = messages.count
+            print("✅ Loaded \(newerMessages.count) newer messages")
+        }
+        newerCursor = cursor
+    }
+
     private func loadOlderMessages() async {
         guard !isLoadingOlder && hasMoreOlderMessages else { return }
 
         isLoadingOlder = true
 
+        if let cursor = olderCursor {
+            do {
+                print("🔍 Loading older messages before cursor")
+                let page = try await dataRepository.fetchMessagePage(for: conversation.id, limit: pageSize, before: cursor)
+                print("✅ Loaded \(page.messages.count) older messages")
+                let sortedOlder = page.messages.sorted { $0.creationTimestamp < $1.creationTimestamp }
+                messages = sortedOlder + messages
+                currentOffset += page.messages.count
+                olderCursor = page.cursors?.before
+                hasMoreOlderMessages = page.pagination.hasNext
+            } catch {
+                print("❌ Error loading older messages: \(error)")
+                hasMoreOlderMessages = false
+            }
+            isLoadingOlder = false
+            return
+        }
+
         do {
             print("🔍 Loading older messages, offset: \(currentOffset)")
             let olderMessages = try await dataRepository.fetchMessages(
@@ -441,6 +505,7 @@ struct ChatView: View {
         // Accumulate all older messages first, then update UI once at the end
         var allOlderMessages: [Message] = []
         var tempOffset = currentOffset
+        var cursor = olderCursor
         var hasMore = hasMoreOlderMessages
         
         // Keep loading until we have all messages
@@ -450,7 +515,8 @@ struct ChatView: View {
                 let response = try await apiService.getMessages(
                     conversationId: conversation.id,
                     limit: pageSize,
-                    offset: tempOffset
+                    offset: tempOffset,
+                    before: cursor
                 )
                 print("✅ Loaded \(response.messages.count) messages (hasNext: \(response.pagination.hasNext))")
                 
@@ -461,6 +527,7 @@ struct ChatView: View {
                     let olderMessages = response.messages.sorted { $0.creationTimestamp < $1.creationTimestamp }
                     allOlderMessages = olderMessages + allOlderMessages
                     tempOffset += response.messages.count
+                    cursor = response.cursors?.before
                     hasMore = response.pagination.hasNext
                 }
                 
@@ -477,6 +544,7 @@ struct ChatView: View {
         if !allOlderMessages.isEmpty {
             messages = allOlderMessages + messages
             currentOffset = tempOffset
+            olderCursor = cursor
         }
         hasMoreOlderMessages = hasMore
         
@@ -543,7 +611,8 @@ struct ChatView: View {
                 let response = try await apiService.getMessages(
                     conversationId: conversation.id,
                     limit: pageSize,
-                    offset: currentOffset
+                    offset: currentOffset,
+                    before: olderCursor
                 )
                 
                 if response.messages.isEmpty {
@@ -552,6 +621,7 @@ struct ChatView: View {
                     let olderMessages = response.messages.sorted { $0.creationTimestamp < $1.creationTimestamp }
                     messages = olderMessages + messages
                     currentOffset += response.messages.count
+                    olderCursor = response.cursors?.before
                     hasMoreOlderMessages = response.pagination.hasNext
                 }
             } catch {
@@ -214,6 +214,29 @@ class DataRepository: ObservableObject {
         return await fetchMessagesFromLocal(conversationId: conversationId, limit: limit, offset: offset)
     }
 
+    // Fetch one page from the server by cursor (newest first) and store it locally.
+    // Throws when the server can't be reached; callers fall back to local data.
+    func fetchMessagePage(for conversationId: String, limit: Int = 100, before: String? = nil, after: String? = nil) async throws -> MessagesResponse {
+        do {
+            let response = try await apiService.getMessages(conversationId: conversationId, limit: limit, before: before, after: after)
+            if !isOnline {
+                await MainActor.run {
+                    self.isOnline = true
+                    print("✅ Connectivity restored - back online!")
+                }
+            }
+            await saveMessages(response.messages, for: conversationId)
+            updateSyncMetadata(for: "messages_\(conversationId)")
+            return response
+        } catch {
+            print("DataRepository: Failed to fetch message page from server: \(error)")
+            await MainActor.run {
+                self.isOnline = false
+            }
+            throw error
+        }
+    }
+
     // Public method to fetch only from local storage without any network calls
     func fetchMessagesFromLocalOnly(conversationId: String, limit: Int = 100, offset: Int = 0) async -> [Message] {
         return await fetchMessagesFromLocal(conversationId: conversationId, limit: limit, offset: offset)
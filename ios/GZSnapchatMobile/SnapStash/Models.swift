@@ -293,9 +293,16 @@ struct ConversationsResponse: Codable {
     let pagination: PaginationMeta
 }
 
+// Opaque positions of the oldest (before) and newest (after) message of a page
+struct MessageCursors: Codable {
+    let before: String?
+    let after: String?
+}
+
 struct MessagesResponse: Codable {
     let messages: [Message]
     let pagination: PaginationMeta
+    let cursors: MessageCursors?
 }
 
 struct ConversationDetailResponse: Codable {
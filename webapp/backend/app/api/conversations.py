@@ -98,84 +98,71 @@ async def get_conversations(
     """Get conversations with pagination, ordered by last message."""
     storage_service = StorageService(db)
     
-    conversations = storage_service.get_conversations(
+    # Conversations with their precomputed summary (last message, counts, avatar senders)
+    conversation_rows = storage_service.get_conversation_list(
         limit=limit,
         offset=offset,
         exclude_ads=exclude_ads
     )
     
     # Get total count for pagination
-    total_count = len(conversations)
+    total_count = len(conversation_rows)
+
+    # Avatar users of the whole page in one query
+    avatar_user_ids = {
+        user_id
+        for _, summary, _ in conversation_rows if summary
+        for user_id in summary.avatar_participant_ids or []
+    }
+    users_by_id = storage_service.get_users_by_ids(avatar_user_ids)
+    exclude_name = get_runtime_dm_exclude_name()
     
     # Build response with last message preview
     conversation_responses = []
-    for conv in conversations:
-        # Get the last message for this conversation
-        last_messages = storage_service.get_messages_by_conversation(
-            conversation_id=conv.id,
-            limit=1
-        )
-        
+    for conv, summary, last_sender in conversation_rows:
         last_message_preview = None
-        if last_messages:
-            msg = last_messages[0]
-            media_type = None
-            has_media = msg.media_asset_id is not None
-            
-            if has_media and msg.media_asset:
-                asset = msg.media_asset
-                if asset.file_type:
-                    ft = asset.file_type.lower()
-                    if ft == 'image' or (asset.mime_type and asset.mime_type.startswith('image/')):
-                        media_type = 'image'
-                    elif ft == 'video' or (asset.mime_type and asset.mime_type.startswith('video/')):
-                        media_type = 'video'
-                    elif ft == 'audio' or (asset.mime_type and asset.mime_type.startswith('audio/')):
-                        media_type = 'audio'
-            
+        if summary and summary.last_message_id is not None:
             last_message_preview = LastMessagePreview(
-                text=msg.text,
-                has_media=has_media,
-                media_type=media_type,
-                sender_name=msg.sender.display_name if msg.sender else None,
-                timestamp=msg.creation_timestamp
+                text=summary.last_message_text,
+                has_media=bool(summary.last_message_has_media),
+                media_type=summary.last_message_media_type,
+                sender_name=last_sender.display_name if last_sender else None,
+                timestamp=summary.last_message_timestamp
             )
         
-        # Get avatar for conversation
+        # Get avatar for conversation (senders ordered most active first, excluding the current user)
         avatar = None
-        participants = storage_service.get_conversation_participants(conv.id)
-        exclude_name = get_runtime_dm_exclude_name()
+        participants = [
+            users_by_id[user_id] for user_id in (summary.avatar_participant_ids or [] if summary else [])
+            if user_id in users_by_id
+        ]
+        participants = [
+            user for user in participants
+            if not (exclude_name and (user.display_name == exclude_name or user.username == exclude_name))
+        ]
 
         if conv.is_group_chat:
-            # For group chats, get first 3 participants' avatars (excluding current user)
-            participant_avatars = []
-            for user, _ in participants:
-                if exclude_name and (user.display_name == exclude_name or user.username == exclude_name):
-                    continue
-                participant_avatars.append(UserAvatar(
+            # For group chats, the first 3 participants' avatars
+            participant_avatars = [
+                UserAvatar(
                     user_id=user.id,
                     display_name=decode_html_entities(user.display_name),
                     bitmoji_url=user.bitmoji_url
-                ))
-                if len(participant_avatars) >= 3:
-                    break
+                )
+                for user in participants[:3]
+            ]
             if participant_avatars:
                 avatar = ConversationAvatar(
                     participants=participant_avatars
                 )
-        else:
-            # For DMs, find the other participant (not the current user)
-            for user, _ in participants:
-                # Skip the current user (matched by display_name or username)
-                if exclude_name and (user.display_name == exclude_name or user.username == exclude_name):
-                    continue
-                # Found the other participant
-                avatar = ConversationAvatar(
-                    user_id=user.id,
-                    display_name=decode_html_entities(user.display_name),
-                    bitmoji_url=user.bitmoji_url
-                )
-                break
+        elif participants:
+            # For DMs, the other participant
+            user = participants[0]
+            avatar = ConversationAvatar(
+                user_id=user.id,
+                display_name=decode_html_entities(user.display_name),
+                bitmoji_url=user.bitmoji_url
+            )
 
         conversation_responses.append(
             ConversationWithPreview(
@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..services.storage import StorageService
 from ..schemas import MessageResponse, PaginationMeta
+from ..utils.message_cursor import decode_message_cursor, encode_message_cursor
 
 
 def decode_html_entities(text: Optional[str]) -> Optional[str]:
@@ -21,9 +22,15 @@ def decode_html_entities(text: Optional[str]) -> Optional[str]:
 router = APIRouter(prefix="/api/messages", tags=["messages"])
 
 
+class MessageCursors(BaseModel):
+    before: Optional[str] = None  # Pass as ?before= for the next older page
+    after: Optional[str] = None  # Pass as ?after= for the next newer page
+
+
 class MessageListResponse(BaseModel):
     messages: List[dict]  # Use dict to allow flexible structure with relationships
     pagination: PaginationMeta
+    cursors: MessageCursors = MessageCursors()
 
 
 @router.get("", response_model=MessageListResponse)
@@ -35,45 +42,64 @@ async def get_messages(
     content_type: Optional[int] = Query(None, description="Filter by content type (0=media, 1=text, 2=mixed)"),
     has_media: Optional[bool] = Query(None, description="Filter messages with/without media"),
     limit: int = Query(50, ge=1, le=1000, description="Number of messages to return"),
-    offset: int = Query(0, ge=0, description="Number of messages to skip"),
+    offset: int = Query(0, ge=0, description="Number of messages to skip (ignored when a cursor is given)"),
+    before: Optional[str] = Query(None, description="Cursor: return the messages older than this position"),
+    after: Optional[str] = Query(None, description="Cursor: return the messages newer than this position"),
     db: Session = Depends(get_db)
 ):
-    """Get messages with optional filtering and pagination."""
+    """
+    Get messages with optional filtering and pagination.
+
+    Messages are returned newest first. Page through a timeline with the opaque cursors of
+    the response: cursors.before for older messages, cursors.after for newer ones.
+    """
     storage_service = StorageService(db)
+
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    try:
+        before_key = decode_message_cursor(before) if before else None
+        after_key = decode_message_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Convert datetime parameters to milliseconds if provided
     since_ms = int(since.timestamp() * 1000) if since else None
     until_ms = int(until.timestamp() * 1000) if until else None
-    
+
+    # One extra row tells whether another page follows in the requested direction
+    page_args = dict(
+        since_timestamp=since_ms,
+        until_timestamp=until_ms,
+        content_type=content_type,
+        has_media=has_media,
+        limit=limit + 1,
+        offset=offset,
+        before=before_key,
+        after=after_key
+    )
     if conversation_id:
-        messages = storage_service.get_messages_by_conversation(
-            conversation_id=conversation_id,
-            since_timestamp=since_ms,
-            until_timestamp=until_ms,
-            content_type=content_type,
-            has_media=has_media,
-            limit=limit,
-            offset=offset
-        )
+        messages = storage_service.get_messages_by_conversation(conversation_id=conversation_id, **page_args)
     elif sender_id:
-        messages = storage_service.get_messages_by_sender(
-            sender_id=sender_id,
-            since_timestamp=since_ms,
-            until_timestamp=until_ms,
-            content_type=content_type,
-            has_media=has_media,
-            limit=limit,
-            offset=offset
-        )
+        messages = storage_service.get_messages_by_sender(sender_id=sender_id, **page_args)
     else:
         # Get all messages with filtering
-        messages = storage_service.get_messages_with_filters(
-            since_timestamp=since_ms,
-            until_timestamp=until_ms,
-            content_type=content_type,
-            has_media=has_media,
-            limit=limit,
-            offset=offset
+        messages = storage_service.get_messages_with_filters(**page_args)
+
+    has_more = len(messages) > limit
+    if after_key:
+        # Pages are newest first, so the extra row of an after page is the first one
+        messages = messages[len(messages) - limit:] if has_more else messages
+        has_next, has_prev = True, has_more
+    else:
+        messages = messages[:limit]
+        has_next, has_prev = has_more, before_key is not None or offset > 0
+
+    cursors = MessageCursors()
+    if messages:
+        cursors = MessageCursors(
+            before=encode_message_cursor(messages[-1].creation_timestamp, messages[-1].id),
+            after=encode_message_cursor(messages[0].creation_timestamp, messages[0].id)
         )
     
     # Get total count for pagination
@@ -120,9 +146,10 @@ async def get_messages(
             total=total_count,
             limit=limit,
             offset=offset,
-            has_next=total_count == limit,  # Simplified check
-            has_prev=offset > 0
-        )
+            has_next=has_next,
+            has_prev=has_prev
+        ),
+        cursors=cursors
     )
 
 
@@ -3,12 +3,11 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
-from sqlalchemy import or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..models import Message, User, Conversation
 from ..schemas import PaginationMeta
+from ..services.storage import StorageService
 
 router = APIRouter(prefix="/api/search", tags=["search"])
 
@@ -16,6 +15,8 @@ router = APIRouter(prefix="/api/search", tags=["search"])
 class SearchResultMessage(BaseModel):
     id: int
     text: Optional[str]
+    snippet: Optional[str] = None  # HTML-escaped matching text with <mark></mark> around the matched words
+    rank: Optional[float] = None  # bm25 score (lower is better); None without the search index
     content_type: int
     creation_timestamp: int
     read_timestamp: Optional[int]
@@ -42,6 +43,7 @@ async def search_messages(
     conversation_id: Optional[str] = Query(None, description="Filter by conversation ID"),
     since: Optional[datetime] = Query(None, description="Search messages after this timestamp"),
     until: Optional[datetime] = Query(None, description="Search messages before this timestamp"),
+    order: str = Query("relevance", pattern="^(relevance|recent)$", description="Sort by relevance (bm25) or recency"),
     limit: int = Query(50, ge=1, le=500, description="Number of results to return"),
     offset: int = Query(0, ge=0, description="Number of results to skip"),
     db: Session = Depends(get_db)
@@ -49,53 +51,38 @@ async def search_messages(
     """
     Search through messages for text content.
     
-    - **q**: The search query (required, searches message text)
+    - **q**: The search query (required; every word must match, the last one as a prefix)
     - **sender_id**: Optional filter by sender
     - **conversation_id**: Optional filter by conversation
     - **since**: Optional filter for messages after this datetime
     - **until**: Optional filter for messages before this datetime
+    - **order**: "relevance" (best match first) or "recent" (newest first)
     - **limit**: Maximum number of results (default 50, max 500)
     - **offset**: Pagination offset
+    
+    Each result carries an HTML-escaped snippet of the matching text with the matched words wrapped
+    in <mark></mark>.
     """
-    # Build base query with eager loading
-    query = db.query(Message).options(
-        joinedload(Message.sender),
-        joinedload(Message.conversation)
+    storage = StorageService(db)
+    matches, total_count = storage.search_messages(
+        q,
+        sender_id=sender_id,
+        conversation_id=conversation_id,
+        since_timestamp=int(since.timestamp() * 1000) if since else None,
+        until_timestamp=int(until.timestamp() * 1000) if until else None,
+        order=order,
+        limit=limit,
+        offset=offset
     )
     
-    # Search in message text (case-insensitive)
-    query = query.filter(Message.text.ilike(f"%{q}%"))
-    
-    # Apply optional filters
-    if sender_id:
-        query = query.filter(Message.sender_id == sender_id)
-    
-    if conversation_id:
-        query = query.filter(Message.conversation_id == conversation_id)
-    
-    if since:
-        since_ms = int(since.timestamp() * 1000)
-        query = query.filter(Message.creation_timestamp >= since_ms)
-    
-    if until:
-        until_ms = int(until.timestamp() * 1000)
-        query = query.filter(Message.creation_timestamp <= until_ms)
-    
-    # Get total count before pagination
-    total_count = query.count()
-    
-    # Apply ordering (most recent first) and pagination
-    query = query.order_by(Message.creation_timestamp.desc())
-    query = query.offset(offset).limit(limit)
-    
-    messages = query.all()
-    
     # Build response
     results = []
-    for msg in messages:
+    for msg, snippet, rank in matches:
         results.append(SearchResultMessage(
             id=msg.id,
             text=msg.text,
+            snippet=snippet,
+            rank=rank,
             content_type=msg.content_type,
             creation_timestamp=msg.creation_timestamp,
             read_timestamp=msg.read_timestamp,
@@ -84,3 +84,14 @@ async def populate_dm_names(
     """Populate names for individual DM conversations based on participants."""
     storage_service = StorageService(db)
     return storage_service.populate_individual_dm_names()
+
+
+@router.post("/rebuild-rollups")
+async def rebuild_activity_rollups(
+    db: Session = Depends(get_db)
+):
+    """Recompute the daily activity rollups behind the activity statistics from all messages."""
+    storage_service = StorageService(db)
+    rows = storage_service.rebuild_activity_rollups()
+    db.commit()
+    return {"success": True, "rollup_rows": rows}
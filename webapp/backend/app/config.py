@@ -53,6 +53,18 @@ class Settings(BaseSettings):
         default=300,
         description="SSH operation timeout in seconds"
     )
+    ssh_multiplexing: bool = Field(
+        default=True,
+        description="Reuse one persistent OpenSSH ControlMaster connection per device for all commands and streams"
+    )
+    ssh_control_dir: Optional[str] = Field(
+        default="/app/data/ssh_control",
+        description="Directory for SSH control sockets, must be private to the app user (empty = <tmp>/snapstash-ssh)"
+    )
+    ssh_control_persist_seconds: int = Field(
+        default=1800,
+        description="How long an idle SSH master connection is kept open between ingest cycles"
+    )
     
     # Media extraction settings
     extract_media: bool = Field(
@@ -63,6 +75,87 @@ class Settings(BaseSettings):
         default="/app/data/media_storage",
         description="Path for permanent media file storage"
     )
+    tar_compression: str = Field(
+        default="auto",
+        description="Device-side tar stream compression: auto, none, gzip, zstd or lz4"
+    )
+    compression_benchmark: bool = Field(
+        default=False,
+        description="Measure wire bytes vs wall time for every usable codec on the database payload"
+    )
+    workspace_path: Optional[str] = Field(
+        default="/app/data/workspaces",
+        description="Directory holding the persistent per-device extraction workspaces (empty = temporary directory per run)"
+    )
+    media_fingerprint_cache_path: Optional[str] = Field(
+        default="/app/data/media_fingerprints.db",
+        description="SQLite file caching media hashes/types by path, size and mtime (empty = disabled)"
+    )
+    media_scan_workers: int = Field(
+        default=4,
+        description="Threads used to hash and identify new media files during scanning"
+    )
+    media_manifest_path: Optional[str] = Field(
+        default="/app/data/media_manifest.db",
+        description="SQLite file remembering remote media sizes/mtimes so each cycle only matches new or changed files (empty = disabled)"
+    )
+    media_settle_seconds: int = Field(
+        default=10,
+        description="Remote media modified more recently than this is left for the next cycle (may still be being written)"
+    )
+    media_transfer_channels: int = Field(
+        default=4,
+        description="Concurrent SSH channels used to transfer media batches"
+    )
+    media_transfer_batch_mb: int = Field(
+        default=64,
+        description="Target size of a media transfer batch in MB (a dropped connection costs at most about one batch)"
+    )
+    media_transfer_retries: int = Field(
+        default=2,
+        description="Times a failed media batch is retried for the files that did not arrive"
+    )
+    
+    # Incremental message extraction
+    incremental_extraction: bool = Field(
+        default=True,
+        description="Only decode messages newer than the last ingested source timestamp"
+    )
+    remote_delta_export: bool = Field(
+        default=True,
+        description="On incremental runs, export only changed arroyo.db rows with the device's sqlite3 instead of pulling the whole database"
+    )
+    wal_replication: bool = Field(
+        default=False,
+        description="Keep persistent local replicas of arroyo.db and main.db, updated from the device's WAL frames"
+    )
+    wal_replica_path: str = Field(
+        default="/app/data/replicas",
+        description="Directory holding the per-device database replicas"
+    )
+    full_reconcile_interval_hours: int = Field(
+        default=24,
+        description="Hours between full message re-extractions when incremental extraction is enabled (0 = always full)"
+    )
+    pending_media_lookback_hours: int = Field(
+        default=24,
+        description="Re-extract messages this recent that are still waiting for their media"
+    )
+    
+    # Streaming ingest and message decoding
+    streaming_ingest: bool = Field(
+        default=False,
+        description="Link, convert and store messages in bounded chunks instead of loading the whole archive"
+    )
+    ingest_chunk_size: int = Field(
+        default=1000,
+        description="Messages per chunk when streaming ingest is enabled"
+    )
+    
+    protobuf_decode_workers: int = Field(
+        default=0,
+        description="Worker processes for protobuf message decoding (0 or 1 = decode in-process)"
+    )
     
     # Ingestion loop configuration
     disable_ingest_loop: bool = Field(
@@ -168,12 +261,78 @@ class Settings(BaseSettings):
             "ssh_timeout": {
                 "env": ["SSH_TIMEOUT", "TIMEOUT_SECONDS"]
             },
+            "ssh_multiplexing": {
+                "env": ["SSH_MULTIPLEXING"]
+            },
+            "ssh_control_dir": {
+                "env": ["SSH_CONTROL_DIR"]
+            },
+            "ssh_control_persist_seconds": {
+                "env": ["SSH_CONTROL_PERSIST_SECONDS"]
+            },
             "extract_media": {
                 "env": ["EXTRACT_MEDIA"]
             },
             "media_storage_path": {
                 "env": ["MEDIA_STORAGE_PATH"]
             },
+            "tar_compression": {
+                "env": ["TAR_COMPRESSION"]
+            },
+            "compression_benchmark": {
+                "env": ["COMPRESSION_BENCHMARK"]
+            },
+            "workspace_path": {
+                "env": ["WORKSPACE_PATH"]
+            },
+            "media_fingerprint_cache_path": {
+                "env": ["MEDIA_FINGERPRINT_CACHE_PATH"]
+            },
+            "media_scan_workers": {
+                "env": ["MEDIA_SCAN_WORKERS"]
+            },
+            "media_manifest_path": {
+                "env": ["MEDIA_MANIFEST_PATH"]
+            },
+            "media_settle_seconds": {
+                "env": ["MEDIA_SETTLE_SECONDS"]
+            },
+            "media_transfer_channels": {
+                "env": ["MEDIA_TRANSFER_CHANNELS"]
+            },
+            "media_transfer_batch_mb": {
+                "env": ["MEDIA_TRANSFER_BATCH_MB"]
+            },
+            "media_transfer_retries": {
+                "env": ["MEDIA_TRANSFER_RETRIES"]
+            },
+            "incremental_extraction": {
+                "env": ["INCREMENTAL_EXTRACTION"]
+            },
+            "remote_delta_export": {
+                "env": ["REMOTE_DELTA_EXPORT"]
+            },
+            "wal_replication": {
+                "env": ["WAL_REPLICATION"]
+            },
+            "wal_replica_path": {
+                "env": ["WAL_REPLICA_PATH"]
+            },
+            "full_reconcile_interval_hours": {
+                "env": ["FULL_RECONCILE_INTERVAL_HOURS"]
+            },
+            "pending_media_lookback_hours": {
+                "env": ["PENDING_MEDIA_LOOKBACK_HOURS"]
+            },
+            "streaming_ingest": {
+                "env": ["STREAMING_INGEST"]
+            },
+            "ingest_chunk_size": {
+                "env": ["INGEST_CHUNK_SIZE"]
+            },
+            "protobuf_decode_workers": {
+                "env": ["PROTOBUF_DECODE_WORKERS"]
+            },
             "disable_ingest_loop": {
                 "env": ["DISABLE_INGEST_LOOP"]
             },
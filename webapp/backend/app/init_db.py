@@ -11,10 +11,132 @@ def create_tables():
     Base.metadata.create_all(bind=engine)
 
 
+def ensure_message_dedup_index():
+    """
+    Upgrade databases created before the (conversation_id, creation_timestamp)
+    index was unique: merge existing duplicates, then recreate the index as UNIQUE.
+    Mirrors the unique_message_dedup_index migration for installs that only use create_all.
+    """
+    from .database import SessionLocal
+    from .services.storage import StorageService, has_unique_message_dedup_index
+
+    with engine.connect() as conn:
+        if has_unique_message_dedup_index(conn):
+            return
+
+    logger.info("Upgrading message dedup index to UNIQUE...")
+    db = SessionLocal()
+    try:
+        cleanup_results = StorageService(db).cleanup_duplicate_messages()
+        logger.info(f"Duplicate message cleanup: {cleanup_results}")
+    finally:
+        db.close()
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_messages_conversation_timestamp"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX idx_messages_conversation_timestamp "
+            "ON messages (conversation_id, creation_timestamp)"
+        ))
+    logger.info("Message dedup index is now UNIQUE")
+
+
+def ensure_message_fts_index():
+    """
+    Create the messages_fts full-text index and its sync triggers if missing, then
+    backfill it from the existing messages.
+    Mirrors the add_message_fts migration for installs that only use create_all.
+    """
+    from .services.storage import MESSAGE_FTS_SCHEMA, has_message_fts
+
+    with engine.connect() as conn:
+        if has_message_fts(conn):
+            return
+
+    logger.info("Building message full-text search index...")
+    with engine.begin() as conn:
+        for statement in MESSAGE_FTS_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    logger.info("Message full-text search index is ready")
+
+
+def ensure_conversation_summaries():
+    """
+    Create the conversation list index if missing and fill conversation_summary from the
+    existing messages when it is still empty (new table on an existing database).
+    Completes the add_conversation_summary migration, and covers installs that only use create_all.
+    """
+    from .database import SessionLocal
+    from .models import ConversationSummary
+    from .services.storage import StorageService
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_last_message_at ON conversations (last_message_at)"
+        ))
+
+    db = SessionLocal()
+    try:
+        if db.query(ConversationSummary).first() is not None or db.query(Message).first() is None:
+            return
+        logger.info("Building conversation summaries...")
+        refreshed = StorageService(db).refresh_conversation_summaries()
+        db.commit()
+        logger.info(f"Built summaries for {refreshed} conversations")
+    finally:
+        db.close()
+
+
+def ensure_activity_rollups():
+    """
+    Fill message_activity_daily from the existing messages when it is still empty
+    (new table on an existing database). Completes the add_message_activity_rollups migration.
+    """
+    from .database import SessionLocal
+    from .models import MessageActivityDaily
+    from .services.storage import StorageService
+
+    db = SessionLocal()
+    try:
+        if db.query(MessageActivityDaily).first() is not None or db.query(Message).first() is None:
+            return
+        logger.info("Building daily activity rollups...")
+        rows = StorageService(db).rebuild_activity_rollups()
+        db.commit()
+        logger.info(f"Built {rows} daily activity rollup rows")
+    finally:
+        db.close()
+
+
 def init_database():
     """Initialize database with tables and SQLite optimizations"""
     logger.info("Creating database tables...")
     create_tables()
+
+    try:
+        ensure_message_dedup_index()
+    except Exception as e:
+        # Ingest falls back to per-row upserts while the index is not unique
+        logger.error(f"Failed to upgrade message dedup index: {e}")
+
+    try:
+        ensure_message_fts_index()
+    except Exception as e:
+        # Search falls back to LIKE scans (e.g. SQLite built without FTS5)
+        logger.error(f"Failed to create message search index: {e}")
+
+    try:
+        ensure_conversation_summaries()
+    except Exception as e:
+        # The conversation list shows no previews until ingestion refreshes the summaries
+        logger.error(f"Failed to build conversation summaries: {e}")
+
+    try:
+        ensure_activity_rollups()
+    except Exception as e:
+        # Activity statistics read zero until the rollups are rebuilt (POST /api/stats/rebuild-rollups)
+        logger.error(f"Failed to build activity rollups: {e}")
     
     # Enable SQLite WAL mode for better concurrent access
     with engine.connect() as conn:
@@ -6,6 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from .config import get_settings, get_ingest_config
 from .init_db import init_database
 from .services.ingest_loop import get_ingest_loop_service
+from .services.ssh_connection import close_all_ssh_connections
 from .middleware.auth import APIKeyAuthMiddleware
 from .api import health, ingest, messages, media, conversations, users, stats, scheduler, search
 from .api import settings as settings_api
@@ -61,6 +62,7 @@ async def lifespan(app: FastAPI):
         ingest_service = await get_ingest_loop_service()
         await ingest_service.stop()
         logger.info("✅ Ingestion loop stopped")
+    close_all_ssh_connections()
     logger.info("👋 Backend shutdown complete")
 
 
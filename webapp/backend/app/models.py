@@ -66,6 +66,46 @@ class Conversation(Base):
     # Relationships
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     participants = relationship("ConversationParticipant", back_populates="conversation", cascade="all, delete-orphan")
+    summary = relationship("ConversationSummary", back_populates="conversation", uselist=False, cascade="all, delete-orphan")
+
+    # Indexes
+    __table_args__ = (
+        Index("idx_conversations_last_message_at", "last_message_at"),  # Conversation list order
+    )
+
+
+class ConversationSummary(Base):
+    """
+    Conversation list data derived from the messages, maintained by the ingest writer
+    (StorageService.refresh_conversation_summaries) so listing conversations needs no
+    per-conversation queries
+    """
+
+    __tablename__ = "conversation_summary"
+
+    conversation_id = Column(String, ForeignKey("conversations.id"), primary_key=True)
+
+    # Latest message preview
+    last_message_id = Column(Integer, nullable=True)
+    last_message_timestamp = Column(BigInteger, nullable=True)  # milliseconds
+    last_message_text = Column(Text, nullable=True)
+    last_message_has_media = Column(Boolean, default=False)
+    last_message_media_type = Column(String, nullable=True)  # image, video, audio
+    last_sender_id = Column(String, ForeignKey("users.id"), nullable=True)
+
+    # Counts
+    message_count = Column(Integer, default=0)
+    media_count = Column(Integer, default=0)
+    sender_count = Column(Integer, default=0)
+
+    is_ad = Column(Boolean, default=False)  # Non-group chat with a single sender
+    avatar_participant_ids = Column(JSON, nullable=True)  # Most active senders first
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    conversation = relationship("Conversation", back_populates="summary")
+    last_sender = relationship("User", foreign_keys=[last_sender_id])
 
 
 class Message(Base):
@@ -105,13 +145,35 @@ class Message(Base):
 
     # Indexes for performance
     __table_args__ = (
-        Index("idx_messages_conversation_timestamp", "conversation_id", "creation_timestamp"),
+        Index("idx_messages_conversation_timestamp", "conversation_id", "creation_timestamp", unique=True),  # Dedup key
         Index("idx_messages_sender_timestamp", "sender_id", "creation_timestamp"),
         Index("idx_messages_cache_id", "cache_id"),
         Index("idx_messages_raw_content", "raw_message_content"),  # For deduplication
     )
 
 
+class MessageActivityDaily(Base):
+    """
+    Message counts per UTC day, conversation and sender, maintained by the ingest writer
+    (StorageService.refresh_activity_rollups) so activity statistics never scan messages
+    """
+
+    __tablename__ = "message_activity_daily"
+
+    day = Column(Integer, primary_key=True)  # UTC days since the epoch (creation_timestamp // 86400000)
+    conversation_id = Column(String, ForeignKey("conversations.id"), primary_key=True)
+    sender_id = Column(String, ForeignKey("users.id"), primary_key=True)
+
+    message_count = Column(Integer, default=0)
+    media_count = Column(Integer, default=0)  # Messages with a linked media asset
+
+    # Indexes (the primary key serves day ranges)
+    __table_args__ = (
+        Index("idx_activity_daily_sender_day", "sender_id", "day"),
+        Index("idx_activity_daily_conversation_day", "conversation_id", "day"),
+    )
+
+
 class MediaAsset(Base):
     """Media files associated with messages"""
     
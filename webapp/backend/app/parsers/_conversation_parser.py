@@ -21,7 +21,7 @@ try:
 except ImportError:
     PROTOBUF_AVAILABLE = False
 
-from ..utils.db_utils import WALConsolidator
+from ._source_context import SourceContext
 
 logger = logging.getLogger(__name__)
 
@@ -31,14 +31,15 @@ class ConversationParser:
     Identifies group chats and extracts participant information.
     """
     
-    def __init__(self, db_dir: Path):
+    def __init__(self, db_dir: Path, context: Optional[SourceContext] = None):
         self.db_dir = db_dir
+        self.context = context or SourceContext(db_dir)
         if not PROTOBUF_AVAILABLE:
             logger.warning("ConversationMetadata protobuf not available - group chat parsing disabled")
     
     def parse_conversations(self) -> List[Dict[str, Any]]:
         """Parse all conversations and extract metadata"""
-        arroyo_db_path = self.db_dir / "arroyo.db"
+        arroyo_db_path = self.context.arroyo_db_path
         conversations = []
         
         if not arroyo_db_path.exists():
@@ -46,7 +47,7 @@ class ConversationParser:
             return conversations
         
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(arroyo_db_path))
+            conn = self.context.arroyo()
             cursor = conn.cursor()
             
             # Get all conversations with metadata
@@ -88,8 +89,6 @@ class ConversationParser:
                 
                 conversations.append(conversation_data)
             
-            conn.close()
-            
             # Log summary
             group_chats = [c for c in conversations if c['is_group_chat']]
             individual_chats = [c for c in conversations if not c['is_group_chat']]
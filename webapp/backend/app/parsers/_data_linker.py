@@ -5,30 +5,133 @@ Handles linking messages to media assets via cache IDs.
 
 import logging
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 
-from ..utils.db_utils import WALConsolidator
+from ..utils.cache_key_resolver import AhoCorasick, CacheKeyResolver, SubstringSet
+from ._source_context import SourceContext
 
 logger = logging.getLogger(__name__)
 
+class MediaMatchIndex:
+    """
+    Lookups over scanned media files for DataLinker's matching methods.
+
+    Method 1 uses a plain cache_key dict. The fallback methods keep the plain substring
+    semantics of the original linear scans:
+
+    - method 2b: the first file whose original_filename contains the resolved cache_key
+    - method 3: the first file whose original_filename or cache_key contains the cache_id
+    - method 4: the first file whose cache_key contains the cache_id, or is contained in
+      it, case-insensitively
+
+    Instead of scanning every file per message, the queries of a whole chunk are matched
+    in one Aho-Corasick pass over the filenames and cache keys (prepare), and cache keys
+    inside a cache_id come from a SubstringSet of the lowercased keys. Results, including
+    misses, are memoized, so each query is scanned for at most once.
+    """
+    
+    def __init__(self, media_files: List[Dict[str, Any]]):
+        self.media_files = media_files
+        # Method 1 lookup (last file wins for duplicate cache keys, as before)
+        self.by_cache_key = {media['cache_key']: media for media in media_files}
+        # query -> index of the first file containing it (None when no file does)
+        self._filename_hits: Dict[str, Optional[int]] = {}
+        self._cache_key_hits: Dict[str, Optional[int]] = {}
+        self._lower_cache_key_hits: Dict[str, Optional[int]] = {}
+        self._cache_keys_built = False
+    
+    def _build_cache_keys(self) -> None:
+        self._first_index_by_cache_key: Dict[str, int] = {}
+        for index, media in enumerate(self.media_files):
+            cache_key = (media.get('cache_key') or '').lower()
+            if cache_key:
+                self._first_index_by_cache_key.setdefault(cache_key, index)
+        self._cache_key_set = SubstringSet(self._first_index_by_cache_key)
+        self._cache_keys_built = True
+    
+    def prepare(self, queries: Iterable[str]) -> None:
+        """
+        Match a batch of queries (cache_ids and resolved cache keys) against every media
+        file in a single pass, so the find_* lookups for them are dictionary hits.
+        """
+        pending = {query for query in queries if query and query not in self._filename_hits}
+        if not pending:
+            return
+        pending_lower = {query.lower() for query in pending} - self._lower_cache_key_hits.keys()
+        
+        filename_hits: Dict[str, int] = {}
+        cache_key_hits: Dict[str, int] = {}
+        lower_cache_key_hits: Dict[str, int] = {}
+        automaton = AhoCorasick(pending)
+        lower_automaton = AhoCorasick(pending_lower)
+        
+        for index, media in enumerate(self.media_files):
+            filename = media.get('original_filename') or ''
+            cache_key = media.get('cache_key') or ''
+            for query in automaton.iter_matches(filename):
+                filename_hits.setdefault(query, index)
+            for query in automaton.iter_matches(cache_key):
+                cache_key_hits.setdefault(query, index)
+            for query in lower_automaton.iter_matches(cache_key.lower()):
+                lower_cache_key_hits.setdefault(query, index)
+        
+        for query in pending:
+            self._filename_hits[query] = filename_hits.get(query)
+            self._cache_key_hits[query] = cache_key_hits.get(query)
+        for query in pending_lower:
+            self._lower_cache_key_hits[query] = lower_cache_key_hits.get(query)
+        logger.debug(f"Matched {len(pending)} media queries against {len(self.media_files)} media files")
+    
+    def _media_at(self, index: Optional[int]) -> Optional[Dict[str, Any]]:
+        return self.media_files[index] if index is not None else None
+    
+    def find_by_filename(self, query: str) -> Optional[Dict[str, Any]]:
+        """First media whose original_filename contains query (method 2b)"""
+        self.prepare([query])
+        return self._media_at(self._filename_hits.get(query))
+    
+    def find_by_filename_or_cache_key(self, query: str) -> Optional[Dict[str, Any]]:
+        """First media whose original_filename or cache_key contains query (method 3)"""
+        self.prepare([query])
+        hits = [index for index in (self._filename_hits.get(query), self._cache_key_hits.get(query)) if index is not None]
+        return self._media_at(min(hits)) if hits else None
+    
+    def find_by_cache_key_overlap(self, cache_id: str) -> Optional[Dict[str, Any]]:
+        """First media whose cache_key contains cache_id or is contained in it, case-insensitively (method 4)"""
+        if not cache_id:
+            return None
+        if not self._cache_keys_built:
+            self._build_cache_keys()
+        self.prepare([cache_id])
+        cache_id_lower = cache_id.lower()
+        
+        # cache_id inside a cache key
+        hits = [self._lower_cache_key_hits[cache_id_lower]] if self._lower_cache_key_hits.get(cache_id_lower) is not None else []
+        # cache key inside the cache_id
+        hits.extend(self._first_index_by_cache_key[key] for key in self._cache_key_set.members_in(cache_id_lower))
+        
+        return self._media_at(min(hits)) if hits else None
+
+
 class DataLinker:
     """
     Component responsible for linking messages to media assets via cache IDs.
     """
     
-    def __init__(self, db_dir: Path):
+    def __init__(self, db_dir: Path, context: Optional[SourceContext] = None):
         self.db_dir = db_dir
+        self.context = context or SourceContext(db_dir)
     
     def load_cache_mappings(self) -> List[Tuple[str, str]]:
         """Load cache ID to cache key mappings from cache_controller.db (like original extractor)"""
-        cache_db_path = self.db_dir / "native_content_manager" / "cache_controller.db"
+        cache_db_path = self.context.cache_controller_db_path
         
         if not cache_db_path.exists():
             logger.warning(f"Cache controller DB not found at: {cache_db_path}")
             return []
             
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(cache_db_path))
+            conn = self.context.cache_controller()
             cursor = conn.cursor()
             
             # Load all cache file claims for pattern matching (like original extractor)
@@ -38,7 +141,6 @@ class DataLinker:
             """)
             
             cache_file_claims = cursor.fetchall()
-            conn.close()
             logger.info(f"Loaded {len(cache_file_claims)} cache file claims from database")
             
             return cache_file_claims
@@ -48,28 +150,113 @@ class DataLinker:
             return []
 
     def map_cache_id_to_cache_key(self, cache_id: str, cache_file_claims: List[Tuple[str, str]]) -> Optional[str]:
-        """Map cache ID to actual cache key using pattern matching like original extractor"""
-        if not cache_id or not cache_file_claims:
-            return None
+        """Map a single cache ID to its cache key. Prefer a shared CacheKeyResolver when mapping many IDs."""
+        cache_key = CacheKeyResolver(cache_file_claims).resolve(cache_id)
+        if cache_key:
+            logger.debug(f"Cache ID {cache_id} -> Cache Key {cache_key}")
+        else:
+            logger.debug(f"No cache key found for cache ID: {cache_id}")
+        return cache_key
+
+    def _find_media_for_cache_id(
+        self,
+        cache_id: str,
+        media_index: MediaMatchIndex,
+        resolver: CacheKeyResolver
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Resolve a message cache_id to a scanned media file, trying each matching method in turn.
+
+        Returns:
+            Tuple of (media file or None, mapping_method describing which method matched)
+        """
+        # Method 1: Direct cache key lookup
+        if cache_id in media_index.by_cache_key:
+            logger.debug(f"Method 1: Direct match for cache_id {cache_id}")
+            return media_index.by_cache_key[cache_id], "cache_key"
+        
+        # Method 2: Use pattern matching to find cache key (like original extractor)
+        cache_key = resolver.resolve(cache_id)
+        if cache_key and cache_key in media_index.by_cache_key:
+            logger.debug(f"Method 2: Pattern matched cache_id {cache_id} to cache_key {cache_key}")
+            return media_index.by_cache_key[cache_key], "cache_claim"
+        elif cache_key:  # Only try filename matching if cache_key is not None
+            # Also check if cache_key matches any filename
+            media = media_index.find_by_filename(cache_key)
+            if media:
+                logger.debug(f"Method 2b: Found cache_key {cache_key} in filename {media['original_filename']}")
+                return media, "cache_claim_filename"
+        
+        # Method 3: Search by partial cache ID match in filenames
+        media = media_index.find_by_filename_or_cache_key(cache_id)
+        if media:
+            logger.debug(f"Method 3: Partial match for cache_id {cache_id} in filename {media['original_filename']}")
+            return media, "filename_contains_cache_id"
+        
+        # Method 4: Check if cache_id is a substring of any cache_key or vice versa
+        media = media_index.find_by_cache_key_overlap(cache_id)
+        if media:
+            logger.debug(f"Method 4: Substring match between cache_id {cache_id} and cache_key {media.get('cache_key')}")
+            return media, "cache_key_substring"
+        
+        return None, None
+    
+    def _link_chunk(
+        self,
+        messages: List[Dict[str, Any]],
+        media_index: MediaMatchIndex,
+        resolver: CacheKeyResolver
+    ) -> List[Dict[str, Any]]:
+        """Attach media assets to a batch of messages and return unified message objects"""
+        unified_messages = []
+        
+        # Resolve the whole batch up front so unmatched IDs share one fallback pass
+        resolver.resolve_many(message['cache_id'] for message in messages if message.get('cache_id'))
+        
+        # Match the IDs that miss the direct lookups against the media files in one pass
+        fallback_queries = set()
+        for message in messages:
+            cache_id = message.get('cache_id')
+            if not cache_id or cache_id in media_index.by_cache_key:
+                continue
+            fallback_queries.add(cache_id)
+            cache_key = resolver.resolve(cache_id)
+            if cache_key and cache_key not in media_index.by_cache_key:
+                fallback_queries.add(cache_key)
+        media_index.prepare(fallback_queries)
         
-        # Find cache key for this cache ID using substring match (like original)
-        for cache_key, external_key in cache_file_claims:
-            if external_key and cache_id in external_key:
-                logger.debug(f"Cache ID {cache_id} -> Cache Key {cache_key} (via external_key: {external_key})")
-                return cache_key
+        for message in messages:
+            # Start with message data
+            unified_message = message.copy()
+            unified_message['media_asset'] = None
+            
+            # Try to find linked media
+            if message.get('cache_id'):
+                cache_id = message['cache_id']
+                media_asset, mapping_method = self._find_media_for_cache_id(cache_id, media_index, resolver)
+                
+                if media_asset:
+                    # Update sender_id and cache_id in media_asset to match the message
+                    media_asset['sender_id'] = message.get('sender_id', 'unknown')
+                    media_asset['cache_id'] = cache_id  # Set the actual cache_id from the message
+                    media_asset['mapping_method'] = mapping_method
+                    unified_message['media_asset'] = media_asset
+                    logger.debug(f"Linked message {message.get('server_message_id')} to media {media_asset['original_filename']} with cache_id {cache_id}")
+                else:
+                    logger.debug(f"No media found for cache_id: {cache_id}")
+            
+            unified_messages.append(unified_message)
         
-        logger.debug(f"No cache key found for cache ID: {cache_id}")
-        return None
+        return unified_messages
 
     def link_media_to_messages(self, messages: List[Dict[str, Any]], media_files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Link media files to messages via cache_id and return unified message objects"""
-        unified_messages = []
-        
         # Create lookup maps
-        media_by_cache_key = {media['cache_key']: media for media in media_files}
+        media_index = MediaMatchIndex(media_files)
         
-        # Load cache file claims for pattern matching
+        # Load cache file claims and index them for cache_id lookups
         cache_file_claims = self.load_cache_mappings()
+        resolver = CacheKeyResolver(cache_file_claims)
         
         # Debug: Log sample cache IDs from messages and media
         message_cache_ids = [msg.get('cache_id') for msg in messages if msg.get('cache_id')]
@@ -87,73 +274,13 @@ class DataLinker:
             # Test pattern matching approach with first few message cache IDs
             found_mappings = 0
             for cache_id in message_cache_ids[:10]:  # Check first 10
-                cache_key = self.map_cache_id_to_cache_key(cache_id, cache_file_claims)
+                cache_key = resolver.resolve(cache_id)
                 if cache_key:
                     found_mappings += 1
                     logger.info(f"Pattern match: {cache_id} -> {cache_key}")
             logger.info(f"Found {found_mappings} pattern matches out of {len(message_cache_ids[:10])} checked")
         
-        linked_count = 0
-        for message in messages:
-            # Start with message data
-            unified_message = message.copy()
-            unified_message['media_asset'] = None
-            
-            # Try to find linked media
-            if message.get('cache_id'):
-                cache_id = message['cache_id']
-                media_asset = None
-                
-                # Method 1: Direct cache key lookup
-                if cache_id in media_by_cache_key:
-                    media_asset = media_by_cache_key[cache_id]
-                    logger.debug(f"Method 1: Direct match for cache_id {cache_id}")
-                
-                # Method 2: Use pattern matching to find cache key (like original extractor)
-                if not media_asset:
-                    cache_key = self.map_cache_id_to_cache_key(cache_id, cache_file_claims)
-                    if cache_key and cache_key in media_by_cache_key:
-                        media_asset = media_by_cache_key[cache_key]
-                        logger.debug(f"Method 2: Pattern matched cache_id {cache_id} to cache_key {cache_key}")
-                    elif cache_key:  # Only try filename matching if cache_key is not None
-                        # Also check if cache_key matches any filename
-                        for media in media_files:
-                            if (media.get('original_filename') and 
-                                (cache_key in media['original_filename'] or media['original_filename'].startswith(cache_key))):
-                                media_asset = media
-                                logger.debug(f"Method 2b: Found cache_key {cache_key} in filename {media['original_filename']}")
-                                break
-                
-                # Method 3: Search by partial cache ID match in filenames
-                if not media_asset:
-                    for media in media_files:
-                        if cache_id in media['original_filename'] or cache_id in media['cache_key']:
-                            media_asset = media
-                            logger.debug(f"Method 3: Partial match for cache_id {cache_id} in filename {media['original_filename']}")
-                            break
-                
-                # Method 4: Check if cache_id is a substring of any cache_key or vice versa
-                if not media_asset:
-                    for media in media_files:
-                        media_cache_key = media.get('cache_key', '')
-                        if (cache_id and media_cache_key and 
-                            (cache_id.lower() in media_cache_key.lower() or 
-                             media_cache_key.lower() in cache_id.lower())):
-                            media_asset = media
-                            logger.debug(f"Method 4: Substring match between cache_id {cache_id} and cache_key {media_cache_key}")
-                            break
-                
-                if media_asset:
-                    # Update sender_id and cache_id in media_asset to match the message
-                    media_asset['sender_id'] = message.get('sender_id', 'unknown')
-                    media_asset['cache_id'] = cache_id  # Set the actual cache_id from the message
-                    unified_message['media_asset'] = media_asset
-                    linked_count += 1
-                    logger.debug(f"Linked message {message.get('server_message_id')} to media {media_asset['original_filename']} with cache_id {cache_id}")
-                else:
-                    logger.debug(f"No media found for cache_id: {cache_id}")
-            
-            unified_messages.append(unified_message)
+        unified_messages = self._link_chunk(messages, media_index, resolver)
         
         # Log media linking statistics
         linked_media_count = sum(1 for msg in unified_messages if msg.get('media_asset'))
@@ -173,3 +300,29 @@ class DataLinker:
         
         logger.info(f"Created {len(unified_messages)} unified messages")
         return unified_messages
+
+    def iter_linked_chunks(
+        self,
+        message_chunks: Iterable[List[Dict[str, Any]]],
+        media_files: List[Dict[str, Any]]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Streaming counterpart of link_media_to_messages.
+
+        Cache file claims and the media lookup index are built once, then each message
+        chunk is linked and yielded before the next one is pulled from the source.
+        """
+        media_index = MediaMatchIndex(media_files)
+        cache_file_claims = self.load_cache_mappings()
+        resolver = CacheKeyResolver(cache_file_claims)
+        logger.info(f"Streaming media linking against {len(media_files)} media files and {len(cache_file_claims)} cache file claims")
+        
+        linked_count = 0
+        message_count = 0
+        for chunk in message_chunks:
+            unified_chunk = self._link_chunk(chunk, media_index, resolver)
+            linked_count += sum(1 for msg in unified_chunk if msg.get('media_asset'))
+            message_count += len(unified_chunk)
+            yield unified_chunk
+        
+        logger.info(f"Streaming media linking results: {linked_count} of {message_count} messages linked to media")
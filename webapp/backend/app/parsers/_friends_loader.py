@@ -5,9 +5,9 @@ Handles loading user and friends data from the main database.
 
 import logging
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
-from ..utils.db_utils import WALConsolidator
+from ._source_context import SourceContext
 
 logger = logging.getLogger(__name__)
 
@@ -16,16 +16,17 @@ class FriendsLoader:
     Component responsible for loading friends and user data from the main database.
     """
     
-    def __init__(self, db_dir: Path):
+    def __init__(self, db_dir: Path, context: Optional[SourceContext] = None):
         self.db_dir = db_dir
+        self.context = context or SourceContext(db_dir)
     
     def load_friends_data(self) -> Dict[str, Dict[str, str]]:
         """Extract friends/user data from main.db"""
-        main_db_path = self.db_dir / "main.db"
+        main_db_path = self.context.main_db_path
         friends = {}
         
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(main_db_path))
+            conn = self.context.main()
             cursor = conn.cursor()
             
             query = """
@@ -54,14 +55,13 @@ class FriendsLoader:
                     'bitmoji_selfie_id': bitmoji_selfie_id or ''
                 }
             
-            conn.close()
             logger.info(f"Loaded {len(friends)} friends from database")
             
         except Exception as e:
             logger.warning(f"Failed to load friends data: {e}")
             # Try alternative query in case table structure is different
             try:
-                conn = WALConsolidator.connect_with_wal_support(str(main_db_path))
+                conn = self.context.main()
                 cursor = conn.cursor()
                 
                 # Check what tables exist
@@ -75,7 +75,6 @@ class FriendsLoader:
                     columns = [row[1] for row in cursor.fetchall()]
                     logger.info(f"Columns in Friend table: {columns}")
                 
-                conn.close()
             except Exception as e2:
                 logger.warning(f"Failed to diagnose database structure: {e2}")
         
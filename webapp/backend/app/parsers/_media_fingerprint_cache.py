@@ -0,0 +1,110 @@
+"""
+Persistent media fingerprint cache for Snapchat media scanning.
+Remembers hash, MIME type, file type and EXIF timestamp per file so unchanged
+files are not re-analysed on every ingest run.
+"""
+
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MediaFingerprintCache:
+    """
+    Sidecar SQLite cache of media fingerprints keyed by relative path, size and mtime.
+
+    Relative paths are taken from the extraction root, which is stable across runs
+    even though each run extracts into a fresh temporary directory (tar and copy2
+    preserve mtimes). An entry is only reused when both size and mtime match.
+    """
+
+    def __init__(self, cache_path: Path):
+        self.cache_path = Path(cache_path)
+        self._entries: Dict[str, Tuple] = {}
+        self._pending: Dict[str, Tuple] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.cache_path), timeout=30)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS media_fingerprints (
+                relative_path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                file_type TEXT,
+                file_hash TEXT,
+                mime_type TEXT,
+                exif_timestamp INTEGER,
+                updated_at REAL
+            )
+        """)
+        return conn
+
+    def _load(self) -> None:
+        """Load all entries into memory (one row per file, a few hundred bytes each)"""
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._connect()
+            rows = conn.execute("""
+                SELECT relative_path, file_size, mtime_ns, file_type, file_hash, mime_type, exif_timestamp
+                FROM media_fingerprints
+            """).fetchall()
+            conn.close()
+            self._entries = {row[0]: row[1:] for row in rows}
+            logger.info(f"Loaded {len(self._entries)} media fingerprints from {self.cache_path}")
+        except Exception as e:
+            logger.warning(f"Could not load media fingerprint cache {self.cache_path}: {e}")
+            self._entries = {}
+
+    def get(self, relative_path: str, file_size: int, mtime_ns: int) -> Optional[Dict[str, Any]]:
+        """Return the cached fingerprint if the file is unchanged, otherwise None"""
+        entry = self._entries.get(relative_path)
+        if entry is None or entry[0] != file_size or entry[1] != mtime_ns:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {
+            'file_type': entry[2],
+            'file_hash': entry[3],
+            'mime_type': entry[4],
+            'exif_timestamp': entry[5],
+        }
+
+    def put(self, relative_path: str, file_size: int, mtime_ns: int, fingerprint: Dict[str, Any]) -> None:
+        """Record a fingerprint; written to disk on flush()"""
+        entry = (
+            file_size,
+            mtime_ns,
+            fingerprint.get('file_type'),
+            fingerprint.get('file_hash'),
+            fingerprint.get('mime_type'),
+            fingerprint.get('exif_timestamp'),
+        )
+        self._entries[relative_path] = entry
+        self._pending[relative_path] = entry
+
+    def flush(self) -> None:
+        """Persist new or changed fingerprints"""
+        if not self._pending:
+            return
+
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.executemany("""
+                INSERT OR REPLACE INTO media_fingerprints
+                    (relative_path, file_size, mtime_ns, file_type, file_hash, mime_type, exif_timestamp, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(path, *entry, now) for path, entry in self._pending.items()])
+            conn.commit()
+            conn.close()
+            logger.info(f"Saved {len(self._pending)} media fingerprints ({self.hits} cache hits, {self.misses} misses)")
+            self._pending = {}
+        except Exception as e:
+            logger.warning(f"Could not save media fingerprint cache {self.cache_path}: {e}")
@@ -4,10 +4,15 @@ Handles scanning directories and identifying media files.
 """
 
 import hashlib
+import io
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+from ._media_fingerprint_cache import MediaFingerprintCache
 
 # Separate import for python-magic since it has system dependencies
 try:
@@ -19,88 +24,109 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Read size per chunk; the first chunk doubles as the type-sniffing buffer (libmagic reads ~1MB)
+READ_CHUNK_SIZE = 1024 * 1024
+
+MEDIA_TYPES = ('image', 'video', 'audio')
+
+EXTENSION_MIME_TYPES = {
+    # Images
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.tiff': 'image/tiff',
+    # Videos
+    '.mp4': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
+    '.webm': 'video/webm',
+    '.mpeg': 'video/mpeg',
+    '.wmv': 'video/x-ms-wmv',
+    # Audio
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.ogg': 'audio/ogg',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.flac': 'audio/flac'
+}
+
 class MediaScanner:
     """
     Component responsible for scanning directories and identifying media files.
     """
-    
-    def __init__(self, media_base_dir: Path):
+
+    def __init__(self, media_base_dir: Path, fingerprint_cache_path: Optional[Path] = None, workers: int = 4):
         self.media_base_dir = media_base_dir
-    
-    def identify_file_type(self, file_path: Path) -> Optional[str]:
-        """Identify file type using python-magic or fallback"""
+        self.fingerprint_cache_path = fingerprint_cache_path
+        self.workers = max(1, workers)
+
+    def _classify(self, file_path: Path, header: bytes, file_size: int) -> Tuple[str, str]:
+        """Determine (file_type, mime_type) from the first bytes of a file"""
         # First try magic detection (more reliable for files without extensions)
         if MAGIC_AVAILABLE:
             try:
-                mime_type = magic.from_file(str(file_path), mime=True)
+                mime_type = magic.from_buffer(header, mime=True)
                 logger.debug(f"Detected MIME type for {file_path}: {mime_type}")
                 if mime_type.startswith('image/'):
-                    return 'image'
+                    return 'image', mime_type
                 elif mime_type.startswith('video/'):
-                    return 'video'
+                    return 'video', mime_type
                 elif mime_type.startswith('audio/'):
-                    return 'audio'
+                    return 'audio', mime_type
                 elif 'webp' in mime_type.lower():
-                    return 'image'
+                    return 'image', mime_type
                 # Return the detected type even if not image/video/audio for logging
-                return mime_type
+                return mime_type, mime_type
             except Exception as e:
                 logger.debug(f"Magic detection failed for {file_path}: {e}")
-        
+
         # Fallback to file extension
         ext = file_path.suffix.lower()
+        mime_type = EXTENSION_MIME_TYPES.get(ext, 'application/octet-stream')
         if ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff']:
-            return 'image'
+            return 'image', mime_type
         elif ext in ['.mp4', '.mov', '.avi', '.webm', '.mpeg', '.wmv']:
-            return 'video'
+            return 'video', mime_type
         elif ext in ['.mp3', '.wav', '.ogg', '.m4a', '.aac', '.flac']:
-            return 'audio'
-        
+            return 'audio', mime_type
+
         # For files without extensions, try a more permissive approach
         if not ext:
             # Check file size - very small files are likely not media
-            if file_path.stat().st_size < 1024:  # Less than 1KB
-                return 'too_small'
-            # For files without extensions that are reasonably sized, try to peek at content
-            try:
-                with open(file_path, 'rb') as f:
-                    header = f.read(16)
-                    # Check for common image/video/audio headers
-                    if header.startswith(b'\xff\xd8\xff'):  # JPEG
-                        return 'image'
-                    elif header.startswith(b'\x89PNG'):  # PNG
-                        return 'image' 
-                    elif header.startswith(b'RIFF') and b'WEBP' in header:  # WebP
-                        return 'image'
-                    elif b'ftyp' in header[:16]:  # More flexible MP4 detection - look for "ftyp" box
-                        return 'video'
-                    elif header.startswith(b'\x1a\x45\xdf\xa3'):  # Matroska/WebM
-                        return 'video'
-                    elif header.startswith(b'\xff\xfb') or header.startswith(b'\xff\xf3') or header.startswith(b'\xff\xf2'):  # MP3
-                        return 'audio'
-                    elif header.startswith(b'RIFF') and b'WAVE' in header[:16]:  # WAV
-                        return 'audio'
-                    elif header.startswith(b'OggS'):  # OGG
-                        return 'audio'
-            except Exception as e:
-                logger.debug(f"Header inspection failed for {file_path}: {e}")
-                
-        return 'unknown'
+            if file_size < 1024:  # Less than 1KB
+                return 'too_small', mime_type
+            # Check for common image/video/audio headers
+            header = header[:16]
+            if header.startswith(b'\xff\xd8\xff'):  # JPEG
+                return 'image', 'image/jpeg'
+            elif header.startswith(b'\x89PNG'):  # PNG
+                return 'image', 'image/png'
+            elif header.startswith(b'RIFF') and b'WEBP' in header:  # WebP
+                return 'image', 'image/webp'
+            elif b'ftyp' in header:  # More flexible MP4 detection - look for "ftyp" box
+                return 'video', 'video/mp4'
+            elif header.startswith(b'\x1a\x45\xdf\xa3'):  # Matroska/WebM
+                return 'video', 'video/webm'
+            elif header.startswith(b'\xff\xfb') or header.startswith(b'\xff\xf3') or header.startswith(b'\xff\xf2'):  # MP3
+                return 'audio', 'audio/mpeg'
+            elif header.startswith(b'RIFF') and b'WAVE' in header:  # WAV
+                return 'audio', 'audio/wav'
+            elif header.startswith(b'OggS'):  # OGG
+                return 'audio', 'audio/ogg'
 
-    def extract_exif_timestamp(self, file_path: Path) -> Optional[int]:
-        """Extract timestamp from EXIF data if available"""
+        return 'unknown', mime_type
+
+    def _exif_timestamp_from_bytes(self, data: bytes, file_path: Path) -> Optional[int]:
+        """Extract timestamp (ms) from EXIF data in an in-memory image"""
         try:
-            # Only try EXIF extraction for image files
-            file_type = self.identify_file_type(file_path)
-            if file_type != 'image':
-                return None
-            
-            # Try to extract EXIF timestamp using PIL
             from PIL import Image
             from PIL.ExifTags import TAGS
-            from datetime import datetime
-            
-            with Image.open(file_path) as img:
+
+            with Image.open(io.BytesIO(data)) as img:
                 exif_data = img._getexif()
                 if exif_data:
                     for tag_id, value in exif_data.items():
@@ -114,123 +140,168 @@ class MediaScanner:
                                 continue
         except Exception as e:
             logger.debug(f"Could not extract EXIF timestamp from {file_path}: {e}")
-        
+
         return None
 
+    def identify_file_type(self, file_path: Path) -> Optional[str]:
+        """Identify file type using python-magic or fallback"""
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(READ_CHUNK_SIZE)
+            return self._classify(file_path, header, file_path.stat().st_size)[0]
+        except Exception as e:
+            logger.debug(f"Header inspection failed for {file_path}: {e}")
+            return 'unknown'
+
+    def extract_exif_timestamp(self, file_path: Path) -> Optional[int]:
+        """Extract timestamp from EXIF data if available"""
+        fingerprint = self.fingerprint_file(file_path)
+        return fingerprint['exif_timestamp'] if fingerprint else None
+
     def get_mime_type(self, file_path: Path) -> str:
         """Get MIME type for a file"""
-        if MAGIC_AVAILABLE:
-            try:
-                return magic.from_file(str(file_path), mime=True)
-            except Exception:
-                pass
-        
-        # Fallback based on extension
-        ext = file_path.suffix.lower()
-        mime_map = {
-            # Images
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.webp': 'image/webp',
-            '.gif': 'image/gif',
-            '.bmp': 'image/bmp',
-            '.tiff': 'image/tiff',
-            # Videos
-            '.mp4': 'video/mp4',
-            '.mov': 'video/quicktime',
-            '.avi': 'video/x-msvideo',
-            '.webm': 'video/webm',
-            '.mpeg': 'video/mpeg',
-            '.wmv': 'video/x-ms-wmv',
-            # Audio
-            '.mp3': 'audio/mpeg',
-            '.wav': 'audio/wav',
-            '.ogg': 'audio/ogg',
-            '.m4a': 'audio/mp4',
-            '.aac': 'audio/aac',
-            '.flac': 'audio/flac'
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(READ_CHUNK_SIZE)
+            return self._classify(file_path, header, file_path.stat().st_size)[1]
+        except Exception:
+            return EXTENSION_MIME_TYPES.get(file_path.suffix.lower(), 'application/octet-stream')
+
+    def fingerprint_file(self, file_path: Path, file_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Analyse a file in a single chunked read: sniff the type from the first chunk,
+        stream the MD5 hash, and parse EXIF from the buffered bytes of images.
+
+        Returns None if the file could not be read (nothing is cached in that case).
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if file_size is None:
+                    file_size = os.fstat(f.fileno()).st_size
+
+                file_type, mime_type = self._classify(file_path, chunk, file_size)
+                if file_type not in MEDIA_TYPES:
+                    return {'file_type': file_type, 'file_hash': None, 'mime_type': None, 'exif_timestamp': None}
+
+                # Images are kept in memory for EXIF parsing; other media is only hashed
+                md5 = hashlib.md5()
+                image_chunks = [] if file_type == 'image' else None
+                while chunk:
+                    md5.update(chunk)
+                    if image_chunks is not None:
+                        image_chunks.append(chunk)
+                    chunk = f.read(READ_CHUNK_SIZE)
+        except Exception as e:
+            logger.warning(f"Could not generate hash for {file_path}: {e}")
+            return None
+
+        return {
+            'file_type': file_type,
+            'file_hash': md5.hexdigest(),
+            'mime_type': mime_type,
+            'exif_timestamp': self._exif_timestamp_from_bytes(b''.join(image_chunks), file_path) if image_chunks else None,
         }
-        return mime_map.get(ext, 'application/octet-stream')
 
     def scan_media_files(self, data_dir: Path) -> List[Dict[str, Any]]:
         """Scan for media files in native_content_manager (where all media files are stored)"""
         media_files = []
-        
+
         # Only scan native_content_manager since that's where all the media files are
         dir_path = "files/native_content_manager"
         category = "native_cache"
         full_path = self.media_base_dir / dir_path
-        
+
+        fingerprint_cache = MediaFingerprintCache(self.fingerprint_cache_path) if self.fingerprint_cache_path else None
+
         if full_path.exists():
             logger.info(f"Fast scanning {category}: {full_path}")
-            media_files = self.scan_directory_for_media(full_path, category, data_dir)
+            try:
+                media_files = self.scan_directory_for_media(full_path, category, data_dir, fingerprint_cache)
+            finally:
+                if fingerprint_cache:
+                    fingerprint_cache.flush()
         else:
             logger.warning(f"Native content manager not found: {full_path}")
-        
+
         logger.info(f"Found {len(media_files)} media files")
         return media_files
 
-    def scan_directory_for_media(self, directory: Path, category: str, data_dir: Path) -> List[Dict[str, Any]]:
-        """Scan a single directory for media files"""
+    def scan_directory_for_media(self, directory: Path, category: str, data_dir: Path,
+                                 fingerprint_cache: Optional[MediaFingerprintCache] = None) -> List[Dict[str, Any]]:
+        """Scan a single directory for media files, reusing cached fingerprints for unchanged files"""
         media_files = []
-        
+
         if not directory.exists():
             logger.debug(f"Directory not found for {category}: {directory}")
             return media_files
-        
-        # Count total files in directory for debugging
-        total_files = sum(1 for file_path in directory.rglob('*') if file_path.is_file())
-        logger.info(f"Scanning {category}: found {total_files} files in {directory}")
-        
-        files_processed = 0
-        media_found = 0
-        
+
+        # Walk once, keeping each file's stat result
+        entries = []
         for file_path in directory.rglob('*'):
             if not file_path.is_file():
                 continue
-            
-            files_processed += 1
-            if files_processed <= 5:  # Log first few files for debugging
-                logger.debug(f"Checking file {files_processed}: {file_path.name} ({file_path.stat().st_size} bytes)")
-                
-            file_type = self.identify_file_type(file_path)
-            if file_type not in ['image', 'video', 'audio']:
+
+            # Calculate relative path from the original data_dir (for consistency)
+            try:
+                relative_path = str(file_path.relative_to(data_dir))
+            except ValueError:
+                # Fallback if path is not relative to data_dir
+                relative_path = str(file_path.relative_to(self.media_base_dir))
+
+            entries.append((file_path, relative_path, file_path.stat()))
+
+        logger.info(f"Scanning {category}: found {len(entries)} files in {directory}")
+
+        # Reuse cached fingerprints; analyse new or changed files on a bounded thread pool
+        fingerprints = [
+            fingerprint_cache.get(relative_path, stat.st_size, stat.st_mtime_ns) if fingerprint_cache else None
+            for _, relative_path, stat in entries
+        ]
+        to_analyse = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is None]
+
+        if to_analyse:
+            logger.info(f"Analysing {len(to_analyse)} new or changed files with {self.workers} workers")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(
+                    lambda i: self.fingerprint_file(entries[i][0], entries[i][2].st_size),
+                    to_analyse
+                )
+                for i, fingerprint in zip(to_analyse, results):
+                    fingerprints[i] = fingerprint
+                    if fingerprint is not None and fingerprint_cache:
+                        _, relative_path, stat = entries[i]
+                        fingerprint_cache.put(relative_path, stat.st_size, stat.st_mtime_ns, fingerprint)
+
+        media_found = 0
+
+        for files_processed, ((file_path, relative_path, stat), fingerprint) in enumerate(zip(entries, fingerprints), 1):
+            if fingerprint is None:
+                continue
+
+            file_type = fingerprint['file_type']
+            if file_type not in MEDIA_TYPES:
                 if files_processed <= 5:  # Log first few rejections
                     logger.debug(f"Rejected {file_path.name}: type='{file_type}' (not image/video/audio)")
                 continue
-            
+
             media_found += 1
-            
-            # Generate file hash
-            try:
-                file_hash = hashlib.md5(file_path.read_bytes()).hexdigest()
-            except Exception as e:
-                logger.warning(f"Could not generate hash for {file_path}: {e}")
-                continue
-            
-            # Try to extract timestamp from EXIF
-            exif_timestamp = self.extract_exif_timestamp(file_path)
+
+            # Prefer the EXIF timestamp, falling back to file modification time
+            exif_timestamp = fingerprint['exif_timestamp']
             timestamp_source = 'exif' if exif_timestamp else 'file'
-            timestamp = exif_timestamp if exif_timestamp else int(file_path.stat().st_mtime * 1000)
-            
+            timestamp = exif_timestamp if exif_timestamp else int(stat.st_mtime * 1000)
+
             # Extract cache key from filename
             cache_key = file_path.name.split('_')[0] if '_' in file_path.name else file_path.name
-            
-            # Calculate relative path from the original data_dir (for consistency)
-            try:
-                relative_path = str(file_path.relative_to(data_dir))
-            except ValueError:
-                # Fallback if path is not relative to data_dir
-                relative_path = str(file_path.relative_to(self.media_base_dir))
-            
+
             media_data = {
                 'file_path': relative_path,
                 'original_filename': file_path.name,  # Use correct field name for MediaAsset model
-                'file_hash': file_hash,
-                'file_size': file_path.stat().st_size,
+                'file_hash': fingerprint['file_hash'],
+                'file_size': stat.st_size,
                 'file_type': file_type,
-                'mime_type': self.get_mime_type(file_path),
+                'mime_type': fingerprint['mime_type'],
                 'category': category,
                 'cache_key': cache_key,
                 'cache_id': None,  # Will be set during message linking
@@ -238,8 +309,8 @@ class MediaScanner:
                 'file_timestamp': datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc),
                 'timestamp_source': timestamp_source
             }
-            
+
             media_files.append(media_data)
-        
-        logger.info(f"Completed scanning {category}: {files_processed} files processed, {media_found} media files found")
+
+        logger.info(f"Completed scanning {category}: {len(entries)} files processed, {media_found} media files found")
         return media_files
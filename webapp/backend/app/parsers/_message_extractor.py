@@ -4,35 +4,83 @@ Handles extracting and parsing messages from the arroyo database.
 """
 
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Set, Tuple
 
-from ..utils.db_utils import WALConsolidator
+from ._source_context import SourceContext
 from ._protobuf_parser import ProtobufParser
 
 logger = logging.getLogger(__name__)
 
+# (text, cache_id, parsing_successful) for one message_content blob
+DecodedContent = Tuple[Optional[str], Optional[str], bool]
+
+# Smallest number of rows per task handed to a decode worker (smaller tasks cost more in IPC than they save)
+DECODE_MIN_BATCH_SIZE = 50
+
+# Per-process parser used by decode pool workers
+_worker_parser: Optional[ProtobufParser] = None
+
+
+def _init_decode_worker() -> None:
+    """Process pool initializer: load the protobuf schema once per worker"""
+    global _worker_parser
+    _worker_parser = ProtobufParser()
+
+
+def _decode_content(parser: ProtobufParser, content_type: int, message_content: Optional[bytes]) -> DecodedContent:
+    """Decode one message_content blob into compact (text, cache_id, success) results"""
+    if message_content is None or len(message_content) == 0:
+        return None, None, False
+    
+    # Parse protobuf content using schema-based parsing
+    text_message, cache_id, parsed_success = parser.parse_message(message_content, content_type)
+    
+    # Apply emoji encoding to text messages
+    if text_message:
+        text_message = parser.encode_chat_message(text_message)
+    
+    return text_message, cache_id, parsed_success
+
+
+def _decode_batch(batch: List[Tuple[int, Optional[bytes]]]) -> List[DecodedContent]:
+    """Decode a batch of (content_type, message_content) tuples in a pool worker"""
+    parser = _worker_parser or ProtobufParser()
+    return [_decode_content(parser, content_type, message_content) for content_type, message_content in batch]
+
+
 class MessageExtractor:
     """
     Component responsible for extracting messages from the arroyo database.
     """
     
-    def __init__(self, db_dir: Path, friends_data: Dict[str, Dict[str, str]] = None):
+    def __init__(self, db_dir: Path, friends_data: Dict[str, Dict[str, str]] = None, decode_workers: int = 0,
+                 context: Optional[SourceContext] = None):
+        """
+        Args:
+            db_dir: Directory containing arroyo.db
+            friends_data: Friend info keyed by user id, used to annotate senders
+            decode_workers: Number of worker processes for protobuf decoding.
+                0 or 1 decodes in-process.
+            context: Run-scoped source context (shared connections and protobuf decoder)
+        """
         self.db_dir = db_dir
+        self.context = context or SourceContext(db_dir)
         self.friends_data = friends_data or {}
-        self.protobuf_parser = ProtobufParser()
+        self.decode_workers = decode_workers
+        self.protobuf_parser = self.context.protobuf_parser
+        # Decoded media rows from collect_cache_ids, reused (and dropped) by iter_message_chunks
+        self._decoded_media: Dict[Tuple[str, Any], DecodedContent] = {}
     
     def get_message_count(self) -> int:
         """Get count of messages without full extraction - fast operation for change detection"""
-        arroyo_db_path = self.db_dir / "arroyo.db"
-        
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(arroyo_db_path))
+            conn = self.context.arroyo()
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM conversation_message")
             count = cursor.fetchone()[0]
-            conn.close()
             return count
         except Exception as e:
             logger.error(f"Error counting messages: {e}")
@@ -40,120 +88,238 @@ class MessageExtractor:
     
     def get_latest_message_timestamp(self) -> int:
         """Get the latest message timestamp - very fast indexed query for change detection"""
-        arroyo_db_path = self.db_dir / "arroyo.db"
-        
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(arroyo_db_path))
+            conn = self.context.arroyo()
             cursor = conn.cursor()
             cursor.execute("SELECT MAX(creation_timestamp) FROM conversation_message")
             result = cursor.fetchone()[0]
-            conn.close()
             return result if result is not None else 0
         except Exception as e:
             logger.error(f"Error getting latest message timestamp: {e}")
             return -1  # Return -1 to indicate error, forcing full processing
     
-    def extract_messages(self) -> List[Dict[str, Any]]:
-        """Extract and parse messages from arroyo.db"""
-        arroyo_db_path = self.db_dir / "arroyo.db"
-        messages = []
-        
+    def get_latest_read_timestamp(self) -> Optional[int]:
+        """Get the latest read timestamp - watermark for read-state changes on older messages"""
         try:
-            conn = WALConsolidator.connect_with_wal_support(str(arroyo_db_path))
-            
-            query = """
-                SELECT 
-                    client_conversation_id,
-                    server_message_id,
-                    message_content,
-                    creation_timestamp,
-                    read_timestamp,
-                    content_type,
-                    sender_id
-                FROM conversation_message
-                ORDER BY client_conversation_id, creation_timestamp
-            """
-            
+            conn = self.context.arroyo()
             cursor = conn.cursor()
-            processed_count = 0
-            
+            cursor.execute("SELECT MAX(read_timestamp) FROM conversation_message")
+            result = cursor.fetchone()[0]
+            return result if result is not None else 0
+        except Exception as e:
+            logger.error(f"Error getting latest read timestamp: {e}")
+            return None
+    
+    def _build_message_query(self, since_timestamp: Optional[int] = None, content_types: Optional[Tuple[int, ...]] = None) -> Tuple[str, tuple]:
+        """Build the conversation_message SELECT, optionally limited to a watermark and content types"""
+        conditions = []
+        params = []
+        if since_timestamp is not None:
+            conditions.append("creation_timestamp >= ?")
+            params.append(since_timestamp)
+        if content_types:
+            conditions.append(f"content_type IN ({', '.join('?' for _ in content_types)})")
+            params.extend(content_types)
+        
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT 
+                client_conversation_id,
+                server_message_id,
+                message_content,
+                creation_timestamp,
+                read_timestamp,
+                content_type,
+                sender_id
+            FROM conversation_message
+            {where_clause}
+            ORDER BY client_conversation_id, creation_timestamp
+        """
+        return query, tuple(params)
+    
+    def _open_decode_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Start the decode process pool, or return None to decode in-process"""
+        if self.decode_workers <= 1:
+            return None
+        try:
+            pool = ProcessPoolExecutor(max_workers=self.decode_workers, initializer=_init_decode_worker)
+            logger.info(f"Decoding message content with {self.decode_workers} worker processes")
+            return pool
+        except Exception as e:
+            logger.warning(f"Could not start decode process pool, decoding in-process: {e}")
+            return None
+    
+    def _decode_rows(self, rows: List[tuple], pool: Optional[ProcessPoolExecutor]) -> List[DecodedContent]:
+        """Decode message_content for a list of rows, preserving row order"""
+        contents = [(row[5], row[2]) for row in rows]
+        if pool is None:
+            return [_decode_content(self.protobuf_parser, content_type, message_content) for content_type, message_content in contents]
+        
+        # One task per worker, so every worker is busy whatever the chunk size
+        batch_size = max(DECODE_MIN_BATCH_SIZE, -(-len(contents) // self.decode_workers))
+        batches = [contents[i:i + batch_size] for i in range(0, len(contents), batch_size)]
+        decoded = []
+        # map() yields results in submission order, so output order is deterministic
+        for batch_result in pool.map(_decode_batch, batches):
+            decoded.extend(batch_result)
+        return decoded
+    
+    def _decode_rows_reusing(self, rows: List[tuple], pool: Optional[ProcessPoolExecutor]) -> List[DecodedContent]:
+        """_decode_rows, taking rows already decoded by collect_cache_ids from the memo instead"""
+        if not self._decoded_media:
+            return self._decode_rows(rows, pool)
+        decoded: List[Optional[DecodedContent]] = [self._decoded_media.pop((row[0], row[1]), None) for row in rows]
+        missing = [index for index, row_decoded in enumerate(decoded) if row_decoded is None]
+        for index, row_decoded in zip(missing, self._decode_rows([rows[index] for index in missing], pool)):
+            decoded[index] = row_decoded
+        return decoded
+    
+    def _build_message_data(self, row: tuple, decoded: DecodedContent) -> Dict[str, Any]:
+        """Build a message dict from a conversation_message row and its decoded content"""
+        (client_conv_id, server_msg_id, message_content, 
+         creation_ts, read_ts, content_type, sender_id) = row
+        text_message, cache_id, parsed_success = decoded
+        
+        # Get friend info
+        friend_info = self.friends_data.get(sender_id, {})
+        
+        # Convert timestamps to ISO format
+        creation_time = None
+        read_time = None
+        if creation_ts:
+            try:
+                creation_time = datetime.fromtimestamp(creation_ts / 1000, tz=timezone.utc).isoformat()
+            except:
+                pass
+        if read_ts:
+            try:
+                read_time = datetime.fromtimestamp(read_ts / 1000, tz=timezone.utc).isoformat()
+            except:
+                pass
+        
+        return {
+            'conversation_id': client_conv_id,
+            'server_message_id': server_msg_id,
+            'content_type': content_type,
+            'sender_id': sender_id,
+            'username': friend_info.get('username', ''),
+            'display_name': friend_info.get('display_name', ''),
+            'bitmoji_avatar_id': friend_info.get('bitmoji_avatar_id', ''),
+            'bitmoji_selfie_id': friend_info.get('bitmoji_selfie_id', ''),
+            'creation_timestamp': creation_time,
+            'creation_timestamp_ms': creation_ts,  # Keep original for sorting
+            'read_timestamp': read_time,
+            'read_timestamp_ms': read_ts,
+            'text': text_message,
+            'cache_id': cache_id,
+            'parsing_successful': parsed_success,
+            'raw_message_content': message_content.hex() if message_content else None
+        }
+    
+    def iter_message_chunks(self, since_timestamp: Optional[int] = None, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream parsed messages from arroyo.db in chunks of at most chunk_size.
+
+        Rows are fetched with fetchmany, so only one chunk of rows and decoded dicts is
+        held at a time. Errors propagate to the caller.
+
+        Args:
+            since_timestamp: Optional watermark (milliseconds). When set, only rows with
+                creation_timestamp >= since_timestamp are read and decoded (incremental mode).
+                Rows at the watermark itself are re-read because the writer dedupes on
+                (conversation_id, creation_timestamp).
+            chunk_size: Maximum number of messages per yielded chunk
+        """
+        query, params = self._build_message_query(since_timestamp)
+        
+        processed_count = 0
+        successfully_parsed = 0
+        text_messages = 0
+        media_messages = 0
+        
+        if since_timestamp is not None:
+            logger.info(f"Processing messages at or after watermark {since_timestamp} (incremental)...")
+        else:
             logger.info("Processing messages with schema-based parsing...")
+        
+        conn = self.context.arroyo()
+        pool = self._open_decode_pool()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
             
-            for row in cursor.execute(query):
-                (client_conv_id, server_msg_id, message_content, 
-                 creation_ts, read_ts, content_type, sender_id) = row
-                
-                processed_count += 1
-                
-                # Skip if message_content is None or empty
-                if message_content is None or len(message_content) == 0:
-                    text_message = None
-                    cache_id = None
-                    parsed_success = False
-                else:
-                    # Parse protobuf content using schema-based parsing
-                    text_message, cache_id, parsed_success = self.protobuf_parser.parse_message(message_content, content_type)
-                
-                # Apply emoji encoding to text messages
-                if text_message:
-                    text_message = self.protobuf_parser.encode_chat_message(text_message)
-                
-                # Get friend info
-                friend_info = self.friends_data.get(sender_id, {})
-                
-                # Convert timestamps to ISO format
-                creation_time = None
-                read_time = None
-                if creation_ts:
-                    try:
-                        creation_time = datetime.fromtimestamp(creation_ts / 1000, tz=timezone.utc).isoformat()
-                    except:
-                        pass
-                if read_ts:
-                    try:
-                        read_time = datetime.fromtimestamp(read_ts / 1000, tz=timezone.utc).isoformat()
-                    except:
-                        pass
-                
-                message_data = {
-                    'conversation_id': client_conv_id,
-                    'server_message_id': server_msg_id,
-                    'content_type': content_type,
-                    'sender_id': sender_id,
-                    'username': friend_info.get('username', ''),
-                    'display_name': friend_info.get('display_name', ''),
-                    'bitmoji_avatar_id': friend_info.get('bitmoji_avatar_id', ''),
-                    'bitmoji_selfie_id': friend_info.get('bitmoji_selfie_id', ''),
-                    'creation_timestamp': creation_time,
-                    'creation_timestamp_ms': creation_ts,  # Keep original for sorting
-                    'read_timestamp': read_time,
-                    'read_timestamp_ms': read_ts,
-                    'text': text_message,
-                    'cache_id': cache_id,
-                    'parsing_successful': parsed_success,
-                    'raw_message_content': message_content.hex() if message_content else None
-                }
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
                 
-                messages.append(message_data)
+                decoded = self._decode_rows_reusing(rows, pool)
+                chunk = [self._build_message_data(row, row_decoded) for row, row_decoded in zip(rows, decoded)]
+                processed_count += len(chunk)
+                successfully_parsed += sum(1 for m in chunk if m['parsing_successful'])
+                text_messages += sum(1 for m in chunk if m['text'])
+                media_messages += sum(1 for m in chunk if m['cache_id'])
                 
-                # Log progress every 100 messages
-                if processed_count % 100 == 0:
-                    logger.info(f"Processed {processed_count} messages...")
-            
-            conn.close()
-            
-            # Calculate success stats
-            successfully_parsed = sum(1 for m in messages if m['parsing_successful'])
-            text_messages = sum(1 for m in messages if m['text'])
-            media_messages = sum(1 for m in messages if m['cache_id'])
-            
-            logger.info(f"=== Message Extraction Summary ===")
-            logger.info(f"Total messages processed: {len(messages)}")
-            logger.info(f"Successfully parsed: {successfully_parsed} ({successfully_parsed/len(messages)*100:.1f}%)")
-            logger.info(f"Text messages extracted: {text_messages}")
-            logger.info(f"Media messages extracted: {media_messages}")
-            
+                logger.info(f"Processed {processed_count} messages...")
+                yield chunk
+        finally:
+            self._decoded_media.clear()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        
+        logger.info(f"=== Message Extraction Summary ===")
+        logger.info(f"Total messages processed: {processed_count}")
+        if processed_count:
+            logger.info(f"Successfully parsed: {successfully_parsed} ({successfully_parsed/processed_count*100:.1f}%)")
+        logger.info(f"Text messages extracted: {text_messages}")
+        logger.info(f"Media messages extracted: {media_messages}")
+    
+    def extract_messages(self, since_timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Extract and parse messages from arroyo.db
+
+        Args:
+            since_timestamp: Optional watermark (milliseconds), see iter_message_chunks
+        """
+        messages = []
+        
+        try:
+            for chunk in self.iter_message_chunks(since_timestamp=since_timestamp):
+                messages.extend(chunk)
         except Exception as e:
             logger.error(f"Error extracting messages: {e}")
         
         return messages
+    
+    def collect_cache_ids(self, since_timestamp: Optional[int] = None) -> Set[str]:
+        """
+        Collect the media cache IDs referenced by messages without keeping the messages.
+        Only media-bearing content types (0, 2, 4) are decoded. The compact decode results
+        are kept so the following iter_message_chunks pass does not decode those rows again.
+        """
+        query, params = self._build_message_query(since_timestamp, content_types=(0, 2, 4))
+        cache_ids = set()
+        self._decoded_media.clear()
+        
+        pool = None
+        try:
+            conn = self.context.arroyo()
+            pool = self._open_decode_pool()
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row, row_decoded in zip(rows, self._decode_rows(rows, pool)):
+                    self._decoded_media[(row[0], row[1])] = row_decoded
+                    if row_decoded[1]:
+                        cache_ids.add(row_decoded[1])
+            logger.info(f"Collected {len(cache_ids)} cache IDs from media messages")
+        except Exception as e:
+            logger.error(f"Error collecting cache IDs: {e}")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        
+        return cache_ids
@@ -0,0 +1,67 @@
+"""
+Run-scoped source context for Snapchat parsing.
+Owns the read-only source database handles and the protobuf decoder shared by all parser components.
+"""
+
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from ..utils.db_utils import SourceDatabaseSet
+from ._protobuf_parser import ProtobufParser
+
+logger = logging.getLogger(__name__)
+
+class SourceContext:
+    """
+    Shared state for one parsing run.
+
+    Database connections are opened lazily, once per run (see SourceDatabaseSet), so
+    sqlite3's per-connection statement cache keeps repeated queries prepared for the
+    rest of the run. The protobuf decoder is imported and constructed once.
+    """
+
+    def __init__(self, db_dir: Path, snapshot_dir: Optional[str] = None, immutable: bool = False):
+        self.db_dir = Path(db_dir)
+        self.source_dbs = SourceDatabaseSet(snapshot_dir, immutable=immutable)
+        self._protobuf_parser: Optional[ProtobufParser] = None
+
+    @property
+    def arroyo_db_path(self) -> Path:
+        return self.db_dir / "arroyo.db"
+
+    @property
+    def main_db_path(self) -> Path:
+        return self.db_dir / "main.db"
+
+    @property
+    def cache_controller_db_path(self) -> Path:
+        cache_db_path = self.db_dir / "native_content_manager" / "cache_controller.db"
+        if not cache_db_path.exists() and (self.db_dir / "cache_controller.db").exists():
+            # Flat layout used by pre-extracted (local mode) databases
+            cache_db_path = self.db_dir / "cache_controller.db"
+        return cache_db_path
+
+    def arroyo(self) -> sqlite3.Connection:
+        """Shared connection to arroyo.db (messages and conversations)"""
+        return self.source_dbs.connect(self.arroyo_db_path)
+
+    def main(self) -> sqlite3.Connection:
+        """Shared connection to main.db (friends)"""
+        return self.source_dbs.connect(self.main_db_path)
+
+    def cache_controller(self) -> sqlite3.Connection:
+        """Shared connection to cache_controller.db (cache file claims)"""
+        return self.source_dbs.connect(self.cache_controller_db_path)
+
+    @property
+    def protobuf_parser(self) -> ProtobufParser:
+        """Protobuf decoder, loaded on first use"""
+        if self._protobuf_parser is None:
+            self._protobuf_parser = ProtobufParser()
+        return self._protobuf_parser
+
+    def close(self) -> None:
+        """Release database handles and any WAL snapshots"""
+        self.source_dbs.close()
@@ -8,13 +8,14 @@ Emits normalized Message and MediaAsset objects.
 import os
 import logging
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Set
 
 from ._friends_loader import FriendsLoader
 from ._message_extractor import MessageExtractor
 from ._media_scanner import MediaScanner
 from ._data_linker import DataLinker
 from ._conversation_parser import ConversationParser
+from ._source_context import SourceContext
 
 # Fix for protobuf compatibility
 os.environ['PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION'] = 'python'
@@ -40,16 +41,35 @@ class SnapchatUnifiedParser:
     Parses Snapchat databases to emit normalized Message and MediaAsset objects.
     """
     
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, decode_workers: int = 0, fingerprint_cache_path: Optional[str] = None,
+                 media_scan_workers: int = 4, db_dir: Optional[str] = None, snapshot_dir: Optional[str] = None,
+                 private_copy: bool = False):
+        """
+        Args:
+            data_dir: Extraction directory (SSH layout or flat database directory)
+            decode_workers: Worker processes for protobuf message decoding (0/1 = in-process)
+            fingerprint_cache_path: Persistent media fingerprint cache file (None = analyse every file)
+            media_scan_workers: Threads used to analyse new media files
+            db_dir: Read databases from this directory in place instead of from data_dir
+            snapshot_dir: Where WAL snapshots of source databases are written (default: private temp dir)
+            private_copy: The databases in data_dir are a private copy nothing else writes to
+                (e.g. pulled over SSH), so they can be opened immutable; never applies to db_dir
+        """
         if not DEPENDENCIES_AVAILABLE:
             raise ImportError("Required dependencies not available: pandas, filetype, protobuf, numpy")
         
         self.data_dir = Path(data_dir)
+        self.decode_workers = decode_workers
         
         # Check if databases are in snapchat subdirectory (from SSH extraction)
         snapchat_db_dir = self.data_dir / "com.snapchat.android" / "databases"
         snapchat_app_dir = self.data_dir / "com.snapchat.android"
-        if snapchat_db_dir.exists():
+        if db_dir:
+            self.db_dir = Path(db_dir)
+            self.media_base_dir = snapchat_app_dir if snapchat_app_dir.exists() else self.data_dir
+            logger.info(f"Using source database directory in place: {self.db_dir}")
+            logger.info(f"Using media base directory: {self.media_base_dir}")
+        elif snapchat_db_dir.exists():
             self.db_dir = snapchat_db_dir
             self.media_base_dir = snapchat_app_dir  # Use snapchat app dir for media scanning
             logger.info(f"Using Snapchat database directory: {self.db_dir}")
@@ -60,11 +80,20 @@ class SnapchatUnifiedParser:
             logger.info(f"Using root database directory: {self.db_dir}")
             logger.info(f"Using root media base directory: {self.media_base_dir}")
         
+        # Run-scoped source context: one read-only connection per database and one protobuf
+        # decoder, shared by all components for this run
+        self.context = SourceContext(self.db_dir, snapshot_dir, immutable=private_copy and not db_dir)
+        
         # Initialize components
-        self.friends_loader = FriendsLoader(self.db_dir)
-        self.media_scanner = MediaScanner(self.media_base_dir)
-        self.data_linker = DataLinker(self.db_dir)
-        self.conversation_parser = ConversationParser(self.db_dir)
+        self.friends_loader = FriendsLoader(self.db_dir, self.context)
+        self.media_scanner = MediaScanner(
+            self.media_base_dir,
+            fingerprint_cache_path=Path(fingerprint_cache_path) if fingerprint_cache_path else None,
+            workers=media_scan_workers
+        )
+        self.message_extractor = MessageExtractor(self.db_dir, decode_workers=decode_workers, context=self.context)
+        self.data_linker = DataLinker(self.db_dir, self.context)
+        self.conversation_parser = ConversationParser(self.db_dir, self.context)
         
         # State tracking
         self.friends_data = {}
@@ -75,24 +104,37 @@ class SnapchatUnifiedParser:
     def load_friends_data(self) -> Dict[str, Dict[str, str]]:
         """Extract friends/user data from main.db using FriendsLoader component"""
         self.friends_data = self.friends_loader.load_friends_data()
+        self.message_extractor.friends_data = self.friends_data
         return self.friends_data
 
     def get_source_message_count(self) -> int:
         """Get count of messages without full extraction - fast operation for change detection"""
-        message_extractor = MessageExtractor(self.db_dir)
-        return message_extractor.get_message_count()
+        return self.message_extractor.get_message_count()
 
     def get_latest_source_timestamp(self) -> int:
         """Get the latest message timestamp - very fast indexed query for change detection"""
-        message_extractor = MessageExtractor(self.db_dir)
-        return message_extractor.get_latest_message_timestamp()
+        return self.message_extractor.get_latest_message_timestamp()
+
+    def get_latest_source_read_timestamp(self) -> Optional[int]:
+        """Get the latest message read timestamp (None on error)"""
+        return self.message_extractor.get_latest_read_timestamp()
 
-    def extract_messages(self) -> List[Dict[str, Any]]:
-        """Extract and parse messages from arroyo.db using MessageExtractor component"""
-        message_extractor = MessageExtractor(self.db_dir, self.friends_data)
-        self.extracted_messages = message_extractor.extract_messages()
+    def extract_messages(self, since_timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Extract and parse messages from arroyo.db using MessageExtractor component.
+        Pass since_timestamp to only decode rows at or after that watermark."""
+        self.extracted_messages = self.message_extractor.extract_messages(since_timestamp=since_timestamp)
         return self.extracted_messages
 
+    def collect_message_cache_ids(self, since_timestamp: Optional[int] = None) -> Set[str]:
+        """Collect cache IDs referenced by media messages without materializing all messages"""
+        return self.message_extractor.collect_cache_ids(since_timestamp=since_timestamp)
+
+    def iter_linked_message_chunks(self, since_timestamp: Optional[int] = None, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Stream unified (media-linked) messages in bounded chunks.
+        Call scan_media_files() first; messages are not kept on the parser."""
+        message_chunks = self.message_extractor.iter_message_chunks(since_timestamp=since_timestamp, chunk_size=chunk_size)
+        return self.data_linker.iter_linked_chunks(message_chunks, self.extracted_media)
+
     def scan_media_files(self) -> List[Dict[str, Any]]:
         """Scan for media files using MediaScanner component"""
         self.extracted_media = self.media_scanner.scan_media_files(self.data_dir)
@@ -103,9 +145,12 @@ class SnapchatUnifiedParser:
         self.extracted_conversations = self.conversation_parser.parse_conversations()
         return self.extracted_conversations
 
-    def link_media_to_messages(self) -> List[Dict[str, Any]]:
-        """Link media files to messages using DataLinker component"""
-        return self.data_linker.link_media_to_messages(self.extracted_messages, self.extracted_media)
+    def link_media_to_messages(self, messages: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Link media files to messages using DataLinker component.
+        Links the extracted messages unless a subset of them is given."""
+        if messages is None:
+            messages = self.extracted_messages
+        return self.data_linker.link_media_to_messages(messages, self.extracted_media)
 
     def parse(self) -> List[Dict[str, Any]]:
         """
@@ -141,6 +186,10 @@ class SnapchatUnifiedParser:
         
         return unified_messages
 
+    def close(self) -> None:
+        """Release the run's source context (database connections and any WAL snapshots)"""
+        self.context.close()
+
     def get_all_media_assets(self) -> List[Dict[str, Any]]:
         """Get all media assets (both linked and unlinked)"""
         return self.extracted_media.copy()
@@ -164,4 +213,7 @@ def parse_snapchat_data(data_dir: str) -> List[Dict[str, Any]]:
         List of unified message objects with optional media assets
     """
     parser = SnapchatUnifiedParser(data_dir)
-    return parser.parse()
+    try:
+        return parser.parse()
+    finally:
+        parser.close()
@@ -149,6 +149,9 @@ class DataProcessorService:
             logger.info(f"Processing {len(messages)} messages")
             processed_media_cache_ids = set()  # Track media already processed via messages
             new_messages_data = []  # Track newly created messages for notifications
+            use_bulk_upsert = self.storage.supports_bulk_message_upsert()
+            pending_messages = []  # (db_message_data, msg_data) pairs for the bulk upsert
+            written_keys = []  # (conversation_id, creation_timestamp) of every message written
 
             for msg_data in messages:
                 try:
@@ -185,6 +188,11 @@ class DataProcessorService:
                             logger.error(error_msg)
                             results["errors"].append(error_msg)
 
+                    written_keys.append((db_message_data["conversation_id"], db_message_data["creation_timestamp"]))
+                    if use_bulk_upsert:
+                        pending_messages.append((db_message_data, msg_data))
+                        continue
+
                     message, is_new = self.storage.create_message(db_message_data)
                     results["messages_processed"] += 1
 
@@ -197,6 +205,17 @@ class DataProcessorService:
                     logger.error(error_msg)
                     results["errors"].append(error_msg)
 
+            # Write all messages in one set-based upsert (unique index on conversation_id + creation_timestamp)
+            if pending_messages:
+                errors_before = len(results["errors"])
+                new_keys = self.storage.bulk_upsert_messages([db_data for db_data, _ in pending_messages], results["errors"])
+                results["messages_processed"] += len(pending_messages) - (len(results["errors"]) - errors_before)
+                for db_data, msg_data in pending_messages:
+                    key = (db_data["conversation_id"], db_data["creation_timestamp"])
+                    if key in new_keys:
+                        new_keys.discard(key)  # Only the first occurrence of a key is new
+                        new_messages_data.append(msg_data)
+
             # Process any standalone media assets (not linked to messages)
             standalone_media_count = 0
             for media_data in media_assets:
@@ -226,6 +245,17 @@ class DataProcessorService:
                 self.db.rollback()
                 results["errors"].append(f"Failed to commit data: {e}")
 
+            # Keep the conversation list summaries and activity rollups in step with the messages just written
+            if unique_conversations:
+                try:
+                    self.storage.refresh_conversation_summaries(list(unique_conversations))
+                    self.storage.refresh_activity_rollups(written_keys)
+                    self.db.commit()
+                except Exception as e:
+                    logger.error(f"Failed to refresh conversation aggregates: {e}")
+                    self.db.rollback()
+                    results["errors"].append(f"Failed to refresh conversation aggregates: {e}")
+
             # Build index of newly copied media by cache_id and cache_key for quick lookup
             newly_copied_cache_ids = set()
             newly_copied_cache_keys = set()
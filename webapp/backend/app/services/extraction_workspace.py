@@ -0,0 +1,222 @@
+"""
+Extraction Workspace - Persistent per-device working directory for ingestion runs
+
+Instead of a fresh temporary directory per cycle, each device gets a directory under
+the data directory that is reused by every run:
+
+    <workspace_path>/<device>/
+        extraction/   pulled databases (overwritten by the next pull) and the media staging area
+        snapshots/    WAL snapshots of the source databases (rebuilt every run)
+        run.json      marker of the run in progress (left behind only by a crash)
+        .lock         held (flock) for the duration of a run
+
+A run holds an exclusive lock, so two runs for the same device never share the
+directory. Database files stay in place between runs; only WAL/SHM/journal files and
+links to the replicas are removed, since they must never pair with a newer pull. After
+a successful run the staged media that was copied to permanent storage (recorded in
+the stored-media list) is pruned; the rest stays, together with its transfer journal
+entries, so later runs don't transfer it again. After a failed run everything is kept
+so the next transfer resumes from the completed batches. If a run crashed (run.json
+still present), everything that may be half-written is removed before the next run
+starts.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Union
+
+from ..config import get_settings
+from ..utils.transfer_batches import TransferJournal, local_media_paths
+
+# Optional imports - file locking is POSIX only
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+RUN_MARKER_NAME = "run.json"
+LOCK_FILE_NAME = ".lock"
+STORED_MEDIA_FILE_NAME = ".stored_media"
+
+# Database companions that belong to one specific pull of the database next to them
+DATABASE_COMPANION_SUFFIXES = ("-wal", "-shm", "-journal")
+
+# Media staging locations inside extraction/ (tar stream layout and parser layout)
+MEDIA_STAGING_DIRS = (
+    Path("data"),
+    Path("com.snapchat.android") / "files",
+)
+DATABASE_DIR = Path("com.snapchat.android") / "databases"
+
+
+class WorkspaceLockedError(RuntimeError):
+    """Another run is using the device's workspace"""
+
+
+class ExtractionWorkspace:
+    """
+    Persistent, locked working directory of one device.
+
+    Used as a context manager that yields the workspace directory path (the same shape
+    as tempfile.TemporaryDirectory, with extraction/ and snapshots/ inside it).
+    """
+
+    def __init__(self, root: Union[str, Path], device_id: str):
+        self.path = Path(root) / re.sub(r'[^A-Za-z0-9_.@-]', '_', device_id)
+        self.extract_dir = self.path / "extraction"
+        self.snapshot_dir = self.path / "snapshots"
+        self._marker_path = self.path / RUN_MARKER_NAME
+        self._lock_file = None
+
+    def __enter__(self) -> str:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._acquire_lock()
+        try:
+            if self._marker_path.exists():
+                self._recover_interrupted_run()
+            self._prepare_run()
+        except Exception:
+            self._release_lock()
+            raise
+        return str(self.path)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self.prune_media_staging()
+            else:
+                logger.info(f"📁 Keeping staged media in {self.extract_dir} so the next run can resume")
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self._marker_path.unlink(missing_ok=True)
+        finally:
+            self._release_lock()
+
+    def _acquire_lock(self) -> None:
+        self._lock_file = open(self.path / LOCK_FILE_NAME, 'a+')
+        if not FCNTL_AVAILABLE:
+            logger.warning("File locking unavailable - concurrent runs for one device are not prevented")
+            return
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise WorkspaceLockedError(f"Extraction workspace {self.path} is in use by another run")
+
+    def _release_lock(self) -> None:
+        if self._lock_file is None:
+            return
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _prepare_run(self) -> None:
+        """Reset per-run state and mark the run as in progress"""
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        self.snapshot_dir.mkdir(parents=True)
+        self.extract_dir.mkdir(parents=True, exist_ok=True)
+
+        # Databases are overwritten by the new pull, but stale companions (an old -wal next to
+        # a newer database) and links to the replicas (a pull must not write into them) go first
+        db_dir = self.extract_dir / DATABASE_DIR
+        if db_dir.is_dir():
+            for entry in db_dir.iterdir():
+                if entry.is_dir() and not entry.is_symlink():
+                    shutil.rmtree(entry, ignore_errors=True)
+                elif entry.name.endswith(DATABASE_COMPANION_SUFFIXES) or entry.is_symlink() or entry.lstat().st_nlink > 1:
+                    entry.unlink(missing_ok=True)
+
+        tmp_path = self._marker_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as marker_file:
+            json.dump({'pid': os.getpid(), 'started_at': datetime.utcnow().isoformat()}, marker_file)
+        os.replace(tmp_path, self._marker_path)
+
+    def _recover_interrupted_run(self) -> None:
+        """Remove whatever an interrupted run may have left half-written"""
+        try:
+            with open(self._marker_path) as marker_file:
+                marker = json.load(marker_file)
+        except (OSError, ValueError):
+            marker = {}
+        logger.warning(f"⚠️ Previous run in {self.path} did not finish (started {marker.get('started_at', 'unknown')}) - cleaning up")
+
+        (self.extract_dir / STORED_MEDIA_FILE_NAME).unlink(missing_ok=True)
+
+        # Media files not covered by a completed transfer batch may be truncated
+        keep = set()
+        for remote_path, size in TransferJournal(str(self.extract_dir)).completed_files().items():
+            for candidate in local_media_paths(str(self.extract_dir), remote_path):
+                if candidate.exists() and candidate.stat().st_size == size:
+                    keep.add(candidate)
+        removed = 0
+        for staging_dir in MEDIA_STAGING_DIRS:
+            for root, _, filenames in os.walk(self.extract_dir / staging_dir):
+                for filename in filenames:
+                    file_path = Path(root) / filename
+                    if file_path not in keep:
+                        file_path.unlink(missing_ok=True)
+                        removed += 1
+        logger.info(f"🧹 Recovered workspace: kept {len(keep)} fully transferred media files, removed {removed} partial files")
+
+    def prune_media_staging(self) -> None:
+        """Remove staged media that was copied to permanent storage, and its transfer journal entries"""
+        stored_list = self.extract_dir / STORED_MEDIA_FILE_NAME
+        removed = 0
+        try:
+            with open(stored_list) as stored_file:
+                for line in stored_file:
+                    relative_path = line.strip()
+                    if relative_path and not Path(relative_path).is_absolute() and '..' not in Path(relative_path).parts:
+                        file_path = self.extract_dir / relative_path
+                        if file_path.is_file():
+                            file_path.unlink()
+                            removed += 1
+        except OSError:
+            pass
+        stored_list.unlink(missing_ok=True)
+
+        # Keep journal entries only for files that are still staged
+        journal = TransferJournal(str(self.extract_dir))
+        staged = {
+            remote_path: size for remote_path, size in journal.completed_files().items()
+            if any(candidate.is_file() and candidate.stat().st_size == size
+                   for candidate in local_media_paths(str(self.extract_dir), remote_path))
+        }
+        journal.rewrite(staged)
+        logger.info(f"🧹 Pruned {removed} stored media files from {self.extract_dir}, {len(staged)} staged files kept")
+
+
+def record_stored_media(extract_dir: str, relative_paths: List[str]) -> None:
+    """
+    Note staged media files (relative to extract_dir) that are now in permanent storage,
+    so the workspace can prune them after a successful run
+    """
+    if not relative_paths:
+        return
+    with open(Path(extract_dir) / STORED_MEDIA_FILE_NAME, 'a') as stored_file:
+        stored_file.writelines(f"{relative_path}\n" for relative_path in relative_paths)
+
+
+def open_extraction_workspace(device_id: str, root: Optional[str] = None):
+    """
+    Working directory context for an ingestion run.
+
+    Returns the device's persistent ExtractionWorkspace under workspace_path, or a
+    tempfile.TemporaryDirectory when persistent workspaces are disabled. Both yield the
+    directory path when entered.
+    """
+    root = root if root is not None else get_settings().workspace_path
+    if not root:
+        return tempfile.TemporaryDirectory()
+    return ExtractionWorkspace(root, device_id)
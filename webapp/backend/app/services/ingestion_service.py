@@ -10,10 +10,10 @@ import asyncio
 import logging
 import os
 import shutil
-import tempfile
-from datetime import datetime
+from contextlib import ExitStack
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 
@@ -21,7 +21,9 @@ from ..config import get_settings
 from ..parsers.snapchat_unified import SnapchatUnifiedParser
 from ..services.ssh_pull import SSHPullService
 from ..services.storage import StorageService
+from ..utils.phase_timer import PhaseTimer
 from .data_processor import DataProcessorService
+from .extraction_workspace import open_extraction_workspace, record_stored_media
 from .local_extractor import LocalExtractor
 
 logger = logging.getLogger(__name__)
@@ -72,44 +74,102 @@ class IngestionService:
                 timeout=config.get('timeout', 300)
             )
             
-            # Create temporary directory for extraction
-            with tempfile.TemporaryDirectory() as temp_dir:
-                extract_dir = os.path.join(temp_dir, "extraction")
+            # Persistent per-device workspace (parser connections are released before it is cleaned up)
+            device_id = f"{config.get('ssh_user', 'root')}@{config['ssh_host']}:{config.get('ssh_port', 22)}"
+            with open_extraction_workspace(device_id) as workspace_dir, ExitStack() as cleanup:
+                extract_dir = os.path.join(workspace_dir, "extraction")
                 os.makedirs(extract_dir, exist_ok=True)
-                logger.info(f"📁 Created extraction directory: {extract_dir}")
+                logger.info(f"📁 Using extraction directory: {extract_dir}")
                 
-                # Step 1: Extract databases
-                logger.info(f"📥 Starting database extraction...")
-                db_result = await ssh_service.extract_databases(extract_dir)
-                logger.info(f"📥 Database extraction result: {db_result}")
+                # Wall-clock timing of each phase; discovery/decoding and transfer/storing overlap
+                timer = PhaseTimer()
+                loop = asyncio.get_event_loop()
+                
+                # Step 1: Extract databases - remote delta export, WAL-synced replicas or a full tar pull
+                settings = get_settings()
+                with timer.phase('database_pull'):
+                    last_timestamp = self.storage_service.get_last_source_timestamp()
+                    delta_plan, source_state = await self._try_delta_extraction(ssh_service, extract_dir, last_timestamp)
+                    db_result = None
+                    database_extraction = 'full'
+                    if delta_plan:
+                        database_extraction = 'delta'
+                        db_result = delta_plan.pop('db_result')
+                    elif settings.wal_replication:
+                        # Persistent replicas updated from WAL frames (also serves full reconcile runs)
+                        logger.info(f"📥 Starting replicated database extraction...")
+                        db_result = await ssh_service.extract_databases_replicated(extract_dir)
+                        if db_result.get('success', False):
+                            database_extraction = 'replica'
+                        else:
+                            logger.warning(f"⚠️ Replica sync failed ({db_result.get('error')}) - falling back to full database pull")
+                            db_result = None
+                    if db_result is None:
+                        logger.info(f"📥 Starting database extraction...")
+                        db_result = await ssh_service.extract_databases(extract_dir)
+                logger.info(f"📥 Database extraction result: {db_result.get('message', db_result.get('error'))}")
                 if not db_result.get('success', False):
                     error_msg = db_result.get('error', 'Database extraction failed')
                     raise Exception(f"Database extraction failed: {error_msg}")
                 
-                # Step 2: Initialize parser and get timestamp for tracking (no skip logic)
-                # Full transfer every run as configured
-                logger.info(f"🔄 Running full transfer (change detection disabled)...")
-                parser = SnapchatUnifiedParser(extract_dir)
-                current_timestamp = parser.get_latest_source_timestamp()
-                last_timestamp = self.storage_service.get_last_source_timestamp()
-                
-                logger.info(f"📊 Timestamp tracking: latest={current_timestamp}, previous={last_timestamp}")
-                logger.info(f"🔄 Proceeding with full processing (forced every cycle)")
+                # Step 2: Initialize parser and decide between incremental and full extraction
+                parser = SnapchatUnifiedParser(
+                    extract_dir,
+                    decode_workers=settings.protobuf_decode_workers,
+                    fingerprint_cache_path=settings.media_fingerprint_cache_path,
+                    media_scan_workers=settings.media_scan_workers,
+                    snapshot_dir=os.path.join(workspace_dir, "snapshots"),
+                    private_copy=True
+                )
+                cleanup.callback(parser.close)
+                if delta_plan:
+                    # The local arroyo.db only holds the exported delta, so every row in it is parsed
+                    current_timestamp = source_state['latest_timestamp']
+                    latest_read_timestamp = source_state['latest_read_timestamp']
+                    extraction_plan = delta_plan
+                    parse_since = None
+                else:
+                    current_timestamp = parser.get_latest_source_timestamp()
+                    latest_read_timestamp = parser.get_latest_source_read_timestamp()
+                    logger.info(f"📊 Timestamp tracking: latest={current_timestamp}, previous={last_timestamp}")
+                    extraction_plan = self._plan_message_extraction(current_timestamp, last_timestamp)
+                    parse_since = extraction_plan['since_timestamp']
+                logger.info(f"🔄 Message extraction mode: {extraction_plan['mode']} ({extraction_plan['reason']})")
                 
-                # Step 2.1: Now load friends data (only if we're doing full processing)
+                # Step 2.1: Now load friends data
                 logger.info(f"👥 Loading friends data...")
                 parser.load_friends_data()
                 
-                # Step 2.2: Extract messages (only if we're doing full processing)
-                logger.info(f"📨 Extracting messages...")
-                messages = parser.extract_messages()
+                # Step 2.2: Start remote media discovery (network wait) before decoding messages (CPU)
+                extract_media = config.get('extract_media', True)
+                discovery_task = None
+                if extract_media:
+                    logger.info(f"🔍 Starting remote media discovery alongside message decoding...")
+                    discovery_task = asyncio.create_task(timer.track(
+                        'media_discovery',
+                        ssh_service.discover_media(full_media_scan=extraction_plan['mode'] == 'full')
+                    ))
+                    cleanup.callback(discovery_task.cancel)
+                
+                # Step 2.3: Extract messages on a worker (only rows at/after the watermark when incremental).
+                # In streaming mode messages are read later, chunk by chunk, after media transfer.
+                messages = []
+                message_cache_ids = []
+                with timer.phase('message_decode'):
+                    if settings.streaming_ingest:
+                        logger.info(f"📨 Streaming ingest enabled - messages will be processed in chunks of {settings.ingest_chunk_size}")
+                        if extract_media:
+                            message_cache_ids = list(await loop.run_in_executor(None, parser.collect_message_cache_ids, parse_since))
+                    else:
+                        logger.info(f"📨 Extracting messages...")
+                        messages = await loop.run_in_executor(None, parser.extract_messages, parse_since)
+                        message_cache_ids = [msg.get('cache_id') for msg in messages if msg.get('cache_id')]
                 
-                # Step 3: Extract media with optimization if requested
+                # Step 3: Extract media with optimization if requested, storing text-only
+                # messages (which never wait for media) while the transfer runs
                 media_result = {'success': True}
-                extract_media = config.get('extract_media', True)
+                text_results = None
                 if extract_media:
-                    # Get cache IDs that are referenced by messages
-                    message_cache_ids = [msg.get('cache_id') for msg in messages if msg.get('cache_id')]
                     logger.info(f"🎯 Found {len(message_cache_ids)} cache IDs in messages")
                     
                     # Get existing media filenames to avoid re-downloading
@@ -119,24 +179,23 @@ class IngestionService:
                         sample_existing = list(existing_media_files)[:5]
                         logger.info(f"📁 Sample existing filenames: {sample_existing}")
                     
-                    logger.info(f"🖼️ Starting optimized media extraction...")
-                    media_result = await ssh_service.extract_media_optimized(
-                        output_dir=extract_dir,
-                        message_cache_ids=message_cache_ids,
-                        existing_media_filenames=existing_media_files
-                    )
+                    discovery_result = await discovery_task
+                    media_task = asyncio.create_task(timer.track('media_transfer', self._extract_media(
+                        ssh_service, extract_dir, message_cache_ids, existing_media_files, extraction_plan, discovery_result
+                    )))
+                    cleanup.callback(media_task.cancel)
                     
-                    if not media_result.get('success', False):
-                        # Log warning but continue without media
-                        logger.warning(f"⚠️ Warning: Optimized media extraction failed: {media_result.get('error', 'Unknown error')}")
-                        logger.info(f"🔄 Falling back to legacy media extraction...")
-                        media_result = await ssh_service.extract_media(extract_dir)
-                        if not media_result.get('success', False):
-                            logger.warning(f"⚠️ Warning: Legacy media extraction also failed: {media_result.get('error', 'Unknown error')}")
-                    else:
-                        transferred_files = media_result.get('transferred_files', [])
-                        cache_files = media_result.get('cache_files', [])
-                        logger.info(f"✅ Optimized extraction: {len(transferred_files)} new media files + {len(cache_files)} cache files")
+                    if not settings.streaming_ingest:
+                        text_only_messages = [msg for msg in messages if not msg.get('cache_id')]
+                        messages = [msg for msg in messages if msg.get('cache_id')]
+                        if text_only_messages:
+                            with timer.phase('text_message_store'):
+                                logger.info(f"💬 Storing {len(text_only_messages)} text-only messages during media transfer...")
+                                text_results = await self._store_text_messages(
+                                    parser, text_only_messages, run_id, settings.ingest_chunk_size
+                                )
+                    
+                    media_result = await media_task
                 
                 # Step 4: Complete parsing by extracting conversations and linking media
                 # REUSE the already-loaded friends data and extracted messages (no re-parsing!)
@@ -149,42 +208,54 @@ class IngestionService:
                 logger.info(f"📞 Found {len(conversations)} total conversations ({len(valid_conversations)} with valid metadata)")
                 
                 # Scan for media files and link to messages
-                parser.scan_media_files()
-                unified_messages = parser.link_media_to_messages()
-                
-                # Log unified parsing summary
-                text_messages = sum(1 for m in unified_messages if m.get('text'))
-                media_messages_count = sum(1 for m in unified_messages if m.get('media_asset'))
-                logger.info(f"=== Unified Parsing Summary ===")
-                logger.info(f"Total unified messages: {len(unified_messages)}")
-                logger.info(f"Text messages: {text_messages}")
-                logger.info(f"Media messages: {media_messages_count}")
-                
-                # Extract media assets from unified results
-                media_assets = []
-                for unified_msg in unified_messages:
-                    if unified_msg.get('media_asset'):
-                        media_assets.append(unified_msg['media_asset'])
-                
-                # Use unified_messages as our messages list for processing
-                messages = unified_messages
-                
-                logger.info(f"📊 Processing results: {len(messages)} messages, {len(media_assets)} media assets")
-                
-                # Step 5: Copy media files to permanent storage BEFORE processing
-                newly_copied_media = []
-                if media_assets and extract_media:
-                    logger.info(f"📂 Copying {len(media_assets)} media files to permanent storage...")
-                    media_assets, newly_copied_media = self._copy_media_to_permanent_storage(extract_dir, media_assets, run_id)
-                    logger.info(f"📂 Successfully prepared {len(media_assets)} media files for storage")
-
-                    # Step 5.5: Update media asset file paths in messages after copying
-                    self._update_message_media_paths(messages, media_assets)
-
-                # Step 6: Process and store results
-                processor = DataProcessorService(self.db_session)
-                processor_results = processor.process_parser_results(messages, media_assets, run_id, newly_copied_media)
-                logger.info(f"📊 Processor results: {processor_results}")
+                with timer.phase('media_scan'):
+                    parser.scan_media_files()
+                if settings.streaming_ingest:
+                    # Steps 5-6 run per chunk: link, copy media, convert and store
+                    with timer.phase('message_store'):
+                        processor_results = self._process_message_stream(
+                            parser, extract_dir, parse_since, run_id, copy_media=extract_media
+                        )
+                    logger.info(f"📊 Processor results: {self._summarize_processor_results(processor_results)}")
+                else:
+                    unified_messages = parser.link_media_to_messages(messages)
+                    
+                    # Log unified parsing summary
+                    text_messages = sum(1 for m in unified_messages if m.get('text'))
+                    media_messages_count = sum(1 for m in unified_messages if m.get('media_asset'))
+                    logger.info(f"=== Unified Parsing Summary ===")
+                    logger.info(f"Total unified messages: {len(unified_messages)}")
+                    logger.info(f"Text messages: {text_messages}")
+                    logger.info(f"Media messages: {media_messages_count}")
+                    
+                    # Extract media assets from unified results
+                    media_assets = []
+                    for unified_msg in unified_messages:
+                        if unified_msg.get('media_asset'):
+                            media_assets.append(unified_msg['media_asset'])
+                    
+                    # Use unified_messages as our messages list for processing
+                    messages = unified_messages
+                    
+                    logger.info(f"📊 Processing results: {len(messages)} messages, {len(media_assets)} media assets")
+                    
+                    with timer.phase('message_store'):
+                        # Step 5: Copy media files to permanent storage BEFORE processing
+                        newly_copied_media = []
+                        if media_assets and extract_media:
+                            logger.info(f"📂 Copying {len(media_assets)} media files to permanent storage...")
+                            media_assets, newly_copied_media = self._copy_media_to_permanent_storage(extract_dir, media_assets, run_id)
+                            logger.info(f"📂 Successfully prepared {len(media_assets)} media files for storage")
+                            
+                            # Step 5.5: Update media asset file paths in messages after copying
+                            self._update_message_media_paths(messages, media_assets)
+                        
+                        # Step 6: Process and store results
+                        processor = DataProcessorService(self.db_session)
+                        processor_results = processor.process_parser_results(messages, media_assets, run_id, newly_copied_media)
+                    if text_results:
+                        processor_results = self._merge_processor_results(text_results, processor_results)
+                    logger.info(f"📊 Processor results: {processor_results}")
                 
                 # Step 6.5: Process and store conversation data (only if we have valid data)
                 if valid_conversations:
@@ -195,10 +266,8 @@ class IngestionService:
 
                 # Step 6.6: Populate DM names for individual conversations (always run after processing messages)
                 logger.info("📞 Populating DM names for individual conversations...")
-                # Create a conversation parser instance for DM population
-                from ..parsers._conversation_parser import ConversationParser
-                conversation_parser = ConversationParser(Path(extract_dir))
-                dm_results = conversation_parser.populate_dm_names(self.storage_service)
+                # Reuse the parser's conversation component (shares the run's source connections)
+                dm_results = parser.conversation_parser.populate_dm_names(self.storage_service)
                 logger.info(f"📞 DM name population results: {dm_results}")
                 
                 # Step 7: Post-ingestion linking cleanup
@@ -214,7 +283,20 @@ class IngestionService:
                     media_files_extracted=processor_results["media_assets_processed"],
                     parsing_errors=len(processor_results.get("errors", [])),
                     error_details=processor_results.get("errors", []),
-                    extraction_settings={'source_latest_timestamp': current_timestamp}
+                    extraction_settings={
+                        'source_latest_timestamp': current_timestamp,
+                        'source_latest_read_timestamp': latest_read_timestamp,
+                        'message_extraction': extraction_plan['mode'],
+                        'extraction_watermark': extraction_plan['since_timestamp'],
+                        'last_full_reconcile_at': extraction_plan['last_full_reconcile_at'],
+                        'database_extraction': database_extraction,
+                        'delta_export': db_result.get('delta_export'),
+                        'replication': db_result.get('replication'),
+                        'database_transfer': db_result.get('transfer'),
+                        'compression_benchmark': db_result.get('compression_benchmark'),
+                        'media_transfer': media_result.get('batches'),
+                        'phase_timings': timer.summary()
+                    }
                 )
                 
             self.db_session.commit()
@@ -239,6 +321,222 @@ class IngestionService:
             self.db_session.commit()
             raise
     
+    def _process_message_stream(
+        self,
+        parser: SnapchatUnifiedParser,
+        extract_dir: str,
+        since_timestamp: Optional[int],
+        run_id: int,
+        copy_media: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Link, copy, convert and store messages one chunk at a time.
+
+        Each chunk is fully written (and committed by the processor) before the next one
+        is read from arroyo.db, so peak memory is bounded by ingest_chunk_size rather
+        than by the size of the archive. Call parser.scan_media_files() first.
+
+        Returns:
+            Processor results aggregated over all chunks
+        """
+        settings = get_settings()
+        processor = DataProcessorService(self.db_session)
+        totals = {
+            "users_processed": 0,
+            "conversations_processed": 0,
+            "messages_processed": 0,
+            "media_assets_processed": 0,
+            "errors": [],
+            "warnings": [],
+        }
+        
+        chunk_count = 0
+        for chunk in parser.iter_linked_message_chunks(since_timestamp=since_timestamp, chunk_size=settings.ingest_chunk_size):
+            chunk_count += 1
+            media_assets = [msg['media_asset'] for msg in chunk if msg.get('media_asset')]
+            
+            newly_copied_media = []
+            if media_assets and copy_media:
+                media_assets, newly_copied_media = self._copy_media_to_permanent_storage(extract_dir, media_assets, run_id)
+                self._update_message_media_paths(chunk, media_assets)
+            
+            chunk_results = processor.process_parser_results(chunk, media_assets, run_id, newly_copied_media)
+            totals = self._merge_processor_results(totals, chunk_results)
+        
+        logger.info(f"📦 Streamed {chunk_count} chunks: {totals['messages_processed']} messages, {totals['media_assets_processed']} media assets")
+        return totals
+    
+    async def _extract_media(
+        self,
+        ssh_service: SSHPullService,
+        extract_dir: str,
+        message_cache_ids: List[str],
+        existing_media_files: set,
+        extraction_plan: Dict[str, Any],
+        discovery_result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Transfer the media needed by the messages, falling back to the legacy full pull"""
+        logger.info(f"🖼️ Starting optimized media extraction...")
+        media_result = await ssh_service.extract_media_optimized(
+            output_dir=extract_dir,
+            message_cache_ids=message_cache_ids,
+            existing_media_filenames=existing_media_files,
+            full_media_scan=extraction_plan['mode'] == 'full',
+            discovery_result=discovery_result
+        )
+        
+        if not media_result.get('success', False):
+            # Log warning but continue without media
+            logger.warning(f"⚠️ Warning: Optimized media extraction failed: {media_result.get('error', 'Unknown error')}")
+            logger.info(f"🔄 Falling back to legacy media extraction...")
+            media_result = await ssh_service.extract_media(extract_dir)
+            if not media_result.get('success', False):
+                logger.warning(f"⚠️ Warning: Legacy media extraction also failed: {media_result.get('error', 'Unknown error')}")
+        else:
+            transferred_files = media_result.get('transferred_files', [])
+            cache_files = media_result.get('cache_files', [])
+            logger.info(f"✅ Optimized extraction: {len(transferred_files)} new media files + {len(cache_files)} cache files")
+        return media_result
+    
+    async def _store_text_messages(
+        self,
+        parser: SnapchatUnifiedParser,
+        messages: List[Dict[str, Any]],
+        run_id: int,
+        chunk_size: int
+    ) -> Dict[str, Any]:
+        """
+        Convert and store messages that carry no media reference.
+
+        They never wait for a media file, so they are stored while media is still being
+        transferred. The writes stay on the event loop thread (the session and the
+        notification tasks belong to it), one chunk at a time, yielding to the loop
+        between chunks so the transfer keeps streaming.
+        """
+        processor = DataProcessorService(self.db_session)
+        results = {}
+        for i in range(0, len(messages), chunk_size):
+            unified_messages = parser.link_media_to_messages(messages[i:i + chunk_size])
+            results = self._merge_processor_results(
+                results, processor.process_parser_results(unified_messages, [], run_id, [])
+            )
+            await asyncio.sleep(0)
+        return results
+    
+    @staticmethod
+    def _merge_processor_results(totals: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        """Add one processor_results dictionary to another (counts summed, lists concatenated)"""
+        merged = dict(totals)
+        for key, value in results.items():
+            if isinstance(value, list):
+                merged[key] = list(merged.get(key, [])) + value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+        return merged
+    
+    @staticmethod
+    def _summarize_processor_results(results: Dict[str, Any]) -> Dict[str, Any]:
+        """Counts-only view of processor results for logging (error/warning lists can be long)"""
+        summary = {key: value for key, value in results.items() if not isinstance(value, list)}
+        summary["errors"] = len(results.get("errors", []))
+        summary["warnings"] = len(results.get("warnings", []))
+        return summary
+    
+    async def _try_delta_extraction(
+        self,
+        ssh_service: SSHPullService,
+        extract_dir: str,
+        last_timestamp: int
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, int]]]:
+        """
+        Extract databases with a remote-side delta export of arroyo.db when possible.
+
+        The delta needs sqlite3 on the device, an incremental plan (a periodic full reconcile
+        always pulls the whole database) and a read-timestamp watermark from the last run.
+
+        Returns:
+            (extraction plan with the extraction result under 'db_result', remote source
+            state), or (None, source state or None) when the full tar pull should be used
+        """
+        if not get_settings().remote_delta_export:
+            return None, None
+        
+        source_state = await ssh_service.probe_remote_source()
+        if source_state is None:
+            return None, None
+        
+        logger.info(f"📊 Timestamp tracking (device): latest={source_state['latest_timestamp']}, previous={last_timestamp}")
+        plan = self._plan_message_extraction(source_state['latest_timestamp'], last_timestamp)
+        read_since = self.storage_service.get_last_source_read_timestamp()
+        if plan['mode'] != 'incremental' or read_since is None:
+            reason = plan['reason'] if plan['mode'] != 'incremental' else "no previous read watermark"
+            logger.info(f"📥 Delta export skipped ({reason}) - pulling full databases")
+            return None, source_state
+        
+        logger.info(f"📥 Starting delta database extraction...")
+        db_result = await ssh_service.extract_databases_delta(extract_dir, plan['since_timestamp'], read_since)
+        if not db_result.get('success', False):
+            logger.warning(f"⚠️ Delta export failed ({db_result.get('error')}) - falling back to full database pull")
+            return None, source_state
+        
+        plan['db_result'] = db_result
+        return plan, source_state
+    
+    def _plan_message_extraction(self, current_timestamp: int, last_timestamp: int) -> Dict[str, Any]:
+        """
+        Decide whether this run decodes only new messages or the whole source table.
+
+        Incremental runs start at the watermark committed by the last successful run,
+        lowered to cover recent messages that are still waiting for their media. A full
+        reconcile is forced every `full_reconcile_interval_hours` so changes to older
+        rows (read timestamps, previously unparseable content) are still picked up.
+
+        Args:
+            current_timestamp: Latest creation_timestamp in the freshly extracted source
+            last_timestamp: source_latest_timestamp recorded by the last completed run
+
+        Returns:
+            Dictionary with mode ('incremental' or 'full'), since_timestamp (None for full),
+            last_full_reconcile_at (ISO string to record on the run) and a human readable reason
+        """
+        settings = get_settings()
+        now = datetime.utcnow()
+        last_full_reconcile = self.storage_service.get_last_full_reconcile_time()
+        reconcile_interval = timedelta(hours=settings.full_reconcile_interval_hours)
+        
+        full_reason = None
+        if not settings.incremental_extraction:
+            full_reason = "incremental extraction disabled"
+        elif last_timestamp <= 0:
+            full_reason = "no previous watermark"
+        elif current_timestamp < last_timestamp:
+            full_reason = "source timestamp moved backwards"
+        elif last_full_reconcile is None:
+            full_reason = "no previous full reconcile"
+        elif settings.full_reconcile_interval_hours <= 0 or now - last_full_reconcile >= reconcile_interval:
+            full_reason = "reconcile interval elapsed"
+        
+        if full_reason:
+            return {
+                'mode': 'full',
+                'since_timestamp': None,
+                'last_full_reconcile_at': now.isoformat(),
+                'reason': full_reason
+            }
+        
+        since_timestamp = last_timestamp
+        lookback_ms = settings.pending_media_lookback_hours * 3600 * 1000
+        pending_timestamp = self.storage_service.get_earliest_pending_media_timestamp(last_timestamp - lookback_ms)
+        if pending_timestamp is not None and pending_timestamp < since_timestamp:
+            since_timestamp = pending_timestamp
+        
+        return {
+            'mode': 'incremental',
+            'since_timestamp': since_timestamp,
+            'last_full_reconcile_at': last_full_reconcile.isoformat(),
+            'reason': f"watermark {since_timestamp}"
+        }
+    
     def _copy_media_to_permanent_storage(self, temp_dir: str, media_assets: List[Dict], run_id: int) -> tuple[List[Dict], List[Dict]]:
         """
         Copy media files from temporary directory to permanent storage, avoiding duplicates by filename.
@@ -263,6 +561,7 @@ class IngestionService:
 
         updated_media_assets = []
         newly_copied_media = []  # Track only new files
+        stored_sources = []  # Staged files now in permanent storage (pruned from the workspace)
         
         for media_asset in media_assets:
             temp_file_path = Path(temp_dir) / media_asset['file_path']
@@ -315,6 +614,7 @@ class IngestionService:
                 logger.debug(f"Updated original_filename from '{media_asset.get('original_filename')}' to '{updated_media_asset['original_filename']}' for existing file")
                 
                 updated_media_assets.append(updated_media_asset)
+                stored_sources.append(media_asset['file_path'])
                 continue
             
             try:
@@ -335,11 +635,13 @@ class IngestionService:
 
                 updated_media_assets.append(updated_media_asset)
                 newly_copied_media.append(updated_media_asset)  # Track as newly copied
+                stored_sources.append(media_asset['file_path'])
 
             except Exception as e:
                 logger.error(f"Failed to copy media file {temp_file_path}: {e}")
                 continue
 
+        record_stored_media(temp_dir, stored_sources)
         logger.info(f"Successfully processed {len(updated_media_assets)} media files ({len(newly_copied_media)} newly copied, {len(updated_media_assets) - len(newly_copied_media)} reused from existing storage)")
         return updated_media_assets, newly_copied_media
     
@@ -525,11 +827,13 @@ class IngestionService:
             
             # Link orphaned messages to their corresponding media assets
             links_created = 0
+            linked_keys = []
             for message in orphaned_messages:
                 if message.cache_id and message.cache_id in media_lookup:
                     try:
                         message.media_asset_id = media_lookup[message.cache_id]
                         links_created += 1
+                        linked_keys.append((message.conversation_id, message.creation_timestamp))
                         logger.debug(f"Linked message {message.id} (cache_id: {message.cache_id}) to media asset {media_lookup[message.cache_id]}")
                     except Exception as e:
                         error_msg = f"Failed to link message {message.id} with cache_id {message.cache_id}: {e}"
@@ -538,8 +842,9 @@ class IngestionService:
             
             results["links_created"] = links_created
             
-            # Commit the changes
+            # Commit the changes (media counts, previews and activity of the linked conversations change too)
             if links_created > 0:
+                self.storage_service.refresh_message_aggregates(linked_keys)
                 self.db_session.commit()
                 logger.info(f"✅ Successfully created {links_created} message-media links")
             else:
@@ -597,30 +902,38 @@ class IngestionService:
             source_info = local_extractor.get_source_info()
             logger.info(f"Local database source: {source_info}")
 
-            # Create temporary directory for working copy
-            with tempfile.TemporaryDirectory() as temp_dir:
-                extract_dir = os.path.join(temp_dir, "extraction")
+            # Persistent workspace for the working copy (parser connections are released before it is cleaned up)
+            with open_extraction_workspace("local") as workspace_dir, ExitStack() as cleanup:
+                extract_dir = os.path.join(workspace_dir, "extraction")
                 os.makedirs(extract_dir, exist_ok=True)
-                logger.info(f"Created extraction directory: {extract_dir}")
-
-                # Copy databases to temp directory
-                copy_result = local_extractor.copy_databases_to_data_dir(extract_dir)
-                if not copy_result["success"]:
-                    raise Exception(f"Failed to copy databases: {copy_result['errors']}")
+                logger.info(f"Using extraction directory: {extract_dir}")
 
-                logger.info(f"Copied databases: {copy_result['databases_copied']}")
+                # Databases are read in place through read-only connections; only media is staged
+                media_copied = local_extractor.copy_media_to_data_dir(extract_dir)
 
                 # Initialize parser
-                parser = SnapchatUnifiedParser(extract_dir)
+                parser = SnapchatUnifiedParser(
+                    extract_dir,
+                    decode_workers=settings.protobuf_decode_workers,
+                    fingerprint_cache_path=settings.media_fingerprint_cache_path,
+                    media_scan_workers=settings.media_scan_workers,
+                    db_dir=str(local_extractor.source_path),
+                    snapshot_dir=os.path.join(workspace_dir, "snapshots")
+                )
+                cleanup.callback(parser.close)
                 current_timestamp = parser.get_latest_source_timestamp()
+                last_timestamp = self.storage_service.get_last_source_timestamp()
+                extraction_plan = self._plan_message_extraction(current_timestamp, last_timestamp)
+                logger.info(f"Message extraction mode: {extraction_plan['mode']} ({extraction_plan['reason']})")
 
                 # Load friends data
                 logger.info("Loading friends data...")
                 parser.load_friends_data()
 
-                # Extract messages
-                logger.info("Extracting messages...")
-                messages = parser.extract_messages()
+                # Extract messages (deferred to the chunked pass in streaming mode)
+                if not settings.streaming_ingest:
+                    logger.info("Extracting messages...")
+                    messages = parser.extract_messages(since_timestamp=extraction_plan['since_timestamp'])
 
                 # Extract conversations
                 parser.extract_conversations()
@@ -629,39 +942,45 @@ class IngestionService:
                 logger.info(f"Found {len(conversations)} total conversations ({len(valid_conversations)} with valid metadata)")
 
                 # Scan for media files (if media was included in extraction)
-                if copy_result.get("media_copied"):
+                if media_copied:
                     parser.scan_media_files()
 
-                # Link media to messages
-                unified_messages = parser.link_media_to_messages()
-
-                # Log summary
-                text_messages = sum(1 for m in unified_messages if m.get('text'))
-                media_messages_count = sum(1 for m in unified_messages if m.get('media_asset'))
-                logger.info(f"=== Local Parsing Summary ===")
-                logger.info(f"Total unified messages: {len(unified_messages)}")
-                logger.info(f"Text messages: {text_messages}")
-                logger.info(f"Media messages: {media_messages_count}")
-
-                # Extract media assets
-                media_assets = []
-                for unified_msg in unified_messages:
-                    if unified_msg.get('media_asset'):
-                        media_assets.append(unified_msg['media_asset'])
-
-                messages = unified_messages
-                logger.info(f"Processing results: {len(messages)} messages, {len(media_assets)} media assets")
-
-                # Copy media files to permanent storage if present
-                if media_assets:
-                    logger.info(f"Copying {len(media_assets)} media files to permanent storage...")
-                    media_assets = self._copy_media_to_permanent_storage(extract_dir, media_assets, run_id)
-                    self._update_message_media_paths(messages, media_assets)
-
-                # Process and store results
-                processor = DataProcessorService(self.db_session)
-                processor_results = processor.process_parser_results(messages, media_assets, run_id)
-                logger.info(f"Processor results: {processor_results}")
+                # Link media to messages, process and store results
+                if settings.streaming_ingest:
+                    processor_results = self._process_message_stream(
+                        parser, extract_dir, extraction_plan['since_timestamp'], run_id, copy_media=True
+                    )
+                    logger.info(f"Processor results: {self._summarize_processor_results(processor_results)}")
+                else:
+                    unified_messages = parser.link_media_to_messages()
+
+                    # Log summary
+                    text_messages = sum(1 for m in unified_messages if m.get('text'))
+                    media_messages_count = sum(1 for m in unified_messages if m.get('media_asset'))
+                    logger.info(f"=== Local Parsing Summary ===")
+                    logger.info(f"Total unified messages: {len(unified_messages)}")
+                    logger.info(f"Text messages: {text_messages}")
+                    logger.info(f"Media messages: {media_messages_count}")
+
+                    # Extract media assets
+                    media_assets = []
+                    for unified_msg in unified_messages:
+                        if unified_msg.get('media_asset'):
+                            media_assets.append(unified_msg['media_asset'])
+
+                    messages = unified_messages
+                    logger.info(f"Processing results: {len(messages)} messages, {len(media_assets)} media assets")
+
+                    # Copy media files to permanent storage if present
+                    if media_assets:
+                        logger.info(f"Copying {len(media_assets)} media files to permanent storage...")
+                        media_assets, _ = self._copy_media_to_permanent_storage(extract_dir, media_assets, run_id)
+                        self._update_message_media_paths(messages, media_assets)
+
+                    # Process and store results
+                    processor = DataProcessorService(self.db_session)
+                    processor_results = processor.process_parser_results(messages, media_assets, run_id)
+                    logger.info(f"Processor results: {processor_results}")
 
                 # Process conversations
                 if valid_conversations:
@@ -670,9 +989,7 @@ class IngestionService:
 
                 # Populate DM names
                 logger.info("Populating DM names for individual conversations...")
-                from ..parsers._conversation_parser import ConversationParser
-                conversation_parser = ConversationParser(Path(extract_dir))
-                dm_results = conversation_parser.populate_dm_names(self.storage_service)
+                dm_results = parser.conversation_parser.populate_dm_names(self.storage_service)
                 logger.info(f"DM name population results: {dm_results}")
 
                 # Post-ingestion linking cleanup
@@ -690,6 +1007,10 @@ class IngestionService:
                     error_details=processor_results.get("errors", []),
                     extraction_settings={
                         'source_latest_timestamp': current_timestamp,
+                        'source_latest_read_timestamp': parser.get_latest_source_read_timestamp(),
+                        'message_extraction': extraction_plan['mode'],
+                        'extraction_watermark': extraction_plan['since_timestamp'],
+                        'last_full_reconcile_at': extraction_plan['last_full_reconcile_at'],
                         'extraction_mode': 'local',
                         'source_path': dbs_path
                     }
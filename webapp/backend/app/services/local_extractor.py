@@ -9,7 +9,7 @@ import os
 import shutil
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 from ..config import get_settings
 
@@ -126,24 +126,88 @@ class LocalExtractor:
                     results["errors"].append(f"Required database not found: {db_name}")
 
         # Copy media files if present
-        source_media = self.source_path / "media"
-        if source_media.exists() and source_media.is_dir():
-            target_media = Path(data_dir) / "com.snapchat.android" / "files"
-            try:
-                if target_media.exists():
-                    shutil.rmtree(target_media)
-                shutil.copytree(source_media, target_media)
-                results["media_copied"] = True
-                logger.info(f"Copied media directory to {target_media}")
-            except Exception as e:
-                logger.warning(f"Failed to copy media directory: {e}")
-                # Media is optional, don't fail the whole operation
+        results["media_copied"] = self.copy_media_to_data_dir(data_dir)
 
         # Determine overall success
         results["success"] = len(results["errors"]) == 0 and len(results["databases_copied"]) >= len(self.REQUIRED_DBS)
 
         return results
 
+    def copy_media_to_data_dir(self, data_dir: str) -> bool:
+        """
+        Sync the optional media directory into the layout the parser scans
+        (data_dir/com.snapchat.android/files/).
+
+        The sync is incremental: only files whose size or modification time differ
+        from the copy are copied again, and files no longer in the source are removed,
+        so re-runs over a large, mostly unchanged media directory copy little.
+
+        Databases don't need copying: the parser can read them in place
+        through read-only connections.
+
+        Args:
+            data_dir: Target data directory
+
+        Returns:
+            True if media was synced
+        """
+        source_media = self.source_path / "media"
+        if not (source_media.exists() and source_media.is_dir()):
+            return False
+
+        target_media = Path(data_dir) / "com.snapchat.android" / "files"
+        try:
+            copied, removed, unchanged = self._sync_tree(source_media, target_media)
+            logger.info(f"Synced media directory to {target_media}: {copied} copied, {removed} removed, {unchanged} unchanged")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to sync media directory: {e}")
+            # Media is optional, don't fail the whole operation
+            return False
+
+    @staticmethod
+    def _sync_tree(source: Path, target: Path) -> Tuple[int, int, int]:
+        """
+        Make target a copy of source, copying only new or changed files (by size and mtime)
+        and deleting files and directories that are not in source.
+
+        Returns:
+            Tuple of (files copied, files removed, files unchanged)
+        """
+        copied = removed = unchanged = 0
+        wanted = set()
+
+        for root, _, filenames in os.walk(source):
+            target_root = target / os.path.relpath(root, source)
+            target_root.mkdir(parents=True, exist_ok=True)
+            for filename in filenames:
+                source_file = os.path.join(root, filename)
+                target_file = target_root / filename
+                wanted.add(target_file)
+                source_stat = os.stat(source_file)
+                try:
+                    target_stat = target_file.stat()
+                    if target_stat.st_size == source_stat.st_size and target_stat.st_mtime_ns == source_stat.st_mtime_ns:
+                        unchanged += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                # copy2 keeps the mtime, so the next sync sees the file as unchanged
+                shutil.copy2(source_file, target_file)
+                copied += 1
+
+        for root, dirnames, filenames in os.walk(target, topdown=False):
+            root_path = Path(root)
+            for filename in filenames:
+                if root_path / filename not in wanted:
+                    (root_path / filename).unlink()
+                    removed += 1
+            source_dir = source / os.path.relpath(root, target)
+            if not source_dir.is_dir():
+                root_path.rmdir()
+
+        return copied, removed, unchanged
+
     def get_source_info(self) -> dict:
         """
         Get information about the source database directory.
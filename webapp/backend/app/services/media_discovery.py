@@ -9,11 +9,18 @@ import asyncio
 import os
 import json
 import logging
-import subprocess
+import shutil
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any, Set
 from datetime import datetime
 
+from ..config import get_settings
+from ..utils.cache_key_resolver import CacheKeyResolver, SubstringSet
+from ..utils.tar_stream import compressed_tar_pipeline
+from ..utils.transfer_batches import TransferJournal, local_media_paths, plan_transfer_batches
+from .media_manifest import RemoteMediaManifest, build_manifest_command, parse_manifest_output
+from .ssh_connection import SSHConnection, get_ssh_connection
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,164 +33,114 @@ class MediaDiscoveryService:
         ssh_port: int = 22,
         ssh_user: str = "root",
         ssh_key_path: Optional[str] = None,
-        timeout: int = 300
+        timeout: int = 300,
+        connection: Optional[SSHConnection] = None
     ):
         self.ssh_host = ssh_host
         self.ssh_port = ssh_port
         self.ssh_user = ssh_user
-        self.ssh_key_path = ssh_key_path
         self.timeout = timeout
         
+        # Shared (multiplexed) connection to the device, normally handed over by SSHPullService
+        self.connection = connection or get_ssh_connection(ssh_host, ssh_port, ssh_user, ssh_key_path)
+        self.ssh_key_path = self.connection.ssh_key_path
+        
         # Remote paths based on current SSH service
         self.remote_snapchat_data_path = "/data/data/com.snapchat.android/"
-        
-        # Auto-discover SSH key if not provided (same logic as SSH service)
-        if not self.ssh_key_path:
-            self.ssh_key_path = self._find_ssh_key()
-    
-    def _find_ssh_key(self) -> Optional[str]:
-        """Find SSH key in common locations"""
-        potential_keys = [
-            '/app/originalcode/id_rsa',
-            '/app/originalcode/id_ed25519', 
-            '/app/originalcode/id_ecdsa',
-            os.path.expanduser('~/.ssh/id_rsa'),
-            os.path.expanduser('~/.ssh/id_ed25519'),
-            os.path.expanduser('~/.ssh/id_ecdsa')
-        ]
-        
-        for key_path in potential_keys:
-            if os.path.exists(key_path):
-                logger.info(f"Found SSH key: {key_path}")
-                return key_path
-        
-        logger.info("No SSH key found, using default authentication")
-        return None
     
     async def _run_ssh_command(self, command: str, use_sudo: bool = True) -> Tuple[bool, str]:
-        """Execute SSH command with proper options and key handling"""
-        if use_sudo:
-            command = f"{command}"
-        
-        ssh_cmd = [
-            "ssh",
-            "-p", str(self.ssh_port),
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "ConnectTimeout=30"
-        ]
-        
-        # Add SSH key if available
-        if self.ssh_key_path:
-            ssh_cmd.extend(["-i", self.ssh_key_path])
-        
-        ssh_cmd.extend([
-            f"{self.ssh_user}@{self.ssh_host}",
-            command
-        ])
-        
-        logger.debug(f"Executing SSH command: {' '.join(ssh_cmd)}")
-        
-        try:
-            # Run in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: subprocess.run(
-                    ssh_cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=self.timeout
-                )
-            )
-            
-            if result.returncode == 0:
-                logger.debug("SSH command executed successfully")
-                return True, result.stdout
-            else:
-                logger.error(f"SSH command failed with return code {result.returncode}")
-                logger.error(f"SSH stderr: {result.stderr}")
-                return False, result.stderr
-                
-        except subprocess.TimeoutExpired:
-            logger.error("SSH command timed out")
-            return False, "Command timed out"
-        except Exception as e:
-            logger.error(f"SSH command failed: {e}")
-            return False, str(e)
+        """Execute SSH command over the shared device connection"""
+        return await self.connection.run(command, self.timeout)
     
-    async def discover_remote_media_files(self) -> Dict[str, Any]:
+    async def discover_remote_media_files(self, full_scan: bool = True) -> Dict[str, Any]:
         """
-        Discover all media files on the remote device using fast find command
+        Discover media files on the remote device, with size and mtime, in one listing command
         Only scans native_content_manager since that's where all media files are
+
+        With a media manifest configured and full_scan False, files that are unchanged since
+        the last cycle are flagged (file_info['changed'] False) so determine_needed_media_files
+        only runs its full matching on new, changed and previously held-back files. Files
+        modified within media_settle_seconds are held back as they may still be being written.
+        Call commit_media_manifest() with the result once the returned files were handled.
         """
         logger.info("Starting fast remote media file discovery...")
+        settings = get_settings()
         
         try:
             # Only scan native_content_manager since that's where all the media files are
             media_directory = "files/native_content_manager"
             full_remote_path = f"{self.remote_snapchat_data_path.rstrip('/')}/{media_directory}"
             
-            # Use simple find command since -printf doesn't work reliably on Android
-            find_cmd = f"find {full_remote_path} -type f 2>/dev/null || true"
-            
             logger.info(f"Fast discovery in: {media_directory}")
-            success, output = await self._run_ssh_command(find_cmd)
-            
-            discovered_files = {}
-            total_files = 0
-            
-            if success and output.strip():
-                dir_files = {}
-                for line in output.strip().split('\n'):
-                    if not line.strip():
-                        continue
-                    
-                    try:
-                        # Full path from find command
-                        full_file_path = line.strip()
-                        
-                        # Extract filename and relative path
-                        filename = os.path.basename(full_file_path)
-                        # Get the path relative to the base snapchat data directory, removing the prefix
-                        relative_file_path = full_file_path.replace(f"{self.remote_snapchat_data_path}/", "").lstrip("/")
-                        
-                        # Assume all files in native_content_manager are media files (as requested)
-                        # Create file metadata with minimal info since we can't get size/mtime easily
-                        file_info = {
-                            'remote_path': full_file_path,
-                            'relative_path': relative_file_path,
-                            'filename': filename,
-                            'size': 0,  # We'll assume it's a valid media file
-                            'mtime': 0,  # Not needed for our optimization
-                            'directory': media_directory,
-                            'cache_key': self._extract_cache_key(filename)
-                        }
-                        #logger.info(f"Discovered file: {file_info}")
-                        
-                        dir_files[filename] = file_info
-                        total_files += 1
-                    except Exception as e:
-                        logger.debug(f"Could not parse find output line: {line} - {e}")
-                        continue
-                
-                discovered_files[media_directory] = dir_files
-                logger.info(f"Fast discovery found {len(dir_files)} media files")
-                if dir_files:
-                    sample_discovered = list(dir_files.keys())[:5]
-                    logger.info(f"Sample discovered filenames: {sample_discovered}")
+            success, output = await self._run_ssh_command(build_manifest_command(full_remote_path))
+            if not success:
+                raise Exception(f"Remote media listing failed: {output}")
+            
+            device_now, remote_files = parse_manifest_output(output)
+            
+            # Narrow the listing down to what changed since the last cycle
+            manifest = None
+            if settings.media_manifest_path:
+                manifest = RemoteMediaManifest(Path(settings.media_manifest_path), f"{self.ssh_user}@{self.ssh_host}:{self.ssh_port}")
+            changes = manifest.diff(remote_files) if manifest else None
+            if changes:
+                logger.info(
+                    f"Manifest diff: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+                    f"{len(changes['removed'])} removed, {len(changes['pending'])} pending"
+                )
+            if changes is None or full_scan:
+                candidates = set(remote_files)
             else:
-                logger.debug(f"No files found or error in directory: {media_directory}")
-                discovered_files[media_directory] = {}
+                candidates = set(changes['added'] + changes['changed'] + changes['pending'])
+            changed_paths = set(changes['changed']) if changes else set()
+            
+            dir_files = {}
+            held_back = []
+            for full_file_path, (size, mtime) in remote_files.items():
+                # Hold back files that may still be being written (recent mtime, or a size
+                # change since the last listing when the device cannot report mtimes)
+                if mtime and device_now is not None:
+                    still_writing = device_now - mtime < settings.media_settle_seconds
+                else:
+                    still_writing = full_file_path in changed_paths
+                if still_writing:
+                    held_back.append(full_file_path)
+                    continue
+                
+                # Extract filename and relative path
+                filename = os.path.basename(full_file_path)
+                # Get the path relative to the base snapchat data directory, removing the prefix
+                relative_file_path = full_file_path.replace(f"{self.remote_snapchat_data_path}/", "").lstrip("/")
+                
+                # Assume all files in native_content_manager are media files (as requested)
+                dir_files[filename] = {
+                    'remote_path': full_file_path,
+                    'relative_path': relative_file_path,
+                    'filename': filename,
+                    'size': size,
+                    'mtime': mtime,
+                    'directory': media_directory,
+                    'cache_key': self._extract_cache_key(filename),
+                    'changed': full_file_path in candidates
+                }
+            
+            if held_back:
+                logger.info(f"Holding back {len(held_back)} recently modified media files until they settle")
+            logger.info(f"Fast discovery found {len(remote_files)} media files ({len(candidates)} new or changed)")
+            if dir_files:
+                sample_discovered = list(dir_files.keys())[:5]
+                logger.info(f"Sample discovered filenames: {sample_discovered}")
             
             logger.info(f"=== Fast Remote Media Discovery Summary ===")
-            logger.info(f"Total media files discovered: {total_files}")
+            logger.info(f"Total media files discovered: {len(remote_files)}")
             
             return {
                 'success': True,
-                'total_files': total_files,
-                'directories': discovered_files,
-                'scan_timestamp': datetime.now().isoformat()
+                'total_files': len(dir_files),
+                'changed_files': len(candidates),
+                'directories': {media_directory: dir_files},
+                'scan_timestamp': datetime.now().isoformat(),
+                'manifest_update': {'files': remote_files, 'pending': held_back} if manifest else None
             }
             
         except Exception as e:
@@ -195,6 +152,13 @@ class MediaDiscoveryService:
                 'directories': {}
             }
     
+    def commit_media_manifest(self, discovery_result: Dict[str, Any]) -> None:
+        """Persist the listing from discover_remote_media_files() once its files were handled"""
+        update = discovery_result.get('manifest_update')
+        if update:
+            manifest = RemoteMediaManifest(Path(get_settings().media_manifest_path), f"{self.ssh_user}@{self.ssh_host}:{self.ssh_port}")
+            manifest.save(update['files'], pending=update['pending'])
+    
     def _extract_cache_key(self, filename: str) -> str:
         """Extract cache key from filename (same logic as parser)"""
         if '_' in filename:
@@ -227,128 +191,26 @@ class MediaDiscoveryService:
             
             logger.info("Streaming cache mappings database...")
             
-            # Create local tar file path
-            local_tar_path = os.path.join(output_dir, "cache_mappings.tar")
-            
-            # Build SSH command to stream tar
-            ssh_cmd = [
-                "ssh",
-                "-p", str(self.ssh_port),
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "UserKnownHostsFile=/dev/null",
-                "-o", "ConnectTimeout=30"
-            ]
-            
-            if self.ssh_key_path:
-                ssh_cmd.extend(["-i", self.ssh_key_path])
-            
-            ssh_cmd.extend([
-                f"{self.ssh_user}@{self.ssh_host}",
-                f"{tar_cmd}"
-            ])
-            
             # Execute SSH tar stream
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._execute_tar_stream,
-                ssh_cmd,
-                local_tar_path
-            )
-            
-            if result['success']:
-                if os.path.exists(local_tar_path) and os.path.getsize(local_tar_path) > 0:
-                    logger.info(f"Successfully streamed cache mappings: {local_tar_path} ({os.path.getsize(local_tar_path)} bytes)")
-                    
-                    # Extract the tar file
-                    extracted_files = await self._extract_tar_file(local_tar_path, output_dir)
-                    
-                    # Clean up tar file
-                    os.remove(local_tar_path)
-                    
-                    return {
-                        'success': True,
-                        'extracted_files': extracted_files,
-                        'message': f"Successfully extracted {len(extracted_files)} cache mapping files"
-                    }
-                else:
-                    raise Exception("Cache mappings tar stream completed but local file is missing or empty")
-            else:
+            result = await self.connection.extract_tar(tar_cmd, output_dir, self.timeout, label="cache mappings tar")
+            if not result['success']:
                 raise Exception(f"Cache mappings tar stream failed: {result['error']}")
+            
+            extracted_files = result['extracted_files']
+            return {
+                'success': True,
+                'extracted_files': extracted_files,
+                'message': f"Successfully extracted {len(extracted_files)} cache mapping files"
+            }
                 
         except Exception as e:
             logger.error(f"Cache mappings extraction failed: {e}")
-            
-            # Clean up on failure
-            if 'local_tar_path' in locals() and os.path.exists(local_tar_path):
-                try:
-                    os.remove(local_tar_path)
-                except:
-                    pass
-            
             return {
                 'success': False,
                 'error': str(e),
                 'extracted_files': []
             }
     
-    def _execute_tar_stream(self, ssh_cmd: List[str], local_tar_path: str) -> Dict[str, Any]:
-        """Execute SSH tar stream command and save to local file"""
-        try:
-            with open(local_tar_path, 'wb') as local_tar_file:
-                result = subprocess.run(
-                    ssh_cmd,
-                    stdout=local_tar_file,
-                    stderr=subprocess.PIPE,
-                    timeout=self.timeout
-                )
-            
-            # Log any messages from stderr
-            if result.stderr:
-                stderr_output = result.stderr.decode()
-                logger.info(f"SSH tar stderr output: {stderr_output}")
-            
-            if result.returncode == 0:
-                return {'success': True}
-            else:
-                return {'success': False, 'error': result.stderr.decode()}
-                
-        except subprocess.TimeoutExpired:
-            return {'success': False, 'error': "SSH tar stream timed out"}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    async def _extract_tar_file(self, tar_path: str, output_dir: str) -> List[str]:
-        """Extract tar file and return list of extracted files"""
-        import tarfile
-        
-        extracted_files = []
-        
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            self._extract_tar_sync,
-            tar_path,
-            output_dir,
-            extracted_files
-        )
-        
-        return extracted_files
-    
-    def _extract_tar_sync(self, tar_path: str, output_dir: str, extracted_files: List[str]) -> None:
-        """Synchronous tar extraction"""
-        import tarfile
-        
-        with tarfile.open(tar_path, 'r') as tar:
-            tar.extractall(output_dir)
-            
-            # Track extracted files
-            for member in tar.getmembers():
-                if member.isfile():
-                    extracted_files.append(member.name)
-        
-        logger.info(f"Extracted tar file to {output_dir}")
-    
     def determine_needed_media_files(
         self, 
         discovered_files: Dict[str, Any],
@@ -365,12 +227,23 @@ class MediaDiscoveryService:
         total_needed = 0
         
         # Create lookup map for cache_id -> cache_key mappings
-        cache_id_to_key = {}
-        for cache_key, external_key in cache_mappings:
-            for cache_id in message_cache_ids:
-                if external_key and cache_id in external_key:
-                    cache_id_to_key[cache_id] = cache_key
-                    break
+        cache_id_to_key = CacheKeyResolver(cache_mappings).resolve_many(message_cache_ids)
+        referenced_cache_keys = set(cache_id_to_key.values())
+        
+        # Method 3 lookups, built once: cache keys of the other files that contain a
+        # message cache_id or are contained in one
+        candidate_keys = {
+            file_info['cache_key']
+            for dir_files in discovered_files.get('directories', {}).values()
+            for file_info in dir_files.values()
+            if file_info['cache_key'] and file_info['cache_key'] not in referenced_cache_keys
+        }
+        cache_id_set = SubstringSet(message_cache_ids)
+        partially_referenced_keys = {cache_key for cache_key in candidate_keys if cache_id_set.occurs_in(cache_key)}
+        candidate_key_set = SubstringSet(candidate_keys - partially_referenced_keys)
+        for cache_id in message_cache_ids:
+            if cache_id:
+                partially_referenced_keys.update(candidate_key_set.members_in(cache_id))
         
         logger.info(f"Found {len(cache_id_to_key)} cache ID to cache key mappings")
         logger.info(f"Message cache IDs to check: {len(message_cache_ids)}")
@@ -388,6 +261,11 @@ class MediaDiscoveryService:
             for filename, file_info in dir_files.items():
                 cache_key = file_info['cache_key']
                 
+                # Unchanged since the last cycle: those were already matched then, so only
+                # a direct reference from a new message can make them needed now
+                if not file_info.get('changed', True) and cache_key not in referenced_cache_keys and cache_key not in message_cache_ids:
+                    continue
+                
                 # Skip if we already have this file (check both full filename and cache key)
                 if filename in existing_media_filenames:
                     logger.info(f"✅ Skipping already existing file: {filename}")
@@ -401,26 +279,15 @@ class MediaDiscoveryService:
                 # Check if this file is referenced by any message
                 is_referenced = False
                 
-                # Method 1: Direct cache key match
-                if cache_key in cache_id_to_key.values():
+                # Method 1: Some message cache_id maps to this cache key
+                if cache_key in referenced_cache_keys:
                     is_referenced = True
                     logger.debug(f"Method 1: Direct cache key match for {cache_key}")
                 
-                # Method 2: Check if any message cache_id maps to this cache_key
-                if not is_referenced:
-                    for cache_id in message_cache_ids:
-                        if cache_id_to_key.get(cache_id) == cache_key:
-                            is_referenced = True
-                            logger.debug(f"Method 2: Cache ID {cache_id} maps to cache key {cache_key}")
-                            break
-                
                 # Method 3: Partial string matching (fallback)
-                if not is_referenced:
-                    for cache_id in message_cache_ids:
-                        if cache_id and cache_key and (cache_id in cache_key or cache_key in cache_id):
-                            is_referenced = True
-                            logger.debug(f"Method 3: Partial match between cache_id {cache_id} and cache_key {cache_key}")
-                            break
+                if not is_referenced and cache_key in partially_referenced_keys:
+                    is_referenced = True
+                    logger.debug(f"Method 3: Partial match between a message cache_id and cache_key {cache_key}")
                 
                 if is_referenced:
                     directory_needed.append(file_info)
@@ -439,152 +306,195 @@ class MediaDiscoveryService:
         return needed_files
     
     async def transfer_specific_media_files(
-        self, 
-        needed_files: Dict[str, List[Dict[str, Any]]], 
-        output_dir: str
+        self,
+        needed_files: Dict[str, List[Dict[str, Any]]],
+        output_dir: str,
+        codec: str = 'none'
     ) -> Dict[str, Any]:
         """
         Transfer only the specific media files that are needed
-        Uses selective tar command to transfer only required files
+        Uses selective tar commands to transfer only required files
+        
+        The files are split into size-balanced batches streamed over up to
+        media_transfer_channels concurrent SSH channels. Files that arrived completely are
+        recorded in a journal in output_dir, so a transfer into the same directory resumes
+        where an interrupted one stopped, and a failed batch is retried for its missing files only.
+        
+        Args:
+            needed_files: Files to transfer, grouped by directory
+            output_dir: Directory to extract into
+            codec: Device-side compression for the tar stream
+        
+        Returns:
+            Dictionary with success (all batches completed), transferred_files (member paths
+            of every file that arrived, also on failure), failed_files, batches and error
         """
         if not needed_files:
             logger.info("No media files need to be transferred")
             return {'success': True, 'transferred_files': [], 'message': "No files needed"}
         
         logger.info("Starting selective media file transfer...")
+        settings = get_settings()
         
         try:
             os.makedirs(output_dir, exist_ok=True)
             
             # Build list of specific files to transfer
-            files_to_transfer = []
-            for directory, dir_files in needed_files.items():
-                for file_info in dir_files:
-                    # Use remote_path which is the full absolute path on the device
-                    remote_path = file_info['remote_path']
-                    files_to_transfer.append(remote_path)
-            logger.info(f"Files to transfer: {files_to_transfer}")
-
+            files_to_transfer = [file_info for dir_files in needed_files.values() for file_info in dir_files]
             if not files_to_transfer:
                 return {'success': True, 'transferred_files': [], 'message': "No files to transfer"}
             
-            logger.info(f"Transferring {len(files_to_transfer)} specific media files...")
-            
-            # Build selective tar command - run tar from root since we're using absolute paths
-            base_dir = "/"  # Run tar from root to handle absolute paths
-            
-            # Create tar command with file list written to temporary file on Android device
-            # Write file list to /data/local/tmp (which should be writable) on Android devices
-            temp_file_list = '/data/local/tmp/snapchat_media_files.txt'
-            
-            # First, create the file list on the remote device using multiple echo commands
-            # This avoids the command line length limit issue
-            logger.info(f"Creating file list on remote device with {len(files_to_transfer)} files...")
-            
-            # Split into smaller chunks to avoid command line limits
-            chunk_size = 5  # Very small chunks to avoid command line length issues
-            file_chunks = [files_to_transfer[i:i + chunk_size] for i in range(0, len(files_to_transfer), chunk_size)]
-            
-            # Create commands to write the file list - write each file individually to avoid command line limits
-            create_file_cmds = []
-            for i, filename in enumerate(files_to_transfer):
-                # Escape single quotes in filenames by replacing ' with '\''
-                escaped_filename = filename.replace("'", "'\\''")
-                
-                if i == 0:
-                    # First file - overwrite the temp file
-                    create_file_cmds.append(f"echo '{escaped_filename}' > {temp_file_list}")
-                else:
-                    # Subsequent files - append to the temp file  
-                    create_file_cmds.append(f"echo '{escaped_filename}' >> {temp_file_list}")
-            
-            # Combine all file creation commands
-            create_all_files_cmd = ' && '.join(create_file_cmds)
-            
-            tar_cmd = f'cd {base_dir} && {create_all_files_cmd} && tar -cf - -T {temp_file_list} 2>&2 && rm {temp_file_list} || (echo "TAR_FAILED" >&2 && rm -f {temp_file_list})'
-            
-            # Create local tar file path
-            local_tar_path = os.path.join(output_dir, "selective_media.tar")
-            
-            # Build SSH command
-            ssh_cmd = [
-                "ssh",
-                "-p", str(self.ssh_port),
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "UserKnownHostsFile=/dev/null",
-                "-o", "ConnectTimeout=30"
+            # Resume: skip files of batches a previous attempt completed that are still on disk
+            journal = TransferJournal(output_dir)
+            completed = journal.completed_files()
+            resumed = [
+                f for f in files_to_transfer
+                if completed.get(f['remote_path']) == f.get('size', 0) and self._local_media_copy(output_dir, f)
             ]
+            if resumed:
+                logger.info(f"♻️ Resuming media transfer: {len(resumed)} files already transferred by an earlier attempt")
+            resumed_paths = {f['remote_path'] for f in resumed}
+            remaining = [f for f in files_to_transfer if f['remote_path'] not in resumed_paths]
+            
+            channels = max(settings.media_transfer_channels, 1)
+            batches = plan_transfer_batches(remaining, channels, settings.media_transfer_batch_mb * 1024 * 1024)
+            total_bytes = sum(f.get('size', 0) for f in remaining)
+            logger.info(
+                f"Transferring {len(remaining)} specific media files ({total_bytes / 1024 / 1024:.1f} MB) "
+                f"in {len(batches)} batches over up to {channels} channels..."
+            )
             
-            if self.ssh_key_path:
-                ssh_cmd.extend(["-i", self.ssh_key_path])
+            # Concurrent extractions would race to create the same parent directories
+            for parent in {local_media_paths(output_dir, f['remote_path'])[0].parent for f in remaining}:
+                os.makedirs(parent, exist_ok=True)
             
-            ssh_cmd.extend([
-                f"{self.ssh_user}@{self.ssh_host}",
-                f"{tar_cmd}"
+            semaphore = asyncio.Semaphore(channels)
+            batch_results = await asyncio.gather(*[
+                self._transfer_media_batch(index, len(batches), batch, output_dir, codec, journal, semaphore)
+                for index, batch in enumerate(batches)
             ])
             
-            logger.info("Executing selective media transfer...")
+            self._merge_extracted_media(output_dir)
+            
+            arrived = resumed + [f for result in batch_results for f in result['files']]
+            failed_files = [f['remote_path'] for result in batch_results for f in result['failed_files']]
+            transferred_files = [f['remote_path'].lstrip('/') for f in arrived]
+            batch_stats = {
+                'total': len(batches),
+                'completed': sum(1 for result in batch_results if result['success']),
+                'failed': sum(1 for result in batch_results if not result['success']),
+                'resumed_files': len(resumed),
+                'channels': channels
+            }
             
-            # Execute SSH command
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._execute_tar_stream,
-                ssh_cmd,
-                local_tar_path
-            )
+            if failed_files:
+                first_error = next(result['error'] for result in batch_results if not result['success'])
+                logger.warning(f"⚠️ {batch_stats['failed']} of {len(batches)} media batches failed ({len(failed_files)} files): {first_error}")
+                return {
+                    'success': False,
+                    'error': f"{batch_stats['failed']} of {len(batches)} media batches failed: {first_error}",
+                    'transferred_files': transferred_files,
+                    'failed_files': failed_files,
+                    'batches': batch_stats
+                }
             
-            if result['success']:
-                if os.path.exists(local_tar_path) and os.path.getsize(local_tar_path) > 0:
-                    logger.info(f"Successfully transferred selective media: {local_tar_path} ({os.path.getsize(local_tar_path)} bytes)")
-                    
-                    # Extract the tar file
-                    extracted_files = await self._extract_tar_file(local_tar_path, output_dir)
-                    
-                    # Debug: check what directory structure was created
-                    logger.info(f"Checking directory structure after extraction...")
-                    data_dir_path = Path(output_dir) / "data" / "data" / "com.snapchat.android"
-                    com_dir_path = Path(output_dir) / "com.snapchat.android" 
-                    
-                    if data_dir_path.exists():
-                        logger.info(f"Found extracted files in: {data_dir_path}")
-                        # Move files from data/data/com.snapchat.android to com.snapchat.android
-                        if not com_dir_path.exists():
-                            com_dir_path.mkdir(parents=True)
-                        
-                        # Move the files directory
-                        source_files = data_dir_path / "files"
-                        target_files = com_dir_path / "files"
-                        if source_files.exists() and not target_files.exists():
-                            import shutil
-                            shutil.move(str(source_files), str(target_files))
-                            logger.info(f"Moved files from {source_files} to {target_files}")
-                    
-                    # Clean up tar file
-                    os.remove(local_tar_path)
-                    
-                    return {
-                        'success': True,
-                        'transferred_files': extracted_files,
-                        'message': f"Successfully transferred {len(extracted_files)} media files"
-                    }
-                else:
-                    raise Exception("Selective media transfer completed but local file is missing or empty")
-            else:
-                raise Exception(f"Selective media transfer failed: {result['error']}")
+            return {
+                'success': True,
+                'transferred_files': transferred_files,
+                'failed_files': [],
+                'batches': batch_stats,
+                'message': f"Successfully transferred {len(transferred_files)} media files"
+            }
         
         except Exception as e:
             logger.error(f"Selective media transfer failed: {e}")
-            
-            # Clean up on failure
-            if 'local_tar_path' in locals() and os.path.exists(local_tar_path):
-                try:
-                    os.remove(local_tar_path)
-                except:
-                    pass
-            
             return {
                 'success': False,
                 'error': str(e),
                 'transferred_files': []
-            }
\ No newline at end of file
+            }
+    
+    async def _transfer_media_batch(
+        self,
+        index: int,
+        batch_count: int,
+        batch: List[Dict[str, Any]],
+        output_dir: str,
+        codec: str,
+        journal: TransferJournal,
+        semaphore: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        """Stream one batch over its own SSH channel, retrying the files that did not arrive"""
+        label = f"media batch {index + 1}/{batch_count}"
+        retries = max(get_settings().media_transfer_retries, 0)
+        missing = batch
+        error = None
+        
+        # Run tar from root since we're using absolute paths. The file list is streamed over
+        # the SSH channel's stdin (tar -T -), so there is no temp file on the device and no
+        # command line length limit however many files are in the batch.
+        tar_cmd = f'cd / && {compressed_tar_pipeline("tar -cf - -T -", codec)} || echo "TAR_FAILED" >&2'
+        
+        for attempt in range(retries + 1):
+            file_list = ''.join(f"{f['remote_path']}\n" for f in missing).encode()
+            
+            async with semaphore:
+                logger.info(f"Executing {label}: {len(missing)} files ({sum(f.get('size', 0) for f in missing) / 1024 / 1024:.1f} MB)")
+                result = await self.connection.extract_tar(tar_cmd, output_dir, self.timeout, stdin_data=file_list,
+                                                            label=label, codec=codec)
+            
+            # Whatever arrived complete is kept; only the rest is requested again
+            missing = [f for f in missing if not self._local_media_copy(output_dir, f)]
+            if not missing:
+                journal.record(batch)
+                return {'success': True, 'files': batch, 'failed_files': []}
+            
+            # tar reports unreadable files on stderr but the stream can still end cleanly
+            error = result.get('error') or f"{len(missing)} files did not arrive"
+            if attempt < retries:
+                logger.warning(f"⚠️ {label} failed ({error}), retrying {len(missing)} missing files (attempt {attempt + 2}/{retries + 1})")
+        
+        missing_paths = {f['remote_path'] for f in missing}
+        arrived = [f for f in batch if f['remote_path'] not in missing_paths]
+        if arrived:
+            journal.record(arrived)
+        return {
+            'success': False,
+            'error': error,
+            'files': arrived,
+            'failed_files': missing
+        }
+    
+    def _local_media_copy(self, output_dir: str, file_info: Dict[str, Any]) -> Optional[Path]:
+        """Local copy of a remote media file that arrived completely, if any"""
+        for candidate in local_media_paths(output_dir, file_info['remote_path']):
+            try:
+                if candidate.stat().st_size == file_info.get('size', 0):
+                    return candidate
+            except OSError:
+                continue
+        return None
+    
+    def _merge_extracted_media(self, output_dir: str) -> None:
+        """Move files extracted under data/data/com.snapchat.android into com.snapchat.android"""
+        data_dir_path = Path(output_dir) / "data" / "data" / "com.snapchat.android"
+        source_files = data_dir_path / "files"
+        target_files = Path(output_dir) / "com.snapchat.android" / "files"
+        if not source_files.exists():
+            return
+        
+        logger.info(f"Found extracted files in: {data_dir_path}")
+        if not target_files.exists():
+            target_files.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(source_files), str(target_files))
+            logger.info(f"Moved files from {source_files} to {target_files}")
+            return
+        
+        # An earlier (resumed) transfer already populated the target: merge file by file
+        for root, _, filenames in os.walk(source_files):
+            target_root = target_files / os.path.relpath(root, source_files)
+            target_root.mkdir(parents=True, exist_ok=True)
+            for filename in filenames:
+                os.replace(os.path.join(root, filename), target_root / filename)
+        shutil.rmtree(source_files, ignore_errors=True)
+        logger.info(f"Merged files from {source_files} into {target_files}")
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Remote Media Manifest - Persistent per-device listing of remote media files
+
+Remembers size and mtime of every media file seen on a device so each cycle only
+has to consider files that were added or changed since the previous cycle (plus
+files that were held back earlier), instead of re-matching the whole tree.
+"""
+
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (size, mtime) of a remote file; mtime is 0 when the device could not report it
+RemoteFileStat = Tuple[int, int]
+
+
+def build_manifest_command(remote_dir: str) -> str:
+    """
+    Remote command listing regular files under remote_dir as '<size> <mtime> <path>'.
+
+    The first line is 'NOW <device epoch seconds>'. stat -c is used where available;
+    otherwise 'ls -ln' output is emitted with an 'LS ' prefix (see parse_manifest_output).
+    """
+    return (
+        f'echo "NOW $(date +%s)"; '
+        f'if stat -c "%s %Y %n" / >/dev/null 2>&1; then '
+        f'find {remote_dir} -type f -exec stat -c "%s %Y %n" {{}} + 2>/dev/null; '
+        f'else find {remote_dir} -type f -exec ls -ln {{}} + 2>/dev/null | sed "s/^/LS /"; fi; true'
+    )
+
+
+def parse_manifest_output(output: str) -> Tuple[Optional[int], Dict[str, RemoteFileStat]]:
+    """
+    Parse build_manifest_command output.
+
+    Returns:
+        (device time in epoch seconds or None, {remote_path: (size, mtime)})
+    """
+    device_now = None
+    files: Dict[str, RemoteFileStat] = {}
+
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith("NOW "):
+            value = line[4:].strip()
+            device_now = int(value) if value.isdigit() else None
+            continue
+
+        try:
+            if line.startswith("LS "):
+                # ls -ln: mode links uid gid size <date...> /path - the path is the first absolute token
+                fields = line[3:].split()
+                path_start = line.index(" /")
+                files[line[path_start + 1:]] = (int(fields[4]), 0)
+            else:
+                size, mtime, path = line.split(" ", 2)
+                files[path] = (int(size), int(mtime))
+        except (ValueError, IndexError):
+            logger.debug(f"Could not parse manifest line: {line}")
+
+    return device_now, files
+
+
+class RemoteMediaManifest:
+    """
+    Sidecar SQLite manifest of remote media files, keyed by device and remote path.
+
+    A row is marked pending when the file was held back (e.g. still being written)
+    and must be reconsidered next cycle even if it has not changed by then. The
+    manifest is only replaced via save() once the files it covers were handled, so
+    a failed transfer leaves the previous manifest (and thus the diff) in place.
+    """
+
+    def __init__(self, manifest_path: Path, device: str):
+        self.manifest_path = Path(manifest_path)
+        self.device = device
+
+    def _connect(self) -> sqlite3.Connection:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.manifest_path), timeout=30)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS remote_media_manifest (
+                device TEXT NOT NULL,
+                remote_path TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                pending INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (device, remote_path)
+            )
+        """)
+        return conn
+
+    def load(self) -> Dict[str, Tuple[int, int, bool]]:
+        """Previous manifest as {remote_path: (size, mtime, pending)}; empty on first run or error"""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT remote_path, file_size, mtime, pending FROM remote_media_manifest WHERE device = ?",
+                    (self.device,)
+                ).fetchall()
+            finally:
+                conn.close()
+            return {row[0]: (row[1], row[2], bool(row[3])) for row in rows}
+        except Exception as e:
+            logger.warning(f"Could not load remote media manifest {self.manifest_path}: {e}")
+            return {}
+
+    def diff(self, current: Dict[str, RemoteFileStat]) -> Dict[str, List[str]]:
+        """
+        Compare a fresh listing with the stored manifest.
+
+        Returns:
+            Dictionary of path lists: added, changed (size or mtime differ), removed and
+            pending (unchanged files that were held back last cycle)
+        """
+        previous = self.load()
+        result = {'added': [], 'changed': [], 'removed': [], 'pending': []}
+
+        for path, (size, mtime) in current.items():
+            entry = previous.get(path)
+            if entry is None:
+                result['added'].append(path)
+            elif (entry[0], entry[1]) != (size, mtime):
+                result['changed'].append(path)
+            elif entry[2]:
+                result['pending'].append(path)
+
+        result['removed'] = [path for path in previous if path not in current]
+        return result
+
+    def save(self, current: Dict[str, RemoteFileStat], pending: Iterable[str] = ()) -> None:
+        """Replace the device's manifest with a fresh listing"""
+        pending = set(pending)
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM remote_media_manifest WHERE device = ?", (self.device,))
+                    conn.executemany(
+                        "INSERT INTO remote_media_manifest (device, remote_path, file_size, mtime, pending) VALUES (?, ?, ?, ?, ?)",
+                        [(self.device, path, size, mtime, int(path in pending)) for path, (size, mtime) in current.items()]
+                    )
+            finally:
+                conn.close()
+            logger.info(f"Saved remote media manifest: {len(current)} files ({len(pending)} pending)")
+        except Exception as e:
+            logger.warning(f"Could not save remote media manifest {self.manifest_path}: {e}")
@@ -0,0 +1,324 @@
+"""
+SSH Connection Manager - Multiplexed OpenSSH connections to devices
+
+Every SSH command and tar stream used to spawn its own ssh process with a full
+handshake. Here one authenticated OpenSSH ControlMaster connection per device is
+kept open (ControlPersist) and every command and stream is run as a session over
+it, within a run and across ingest cycles.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from ..utils.tar_stream import extract_tar_from_command
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_private_dir(path: str) -> bool:
+    """
+    Create path (mode 0700) if needed and check it is safe to hold control sockets:
+    a real directory (not a symlink) owned by the current user and not accessible to
+    anyone else. Anyone who can write to it could hijack the device connection.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError as e:
+        logger.warning(f"⚠️ Cannot create SSH control directory {path}: {e}")
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        logger.warning(f"⚠️ SSH control directory {path} is not a directory (or is a symlink)")
+        return False
+    if info.st_uid != os.getuid():
+        logger.warning(f"⚠️ SSH control directory {path} is owned by uid {info.st_uid}, not {os.getuid()}")
+        return False
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        logger.warning(f"⚠️ SSH control directory {path} has mode {oct(stat.S_IMODE(info.st_mode))}, expected 0o700")
+        return False
+    return True
+
+
+def find_ssh_key() -> Optional[str]:
+    """Find SSH key in common locations (data folder first, then fallback)"""
+    # Priority 1: Check data folder (where uploaded keys are stored)
+    data_folder_keys = [
+        '/app/data/ssh_keys/id_rsa',
+        '/app/data/ssh_keys/id_ed25519',
+        '/app/data/ssh_keys/id_ecdsa',
+    ]
+
+    # Priority 2: Original hardcoded locations (for backwards compatibility)
+    fallback_keys = [
+        '/app/originalcode/id_rsa',
+        '/app/originalcode/id_ed25519',
+        '/app/originalcode/id_ecdsa',
+        os.path.expanduser('~/.ssh/id_rsa'),
+        os.path.expanduser('~/.ssh/id_ed25519'),
+        os.path.expanduser('~/.ssh/id_ecdsa')
+    ]
+
+    # Check data folder first
+    for key_path in data_folder_keys:
+        if os.path.exists(key_path):
+            logger.info(f"Found SSH key in data folder: {key_path}")
+            return key_path
+
+    # Then check fallback locations
+    for key_path in fallback_keys:
+        if os.path.exists(key_path):
+            logger.info(f"Found SSH key: {key_path}")
+            return key_path
+
+    logger.info("No SSH key found, using default authentication")
+    return None
+
+
+class SSHConnection:
+    """
+    One (optionally multiplexed) SSH connection to a device.
+
+    command() builds the ssh argv for a remote command. With multiplexing enabled the
+    argv points at this connection's control socket, so it runs as a new session on
+    the already-authenticated master instead of performing its own handshake. If the
+    master is not running, ssh falls back to a direct connection, so callers never
+    depend on the master for correctness.
+    """
+
+    def __init__(
+        self,
+        ssh_host: str,
+        ssh_port: int = 22,
+        ssh_user: str = "root",
+        ssh_key_path: Optional[str] = None,
+        multiplex: bool = True,
+        control_dir: Optional[str] = None,
+        control_persist_seconds: int = 1800
+    ):
+        self.ssh_host = ssh_host
+        self.ssh_port = ssh_port
+        self.ssh_user = ssh_user
+        self.ssh_key_path = ssh_key_path
+        self.multiplex = multiplex
+        self.control_persist_seconds = control_persist_seconds
+        self._lock = threading.Lock()
+
+        self.control_path = None
+        if multiplex:
+            control_dir = control_dir or os.path.join(tempfile.gettempdir(), "snapstash-ssh")
+            if not ensure_private_dir(control_dir):
+                logger.warning("⚠️ SSH multiplexing disabled - every command opens its own connection")
+                self.multiplex = False
+        if self.multiplex:
+            # Short hashed name keeps the socket path under the unix socket length limit
+            socket_id = hashlib.sha1(f"{self.target}:{ssh_port}:{ssh_key_path}".encode()).hexdigest()[:16]
+            self.control_path = os.path.join(control_dir, socket_id)
+
+    @property
+    def target(self) -> str:
+        return f"{self.ssh_user}@{self.ssh_host}"
+
+    def _base_options(self) -> List[str]:
+        ssh_cmd = [
+            "ssh",
+            "-p", str(self.ssh_port),
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "UserKnownHostsFile=/dev/null",
+            "-o", "ConnectTimeout=30"
+        ]
+
+        # Add SSH key if available
+        if self.ssh_key_path:
+            ssh_cmd.extend(["-i", self.ssh_key_path])
+        return ssh_cmd
+
+    def command(self, remote_command: str) -> List[str]:
+        """Build the ssh invocation for a remote command"""
+        ssh_cmd = self._base_options()
+        if self.control_path:
+            ssh_cmd.extend([
+                "-o", "ControlMaster=no",
+                "-o", f"ControlPath={self.control_path}"
+            ])
+        ssh_cmd.extend([self.target, remote_command])
+        return ssh_cmd
+
+    def _control(self, operation: str) -> bool:
+        """Send a control command (check/exit) to the master"""
+        result = subprocess.run(
+            self._base_options() + ["-o", f"ControlPath={self.control_path}", "-O", operation, self.target],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=10
+        )
+        return result.returncode == 0
+
+    def ensure_master(self) -> bool:
+        """
+        Make sure the master connection is up, starting it if needed.
+
+        Returns:
+            True if commands will be multiplexed over a live master
+        """
+        if not self.control_path:
+            return False
+
+        with self._lock:
+            try:
+                if os.path.exists(self.control_path) and self._control("check"):
+                    return True
+
+                logger.info(f"🔌 Opening multiplexed SSH connection to {self.target}:{self.ssh_port}")
+                master_cmd = self._base_options() + [
+                    "-M", "-N", "-f",
+                    "-o", f"ControlPath={self.control_path}",
+                    "-o", f"ControlPersist={self.control_persist_seconds}",
+                    "-o", "ServerAliveInterval=30",
+                    self.target
+                ]
+                # The backgrounded master inherits stderr, so collect it in a file rather
+                # than a pipe that would stay open for the lifetime of the master
+                with tempfile.TemporaryFile() as stderr_file:
+                    result = subprocess.run(
+                        master_cmd,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=stderr_file,
+                        timeout=60
+                    )
+                    if result.returncode != 0:
+                        stderr_file.seek(0)
+                        stderr_output = stderr_file.read().decode(errors='replace').strip()
+                        logger.warning(f"Could not open SSH master connection, using direct connections: {stderr_output}")
+                        return False
+                return True
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.warning(f"Could not open SSH master connection, using direct connections: {e}")
+                return False
+
+    async def ensure_master_async(self) -> bool:
+        """ensure_master() without blocking the event loop"""
+        if not self.control_path:
+            return False
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.ensure_master)
+
+    async def run(self, command: str, timeout: int) -> Tuple[bool, str]:
+        """Execute a remote command and return (success, stdout or stderr)"""
+        await self.ensure_master_async()
+        ssh_cmd = self.command(command)
+
+        logger.debug(f"Executing SSH command: {' '.join(ssh_cmd)}")
+
+        try:
+            # Run in executor to avoid blocking
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                None,
+                lambda: subprocess.run(
+                    ssh_cmd,
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout
+                )
+            )
+
+            if result.returncode == 0:
+                logger.debug("SSH command executed successfully")
+                return True, result.stdout
+            else:
+                logger.error(f"SSH command failed with return code {result.returncode}")
+                logger.error(f"SSH stderr: {result.stderr}")
+                return False, result.stderr
+
+        except subprocess.TimeoutExpired:
+            logger.error("SSH command timed out")
+            return False, "Command timed out"
+        except Exception as e:
+            logger.error(f"SSH command failed: {e}")
+            return False, str(e)
+
+    async def extract_tar(
+        self,
+        remote_command: str,
+        output_dir: str,
+        timeout: int,
+        stdin_data: Optional[bytes] = None,
+        label: str = "tar stream",
+        codec: str = 'none'
+    ) -> Dict[str, Any]:
+        """
+        Run a remote tar command and extract its archive into output_dir as it arrives.
+
+        Returns:
+            The extract_tar_from_command result (success, extracted_files, wire_bytes, ...)
+        """
+        await self.ensure_master_async()
+        ssh_cmd = self.command(remote_command)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            lambda: extract_tar_from_command(ssh_cmd, output_dir, timeout, stdin_data=stdin_data, label=label, codec=codec)
+        )
+
+    def close(self) -> None:
+        """Shut the master connection down"""
+        if not self.control_path or not os.path.exists(self.control_path):
+            return
+        with self._lock:
+            try:
+                self._control("exit")
+                logger.info(f"🔌 Closed multiplexed SSH connection to {self.target}:{self.ssh_port}")
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.debug(f"Error closing SSH master connection: {e}")
+
+
+# Process-wide connections, one per device/key, reused across ingest cycles
+_connections: Dict[Tuple[str, int, str, Optional[str]], SSHConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def get_ssh_connection(
+    ssh_host: str,
+    ssh_port: int = 22,
+    ssh_user: str = "root",
+    ssh_key_path: Optional[str] = None
+) -> SSHConnection:
+    """Get the shared connection for a device, discovering the SSH key if none is given"""
+    if not ssh_key_path:
+        ssh_key_path = find_ssh_key()
+
+    key = (ssh_host, ssh_port, ssh_user, ssh_key_path)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            settings = get_settings()
+            connection = SSHConnection(
+                ssh_host,
+                ssh_port,
+                ssh_user,
+                ssh_key_path,
+                multiplex=settings.ssh_multiplexing,
+                control_dir=settings.ssh_control_dir,
+                control_persist_seconds=settings.ssh_control_persist_seconds
+            )
+            _connections[key] = connection
+        return connection
+
+
+def close_all_ssh_connections() -> None:
+    """Close every shared master connection (application shutdown)"""
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for connection in connections:
+        connection.close()
@@ -6,19 +6,41 @@ Snapchat databases and media files from Android devices via SSH.
 """
 
 import asyncio
+import io
 import os
 import logging
+import shutil
 import tempfile
-import tarfile
-import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any, Set
 from datetime import datetime
 
-from ..utils.db_utils import WALConsolidator
+from ..config import get_settings
+from ..utils.db_utils import SourceDatabaseSet
+from ..utils.sqlite_delta import (
+    SOURCE_STATE_QUERY,
+    apply_delta_from_command,
+    build_delta_export_script,
+    parse_source_state,
+)
+from .ssh_connection import SSHConnection, get_ssh_connection
+from ..utils.tar_stream import (
+    COMPRESSOR_PROBE_COMMAND,
+    AUTO_CODEC_PREFERENCE,
+    choose_codec,
+    compressed_tar_pipeline,
+    local_codecs,
+    open_decompressed_stream,
+    parse_compressor_probe,
+    stream_command_output,
+)
+from ..utils.wal_replica import WAL_HEADER_SIZE, SQLiteReplica
 
 logger = logging.getLogger(__name__)
 
+# Databases kept as WAL-replicated local copies when wal_replication is enabled
+REPLICATED_DATABASES = ("arroyo.db", "main.db")
+
 
 class SSHPullService:
     """SSH service for extracting Snapchat data using tar streams"""
@@ -29,54 +51,23 @@ class SSHPullService:
         ssh_port: int = 22,
         ssh_user: str = "root",
         ssh_key_path: Optional[str] = None,
-        timeout: int = 300
+        timeout: int = 300,
+        connection: Optional[SSHConnection] = None
     ):
         self.ssh_host = ssh_host
         self.ssh_port = ssh_port
         self.ssh_user = ssh_user
-        self.ssh_key_path = ssh_key_path
         self.timeout = timeout
         
+        # Shared (multiplexed) connection to the device; also discovers the SSH key if not provided
+        self.connection = connection or get_ssh_connection(ssh_host, ssh_port, ssh_user, ssh_key_path)
+        self.ssh_key_path = self.connection.ssh_key_path
+        
         # Remote paths based on original extractor
         self.remote_snapchat_data_path = "/data/data/com.snapchat.android/"
         
-        # Auto-discover SSH key if not provided
-        if not self.ssh_key_path:
-            self.ssh_key_path = self._find_ssh_key()
-    
-    def _find_ssh_key(self) -> Optional[str]:
-        """Find SSH key in common locations (data folder first, then fallback)"""
-        # Priority 1: Check data folder (where uploaded keys are stored)
-        data_folder_keys = [
-            '/app/data/ssh_keys/id_rsa',
-            '/app/data/ssh_keys/id_ed25519',
-            '/app/data/ssh_keys/id_ecdsa',
-        ]
-
-        # Priority 2: Original hardcoded locations (for backwards compatibility)
-        fallback_keys = [
-            '/app/originalcode/id_rsa',
-            '/app/originalcode/id_ed25519',
-            '/app/originalcode/id_ecdsa',
-            os.path.expanduser('~/.ssh/id_rsa'),
-            os.path.expanduser('~/.ssh/id_ed25519'),
-            os.path.expanduser('~/.ssh/id_ecdsa')
-        ]
-
-        # Check data folder first
-        for key_path in data_folder_keys:
-            if os.path.exists(key_path):
-                logger.info(f"Found SSH key in data folder: {key_path}")
-                return key_path
-
-        # Then check fallback locations
-        for key_path in fallback_keys:
-            if os.path.exists(key_path):
-                logger.info(f"Found SSH key: {key_path}")
-                return key_path
-
-        logger.info("No SSH key found, using default authentication")
-        return None
+        # Compressors available on the device (probed on first use)
+        self._remote_codecs: Optional[List[str]] = None
     
     async def test_connection(self) -> Tuple[bool, str]:
         """Test SSH connectivity"""
@@ -87,62 +78,67 @@ class SSHPullService:
             return False, str(e)
     
     async def _run_ssh_command(self, command: str, use_sudo: bool = False) -> Tuple[bool, str]:
-        """Execute SSH command with proper options and key handling"""
+        """Execute SSH command over the shared device connection"""
         if use_sudo:
             command = f"sudo {command}"
         
-        ssh_cmd = [
-            "ssh",
-            "-p", str(self.ssh_port),
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "ConnectTimeout=30"
-        ]
-        
-        # Add SSH key if available
-        if self.ssh_key_path:
-            ssh_cmd.extend(["-i", self.ssh_key_path])
-        
-        ssh_cmd.extend([
-            f"{self.ssh_user}@{self.ssh_host}",
-            command
-        ])
-        
-        logger.debug(f"Executing SSH command: {' '.join(ssh_cmd)}")
+        return await self.connection.run(command, self.timeout)
+    
+    def _build_ssh_cmd(self, remote_command: str) -> List[str]:
+        """Build the ssh invocation for a remote command over the shared device connection"""
+        return self.connection.command(remote_command)
+    
+    async def get_remote_codecs(self) -> List[str]:
+        """Probe (once per service instance) which compressors the device provides"""
+        if self._remote_codecs is None:
+            success, output = await self._run_ssh_command(COMPRESSOR_PROBE_COMMAND)
+            self._remote_codecs = parse_compressor_probe(output) if success else []
+            logger.info(f"Remote compressors: {self._remote_codecs or 'none'} (local decoders: {local_codecs()})")
+        return self._remote_codecs
+    
+    async def negotiate_codec(self, payload: str) -> str:
+        """Choose the tar stream compression for a payload type ('databases' or 'media')"""
+        setting = get_settings().tar_compression
+        if setting == 'none':
+            return 'none'
+        if setting == 'auto' and not AUTO_CODEC_PREFERENCE.get(payload):
+            return 'none'
+        return choose_codec(setting, payload, await self.get_remote_codecs())
+    
+    async def benchmark_codecs(self, build_tar_cmd, label: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Pull the same payload once uncompressed and once per usable codec into a scratch
+        directory, recording wire bytes versus wall time for each.
+
+        Args:
+            build_tar_cmd: Callable returning the remote tar command for a codec
+            label: Payload name used in logs
+        """
+        codecs = ['none'] + [codec for codec in await self.get_remote_codecs() if codec in local_codecs()]
+        results = {}
         
-        try:
-            # Run in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: subprocess.run(
-                    ssh_cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=self.timeout
+        for codec in codecs:
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                result = await self.connection.extract_tar(
+                    build_tar_cmd(codec), scratch_dir, self.timeout, label=f"{label} benchmark ({codec})", codec=codec
                 )
-            )
-            
-            if result.returncode == 0:
-                logger.debug("SSH command executed successfully")
-                return True, result.stdout
-            else:
-                logger.error(f"SSH command failed with return code {result.returncode}")
-                logger.error(f"SSH stderr: {result.stderr}")
-                return False, result.stderr
-                
-        except subprocess.TimeoutExpired:
-            logger.error("SSH command timed out")
-            return False, "Command timed out"
-        except Exception as e:
-            logger.error(f"SSH command failed: {e}")
-            return False, str(e)
+            results[codec] = {
+                'success': result['success'],
+                'wire_bytes': result['wire_bytes'],
+                'bytes_extracted': result['bytes_extracted'],
+                'seconds': result['seconds'],
+            }
+            logger.info(f"📏 {label} benchmark {codec}: {result['wire_bytes']} wire bytes in {result['seconds']}s")
+        
+        return results
     
-    async def extract_databases(self, output_dir: str) -> Dict[str, Any]:
+    async def extract_databases(self, output_dir: str, skip_databases: Tuple[str, ...] = ()) -> Dict[str, Any]:
         """
         Extract Snapchat databases using SSH tar stream
         
         This implements the ultra-fast single command approach from the original extractor.
+        Databases named in skip_databases (e.g. 'arroyo.db') are left out, together with
+        their WAL files, when they are provided another way (delta export, replica).
         """
         logger.info("Starting database extraction via SSH tar stream...")
         
@@ -150,7 +146,8 @@ class SSHPullService:
             logger.info("=== Starting SSH Tar Stream Database Extraction ===")
             logger.info(f"Target: {self.ssh_user}@{self.ssh_host}:{self.ssh_port}")
             logger.info(f"Output directory: {output_dir}")
-            logger.info("Using SSH tar stream for databases - single compressed transfer")
+            codec = await self.negotiate_codec('databases')
+            logger.info(f"Using SSH tar stream for databases - single transfer (compression: {codec})")
             
             # Ensure output directory exists
             os.makedirs(output_dir, exist_ok=True)
@@ -166,111 +163,287 @@ class SSHPullService:
                 "com.snapchat.android/databases/main.db-shm",
                 "com.snapchat.android/databases/native_content_manager/"
             ]
+            database_items = [
+                item for item in database_items
+                if not any(item.startswith(f"com.snapchat.android/databases/{name}") for name in skip_databases)
+            ]
             
             # Build tar command for databases
             data_path_clean = self.remote_snapchat_data_path.rstrip('/')
             base_dir = os.path.dirname(data_path_clean)  # Go up to data_ce/null/0 level
             
             tar_files_str = ' '.join(database_items)
-            tar_cmd = f'cd {base_dir} && echo \\"Starting database tar from $(pwd)\\" >&2 && tar -cf - {tar_files_str} 2>&2 || echo \\"TAR_FAILED\\" >&2'
-            
-            logger.info(f"Streaming tar archive of {len(database_items)} database files...")
-            logger.debug(f"Tar command: {tar_cmd}")
             
-            # Create local tar file path
-            local_tar_path = os.path.join(output_dir, "databases_stream.tar")
+            def build_tar_cmd(tar_codec: str) -> str:
+                tar_pipeline = compressed_tar_pipeline(f'tar -cf - {tar_files_str} 2>&2', tar_codec)
+                return f'cd {base_dir} && echo \\"Starting database tar from $(pwd)\\" >&2 && {tar_pipeline} || echo \\"TAR_FAILED\\" >&2'
             
-            # Build SSH command to stream tar
-            ssh_cmd = [
-                "ssh",
-                "-p", str(self.ssh_port),
-                "-o", "StrictHostKeyChecking=no", 
-                "-o", "UserKnownHostsFile=/dev/null",
-                "-o", "ConnectTimeout=30"
-            ]
+            tar_cmd = build_tar_cmd(codec)
             
-            # Add SSH key if available
-            if self.ssh_key_path:
-                ssh_cmd.extend(["-i", self.ssh_key_path])
+            logger.info(f"Streaming tar archive of {len(database_items)} database files...")
+            logger.debug(f"Tar command: {tar_cmd}")
             
-            ssh_cmd.extend([
-                f"{self.ssh_user}@{self.ssh_host}",
-                tar_cmd
-            ])
+            # Optionally measure every usable codec on this payload before the real transfer
+            compression_benchmark = None
+            if get_settings().compression_benchmark:
+                logger.info("📏 Running compression benchmark for database payload...")
+                compression_benchmark = await self.benchmark_codecs(build_tar_cmd, "database tar")
             
             logger.info("Executing SSH database tar stream transfer...")
             
-            # Execute SSH command and stream directly to local tar file
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._execute_tar_stream,
-                ssh_cmd,
-                local_tar_path
-            )
-            
-            if result['success']:
-                # Verify tar file exists and has content
-                if os.path.exists(local_tar_path) and os.path.getsize(local_tar_path) > 0:
-                    logger.info(f"Successfully streamed database tar: {local_tar_path} ({os.path.getsize(local_tar_path)} bytes)")
-                    
-                    # Extract the tar file
-                    extracted_files = await self._extract_tar_file(local_tar_path, output_dir)
-                    
-                    # Clean up tar file
-                    os.remove(local_tar_path)
-                    
-                    return {
-                        'success': True,
-                        'extracted_files': extracted_files,
-                        'message': f"Successfully extracted {len(extracted_files)} database files"
-                    }
-                else:
-                    raise Exception("SSH tar stream completed but local file is missing or empty")
-            else:
+            result = await self.connection.extract_tar(tar_cmd, output_dir, self.timeout, label="database tar", codec=codec)
+            if not result['success']:
                 raise Exception(f"SSH tar stream failed: {result['error']}")
+            
+            extracted_files = result['extracted_files']
+            db_result = {
+                'success': True,
+                'extracted_files': extracted_files,
+                'message': f"Successfully extracted {len(extracted_files)} database files",
+                'transfer': {
+                    'codec': codec,
+                    'wire_bytes': result.get('wire_bytes'),
+                    'bytes_extracted': result.get('bytes_extracted'),
+                    'seconds': result.get('seconds'),
+                }
+            }
+            if compression_benchmark is not None:
+                db_result['compression_benchmark'] = compression_benchmark
+            return db_result
                 
         except Exception as e:
             logger.error(f"SSH database tar stream extraction failed: {e}")
-            
-            # Clean up on failure
-            if 'local_tar_path' in locals() and os.path.exists(local_tar_path):
-                try:
-                    os.remove(local_tar_path)
-                except:
-                    pass
-            
             return {
                 'success': False,
                 'error': str(e),
                 'extracted_files': []
             }
     
+    async def probe_remote_source(self) -> Optional[Dict[str, int]]:
+        """
+        Read the latest creation/read timestamps of the device's arroyo.db with its sqlite3 CLI.
+
+        Returns:
+            Dictionary with latest_timestamp and latest_read_timestamp, or None when sqlite3
+            is not available on the device (delta export is then not possible)
+        """
+        base_dir = os.path.dirname(self.remote_snapchat_data_path.rstrip('/'))
+        command = (
+            f'command -v sqlite3 >/dev/null 2>&1 || exit 0; '
+            f'cd {base_dir} && sqlite3 -batch com.snapchat.android/databases/arroyo.db \'{SOURCE_STATE_QUERY}\''
+        )
+        success, output = await self._run_ssh_command(command)
+        source_state = parse_source_state(output) if success else None
+        if source_state is None:
+            logger.info("sqlite3 not available on the device (or arroyo.db unreadable) - delta export disabled")
+        return source_state
+    
+    async def extract_databases_delta(self, output_dir: str, since_timestamp: int, read_since_timestamp: int) -> Dict[str, Any]:
+        """
+        Extract databases with arroyo.db replaced by a remote-side delta export.
+
+        main.db and the cache controller database are pulled by the normal tar stream. The
+        device's sqlite3 exports only conversation_message rows created at/after
+        since_timestamp or read at/after read_since_timestamp (plus their conversations),
+        and the rows are replayed into a local arroyo.db at the usual path.
+        """
+        logger.info(f"Starting delta database extraction (since={since_timestamp}, read_since={read_since_timestamp})...")
+        
+        db_result = await self.extract_databases(output_dir, skip_databases=("arroyo.db",))
+        if not db_result.get('success'):
+            return db_result
+        
+        db_dir = os.path.join(output_dir, "com.snapchat.android", "databases")
+        os.makedirs(db_dir, exist_ok=True)
+        delta_db_path = os.path.join(db_dir, "arroyo.db")
+        # The delta is replayed into a new database, not into the one kept from an earlier pull
+        for stale_path in (delta_db_path, f"{delta_db_path}-wal", f"{delta_db_path}-shm", f"{delta_db_path}-journal"):
+            if os.path.lexists(stale_path):
+                os.remove(stale_path)
+        
+        base_dir = os.path.dirname(self.remote_snapchat_data_path.rstrip('/'))
+        codec = await self.negotiate_codec('databases')
+        export_cmd = compressed_tar_pipeline(f'cd {base_dir} && sqlite3 -batch -bail com.snapchat.android/databases/arroyo.db', codec)
+        ssh_cmd = self._build_ssh_cmd(export_cmd)
+        script = build_delta_export_script(since_timestamp, read_since_timestamp)
+        
+        await self.connection.ensure_master_async()
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: apply_delta_from_command(ssh_cmd, delta_db_path, self.timeout, script, codec=codec, label="arroyo delta export")
+        )
+        if not result['success']:
+            logger.error(f"Delta export failed: {result['error']}")
+            if os.path.exists(delta_db_path):
+                os.remove(delta_db_path)
+            return {'success': False, 'error': f"Delta export failed: {result['error']}", 'extracted_files': []}
+        
+        db_result['extracted_files'] = db_result['extracted_files'] + [os.path.relpath(delta_db_path, output_dir)]
+        db_result['message'] = f"Extracted {len(db_result['extracted_files'])} database files ({result['rows']} arroyo rows via delta export)"
+        db_result['delta_export'] = {
+            'rows': result['rows'],
+            'codec': codec,
+            'wire_bytes': result['wire_bytes'],
+            'seconds': result['seconds'],
+        }
+        return db_result
+    
+    def _replica_dir(self) -> str:
+        """Persistent replica directory for this device"""
+        return os.path.join(get_settings().wal_replica_path, f"{self.ssh_user}@{self.ssh_host}_{self.ssh_port}")
+    
+    async def _fetch_remote_output(self, remote_command: str, codec: str, label: str) -> Tuple[Optional[bytes], int]:
+        """Run a remote command (compressed with codec) and return its decompressed stdout and wire bytes"""
+        buffer = io.BytesIO()
+        ssh_cmd = self._build_ssh_cmd(compressed_tar_pipeline(remote_command, codec))
+        
+        await self.connection.ensure_master_async()
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: stream_command_output(
+                ssh_cmd, lambda wire: shutil.copyfileobj(open_decompressed_stream(wire, codec), buffer), self.timeout, label=label
+            )
+        )
+        if not result['success']:
+            logger.error(f"{label} failed: {result['error']}")
+            return None, result['wire_bytes']
+        return buffer.getvalue(), result['wire_bytes']
+    
+    async def sync_database_replicas(self) -> Dict[str, Any]:
+        """
+        Bring the persistent local replicas of arroyo.db and main.db up to date.
+
+        Normally only the WAL bytes appended since the last sync are transferred and their
+        committed frames applied (see SQLiteReplica). The database and WAL are copied in
+        full when there is no replica yet or the device has checkpointed and reset its WAL.
+        """
+        replica_dir = self._replica_dir()
+        remote_db_dir = f"{self.remote_snapchat_data_path.rstrip('/')}/databases"
+        remote_files = ' '.join(f"{name} {name}-wal" for name in REPLICATED_DATABASES)
+        
+        success, output = await self._run_ssh_command(f"cd {remote_db_dir} && stat -c '%n %s %Y' {remote_files} 2>/dev/null; true")
+        if not success:
+            return {'success': False, 'error': f"Could not stat remote databases: {output}"}
+        
+        remote_stats = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+                remote_stats[parts[0]] = (int(parts[1]), int(parts[2]))
+        
+        codec = await self.negotiate_codec('databases')
+        databases = {}
+        for name in REPLICATED_DATABASES:
+            if name not in remote_stats:
+                return {'success': False, 'error': f"{name} not found on device"}
+            
+            replica = SQLiteReplica(replica_dir, name)
+            db_stat = remote_stats[name]
+            previous_db_stat = (replica.state or {}).get('db_stat')
+            action = replica.plan(db_stat, remote_stats.get(f"{name}-wal", (0, 0))[0])
+            applied = None
+            wire_bytes = 0
+            
+            if action == 'incremental':
+                # Current WAL header (to detect a reset) followed by the WAL past the replicated offset
+                offset = replica.wal_read_offset
+                data, wire_bytes = await self._fetch_remote_output(
+                    f"cd {remote_db_dir} && {{ head -c {WAL_HEADER_SIZE} {name}-wal; tail -c +{offset + 1} {name}-wal; }}",
+                    codec,
+                    label=f"{name} WAL increment"
+                )
+                if data is None:
+                    return {'success': False, 'error': f"Could not read {name} WAL increment"}
+                applied = replica.apply_increment(data, db_stat)
+                if applied is None:
+                    logger.info(f"{name}: WAL was reset on the device - copying database in full")
+                    action = 'full'
+                elif applied['frames'] == 0 and list(db_stat) == previous_db_stat:
+                    # Same WAL (salts matched) with nothing new, and no checkpoint since
+                    action = 'current'
+            
+            if action == 'full':
+                with tempfile.TemporaryDirectory() as staging_dir:
+                    tar_cmd = compressed_tar_pipeline(f'tar -cf - {name} {name}-wal 2>&2', codec)
+                    result = await self.connection.extract_tar(
+                        f'cd {remote_db_dir} && {tar_cmd} || echo TAR_FAILED >&2', staging_dir, self.timeout,
+                        label=f"{name} replica copy", codec=codec
+                    )
+                    staged_db = os.path.join(staging_dir, name)
+                    if not result['success'] or not os.path.exists(staged_db):
+                        return {'success': False, 'error': f"Full copy of {name} failed: {result.get('error', 'database missing from archive')}"}
+                    wire_bytes += result.get('wire_bytes') or 0
+                    applied = replica.rebuild(staged_db, os.path.join(staging_dir, f"{name}-wal"), db_stat)
+            
+            databases[name] = {
+                'action': action,
+                'wire_bytes': wire_bytes,
+                'commits_applied': applied['commits'] if applied else 0,
+            }
+            logger.info(f"🔁 {name} replica: {action} ({wire_bytes} bytes on the wire)")
+        
+        return {'success': True, 'replica_dir': replica_dir, 'databases': databases}
+    
+    async def extract_databases_replicated(self, output_dir: str) -> Dict[str, Any]:
+        """
+        Extract databases with arroyo.db and main.db taken from the WAL-synced replicas.
+
+        The cache controller database is pulled by the normal tar stream; the replica files
+        are linked (or copied) into the usual extraction layout.
+        """
+        logger.info("Starting replicated database extraction...")
+        
+        sync_result = await self.sync_database_replicas()
+        if not sync_result['success']:
+            return {'success': False, 'error': sync_result['error'], 'extracted_files': []}
+        
+        db_result = await self.extract_databases(output_dir, skip_databases=REPLICATED_DATABASES)
+        if not db_result.get('success'):
+            return db_result
+        
+        db_dir = os.path.join(output_dir, "com.snapchat.android", "databases")
+        os.makedirs(db_dir, exist_ok=True)
+        for name in REPLICATED_DATABASES:
+            source = os.path.join(sync_result['replica_dir'], name)
+            target = os.path.join(db_dir, name)
+            if os.path.lexists(target):
+                os.remove(target)
+            try:
+                # Replicas are only rewritten by the next sync, after this run's parser is closed
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            db_result['extracted_files'].append(os.path.relpath(target, output_dir))
+        
+        db_result['message'] = f"Extracted {len(db_result['extracted_files'])} database files (arroyo.db and main.db from replicas)"
+        db_result['replication'] = sync_result['databases']
+        return db_result
+    
     async def extract_media_optimized(
         self, 
         output_dir: str, 
         message_cache_ids: Optional[List[str]] = None,
-        existing_media_filenames: Optional[Set[str]] = None
+        existing_media_filenames: Optional[Set[str]] = None,
+        full_media_scan: bool = True,
+        discovery_result: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Extract Snapchat media files using optimized workflow:
         1. Extract cache_controller.db for mappings
         2. Discover remote media files  
         3. Transfer only files linked to messages that we don't already have
+
+        With full_media_scan False, remote files unchanged since the previous cycle's media
+        manifest are only matched against direct references from the given messages.
+        Pass the result of discover_media() as discovery_result when discovery already ran
+        (e.g. concurrently with message decoding) to skip phase 2.
         """
         logger.info("Starting optimized Snapchat media extraction...")
         
         try:
-            from .media_discovery import MediaDiscoveryService
-            
-            # Initialize media discovery service
-            discovery_service = MediaDiscoveryService(
-                ssh_host=self.ssh_host,
-                ssh_port=self.ssh_port,
-                ssh_user=self.ssh_user,
-                ssh_key_path=self.ssh_key_path,
-                timeout=self.timeout
-            )
+            discovery_service = self._media_discovery_service()
             
             logger.info("=== Phase 1: Check Cache Mappings (Already Extracted) ===")
             # Cache mappings should already be extracted in the initial database extraction
@@ -292,11 +465,12 @@ class SSHPullService:
             
             logger.info("=== Phase 2: Discover Remote Media Files ===")
             # Discover all media files on remote device
-            discovery_result = await discovery_service.discover_remote_media_files()
+            if discovery_result is None:
+                discovery_result = await discovery_service.discover_remote_media_files(full_scan=full_media_scan)
             if not discovery_result['success']:
                 return discovery_result
             
-            logger.info(f"Discovered {discovery_result['total_files']} remote media files")
+            logger.info(f"Discovered {discovery_result['total_files']} remote media files ({discovery_result['changed_files']} new or changed)")
             
             # If no message cache IDs provided, we can't determine what to transfer
             if not message_cache_ids:
@@ -328,6 +502,7 @@ class SSHPullService:
             
             if total_needed == 0:
                 logger.info("No new media files need to be transferred")
+                discovery_service.commit_media_manifest(discovery_result)
                 return {
                     'success': True,
                     'extracted_files': cache_result['extracted_files'],
@@ -339,16 +514,26 @@ class SSHPullService:
             # Transfer only the files we need
             transfer_result = await discovery_service.transfer_specific_media_files(
                 needed_files=needed_files,
-                output_dir=output_dir
+                output_dir=output_dir,
+                codec=await self.negotiate_codec('media')
             )
             
-            if transfer_result['success']:
+            if transfer_result['success'] or transfer_result['transferred_files']:
+                if transfer_result['success']:
+                    discovery_service.commit_media_manifest(discovery_result)
+                else:
+                    # Keep what arrived; the manifest is left as it was so the failed files
+                    # are considered again next cycle
+                    logger.warning(f"⚠️ Partial media transfer: {transfer_result['error']}")
                 all_extracted_files = cache_result['extracted_files'] + transfer_result['transferred_files']
                 
                 return {
                     'success': True,
+                    'partial': not transfer_result['success'],
                     'extracted_files': all_extracted_files,
                     'transferred_files': transfer_result['transferred_files'],
+                    'failed_files': transfer_result.get('failed_files', []),
+                    'batches': transfer_result.get('batches'),
                     'cache_files': cache_result['extracted_files'],
                     'message': f"Optimized extraction: {len(cache_result['extracted_files'])} cache files + {len(transfer_result['transferred_files'])} media files"
                 }
@@ -363,6 +548,28 @@ class SSHPullService:
                 'extracted_files': []
             }
     
+    def _media_discovery_service(self):
+        """Media discovery service sharing this service's device connection"""
+        from .media_discovery import MediaDiscoveryService
+        
+        return MediaDiscoveryService(
+            ssh_host=self.ssh_host,
+            ssh_port=self.ssh_port,
+            ssh_user=self.ssh_user,
+            ssh_key_path=self.ssh_key_path,
+            timeout=self.timeout,
+            connection=self.connection
+        )
+    
+    async def discover_media(self, full_media_scan: bool = True) -> Dict[str, Any]:
+        """
+        List the device's media files (phase 2 of extract_media_optimized) on its own.
+
+        Only needs the network, so it can run while the pulled databases are being parsed;
+        hand the result to extract_media_optimized(discovery_result=...).
+        """
+        return await self._media_discovery_service().discover_remote_media_files(full_scan=full_media_scan)
+    
     def _load_cache_mappings_from_db(self, output_dir: str) -> List[Tuple[str, str]]:
         """Load cache mappings from extracted cache_controller.db"""
         cache_db_path = Path(output_dir) / "com.snapchat.android" / "databases" / "native_content_manager" / "cache_controller.db"
@@ -372,19 +579,16 @@ class SSHPullService:
             return []
         
         try:
-            # Use the WAL consolidator to ensure we get all data
-            WALConsolidator.consolidate_wal_database(str(cache_db_path))
-            
-            conn = WALConsolidator.connect_with_wal_support(str(cache_db_path))
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT CACHE_KEY, EXTERNAL_KEY 
-                FROM CACHE_FILE_CLAIM
-            """)
-            
-            cache_file_claims = cursor.fetchall()
-            conn.close()
+            # Read-only access still includes WAL content, without rewriting the extracted files
+            with SourceDatabaseSet(immutable=True) as source_dbs:
+                cursor = source_dbs.connect(cache_db_path).cursor()
+                
+                cursor.execute("""
+                    SELECT CACHE_KEY, EXTERNAL_KEY 
+                    FROM CACHE_FILE_CLAIM
+                """)
+                
+                cache_file_claims = cursor.fetchall()
             
             logger.info(f"Loaded {len(cache_file_claims)} cache file claims from database")
             return cache_file_claims
@@ -404,7 +608,8 @@ class SSHPullService:
             logger.info("=== Starting SSH Tar Stream Media Extraction (Legacy) ===")
             logger.info(f"Target: {self.ssh_user}@{self.ssh_host}:{self.ssh_port}")
             logger.info(f"Output directory: {output_dir}")
-            logger.info("Using SSH tar stream - single compressed transfer")
+            codec = await self.negotiate_codec('media')
+            logger.info(f"Using SSH tar stream - single transfer (compression: {codec})")
             
             # Ensure output directory exists
             os.makedirs(output_dir, exist_ok=True)
@@ -459,154 +664,29 @@ class SSHPullService:
                 logger.warning(f"Directory test failed: {test_output}")
             
             # Create tar command that sends ONLY tar data to stdout and messages to stderr
-            tar_cmd = f'cd {base_dir} && echo \\"Starting tar from $(pwd)\\" >&2 && tar -cf - {tar_files_str} 2>&2 || echo \\"TAR_FAILED\\" >&2'
+            tar_pipeline = compressed_tar_pipeline(f'tar -cf - {tar_files_str} 2>&2', codec)
+            tar_cmd = f'cd {base_dir} && echo \\"Starting tar from $(pwd)\\" >&2 && {tar_pipeline} || echo \\"TAR_FAILED\\" >&2'
             
             logger.info(f"Streaming tar archive of {len(media_items)} media items...")
             logger.debug(f"Tar command: {tar_cmd}")
             
-            # Create local tar file path
-            local_tar_path = os.path.join(output_dir, "snapchat_media_stream.tar")
-            
-            # Build SSH command to stream tar
-            ssh_cmd = [
-                "ssh",
-                "-p", str(self.ssh_port),
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "UserKnownHostsFile=/dev/null", 
-                "-o", "ConnectTimeout=30"
-            ]
-            
-            # Add SSH key if available
-            if self.ssh_key_path:
-                ssh_cmd.extend(["-i", self.ssh_key_path])
-            
-            ssh_cmd.extend([
-                f"{self.ssh_user}@{self.ssh_host}",
-                tar_cmd
-            ])
-            
             logger.info("Executing SSH media tar stream transfer...")
             
-            # Execute SSH command and stream directly to local tar file
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._execute_tar_stream,
-                ssh_cmd,
-                local_tar_path
-            )
-            
-            if result['success']:
-                if os.path.exists(local_tar_path) and os.path.getsize(local_tar_path) > 0:
-                    logger.info(f"Successfully streamed media tar: {local_tar_path} ({os.path.getsize(local_tar_path)} bytes)")
-                    
-                    # Verify tar file integrity
-                    await self._verify_tar_file(local_tar_path)
-                    
-                    # Extract the tar file
-                    extracted_files = await self._extract_tar_file(local_tar_path, output_dir)
-                    
-                    # Clean up tar file
-                    os.remove(local_tar_path)
-                    
-                    return {
-                        'success': True,
-                        'extracted_files': extracted_files,
-                        'message': f"Successfully extracted {len(extracted_files)} media files"
-                    }
-                else:
-                    raise Exception("SSH tar stream completed but local file is missing or empty")
-            else:
+            result = await self.connection.extract_tar(tar_cmd, output_dir, self.timeout, label="media tar", codec=codec)
+            if not result['success']:
                 raise Exception(f"SSH tar stream failed: {result['error']}")
+            
+            extracted_files = result['extracted_files']
+            return {
+                'success': True,
+                'extracted_files': extracted_files,
+                'message': f"Successfully extracted {len(extracted_files)} media files"
+            }
                 
         except Exception as e:
             logger.error(f"SSH tar stream media extraction failed: {e}")
-            
-            # Clean up on failure
-            if 'local_tar_path' in locals() and os.path.exists(local_tar_path):
-                try:
-                    os.remove(local_tar_path)
-                except:
-                    pass
-            
             return {
                 'success': False,
                 'error': str(e),
                 'extracted_files': []
             }
-    
-    def _execute_tar_stream(self, ssh_cmd: List[str], local_tar_path: str) -> Dict[str, Any]:
-        """Execute SSH tar stream command and save to local file"""
-        try:
-            with open(local_tar_path, 'wb') as local_tar_file:
-                result = subprocess.run(
-                    ssh_cmd,
-                    stdout=local_tar_file,
-                    stderr=subprocess.PIPE,
-                    timeout=self.timeout
-                )
-            
-            # Log any messages from stderr
-            if result.stderr:
-                stderr_output = result.stderr.decode()
-                logger.info(f"SSH tar stderr output: {stderr_output}")
-            
-            if result.returncode == 0:
-                return {'success': True}
-            else:
-                return {'success': False, 'error': result.stderr.decode()}
-                
-        except subprocess.TimeoutExpired:
-            return {'success': False, 'error': "SSH tar stream timed out"}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    async def _verify_tar_file(self, tar_path: str) -> None:
-        """Verify tar file integrity by checking header"""
-        with open(tar_path, 'rb') as f:
-            header = f.read(512)  # Tar header is 512 bytes
-            if len(header) >= 512:
-                # Check for tar magic number at offset 257
-                magic = header[257:262]
-                if magic == b'ustar':
-                    logger.info("Tar file appears to have valid header")
-                else:
-                    logger.warning(f"Tar file may be corrupted - magic bytes: {magic}")
-                    logger.warning(f"First 50 bytes: {header[:50]}")
-            else:
-                logger.warning(f"Tar file too small: {len(header)} bytes")
-    
-    async def _extract_tar_file(self, tar_path: str, output_dir: str) -> List[str]:
-        """Extract tar file and return list of extracted files"""
-        extracted_files = []
-        
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            self._extract_tar_sync,
-            tar_path,
-            output_dir,
-            extracted_files
-        )
-        
-        return extracted_files
-    
-    def _extract_tar_sync(self, tar_path: str, output_dir: str, extracted_files: List[str]) -> None:
-        """Synchronous tar extraction"""
-        with tarfile.open(tar_path, 'r') as tar:
-            tar.extractall(output_dir)
-            
-            # Track extracted files
-            for member in tar.getmembers():
-                if member.isfile():
-                    extracted_files.append(member.name)
-        
-        # Log extraction results
-        logger.info(f"Extracted tar file to {output_dir}")
-        for root, dirs, files in os.walk(output_dir):
-            if files:
-                logger.debug(f"Directory {root}: {len(dirs)} dirs, {len(files)} files")
-                if files and logger.isEnabledFor(logging.DEBUG):
-                    logger.debug(f"Sample files: {files[:5]}")
-
-
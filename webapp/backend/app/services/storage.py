@@ -5,23 +5,172 @@ Handles persistence of unified Snapchat objects (Users, Conversations, Messages,
 """
 
 import logging
+import re
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple, Any, Set
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy import and_, desc, asc, func, or_
+from sqlalchemy import and_, case, desc, asc, func, insert, or_, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from ..database import get_db, engine, SessionLocal
-from ..models import User, Conversation, Message, MediaAsset, IngestRun, Device, ConversationParticipant, Base
+from ..models import User, Conversation, ConversationSummary, Message, MessageActivityDaily, MediaAsset, IngestRun, Device, ConversationParticipant, Base
 from ..config import get_settings
 import html
+import secrets
 
 logger = logging.getLogger(__name__)
 
+# Natural key used to deduplicate messages across ingest runs
+MESSAGE_DEDUP_COLUMNS = ("conversation_id", "creation_timestamp")
+
+# Fields that may be refreshed on an existing message (never overwritten with null/empty)
+MESSAGE_UPDATABLE_FIELDS = [
+    'server_message_id', 'client_message_id', 'text', 'content_type',
+    'cache_id', 'read_timestamp', 'parsing_successful', 'raw_message_content',
+    'media_asset_id'
+]
+
+# Full-text index over message text: an FTS5 external-content table (it stores only the
+# index; text is read back from messages) kept in sync with messages by triggers
+MESSAGE_FTS_TABLE = "messages_fts"
+MESSAGE_FTS_TRIGGERS = ("messages_fts_ai", "messages_fts_ad", "messages_fts_au")
+MESSAGE_FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+# Conversation summaries: senders kept for list avatars (3 shown, plus one in case the
+# configured DM exclude name is among them), preview length, conversations per refresh batch
+SUMMARY_AVATAR_PARTICIPANTS = 4
+SUMMARY_PREVIEW_CHARS = 500
+SUMMARY_REFRESH_BATCH = 400
+
+# Activity rollups: bucket size (UTC days) and conversations per refresh batch
+ACTIVITY_DAY_MS = 24 * 60 * 60 * 1000
+ACTIVITY_REFRESH_BATCH = 100
+
+# Media kinds broken out in media statistics
+MEDIA_STAT_TYPES = ("image", "video", "audio")
+
+# Highlight markers and context size of search snippets. FTS5 marks matches with sentinels
+# made of an ASCII control character (STX/ETX) and a per-search nonce, so message text
+# cannot fake them; the snippet is HTML-escaped before they become the markers, and any
+# STX/ETX the message text itself contained are dropped.
+SEARCH_SNIPPET_START = "<mark>"
+SEARCH_SNIPPET_END = "</mark>"
+SEARCH_SNIPPET_CONTROL = ("\x02", "\x03")
+SEARCH_SNIPPET_TOKENS = 12
+
+
+def snippet_sentinels() -> Tuple[str, str]:
+    """Fresh (start, end) match sentinels for one search"""
+    nonce = secrets.token_hex(4)
+    start, end = SEARCH_SNIPPET_CONTROL
+    return f"{start}{nonce}", f"{nonce}{end}"
+
+
+def highlight_snippet(raw_snippet: Optional[str], sentinels: Tuple[str, str]) -> Optional[str]:
+    """HTML-escaped FTS5 snippet with the sentinel-marked matches wrapped in <mark></mark>"""
+    if raw_snippet is None:
+        return None
+    start, end = sentinels
+    marked = (html.escape(raw_snippet)
+              .replace(start, SEARCH_SNIPPET_START)
+              .replace(end, SEARCH_SNIPPET_END))
+    for control in SEARCH_SNIPPET_CONTROL:
+        marked = marked.replace(control, "")
+    return marked
+
+
+def has_message_fts(connection) -> bool:
+    """Check whether the message FTS table and all of its sync triggers exist"""
+    names = {
+        row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'messages_fts%'"
+        ).fetchall()
+    }
+    return MESSAGE_FTS_TABLE in names and all(trigger in names for trigger in MESSAGE_FTS_TRIGGERS)
+
+
+def build_fts_match_query(search_text: str) -> Optional[str]:
+    """
+    Turn free-form search input into an FTS5 MATCH expression.
+
+    Every word must match (implicit AND); the last word matches as a prefix so results
+    appear while it is still being typed. Words are quoted, so FTS5 operators and
+    punctuation in the input are treated as plain text. Returns None if there are no words.
+    """
+    words = re.findall(r"\w+", search_text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def count_where(condition):
+    """COUNT of the rows matching condition (conditional aggregation, so several counts share one pass)"""
+    return func.count(case((condition, 1)))
+
+
+def sum_where(column, condition):
+    """SUM of column over the rows matching condition, 0 when there are none"""
+    return func.coalesce(func.sum(case((condition, column))), 0)
+
+
+def activity_day(timestamp_ms: int) -> int:
+    """Rollup bucket (UTC days since the epoch) of a millisecond timestamp"""
+    return timestamp_ms // ACTIVITY_DAY_MS
+
+
+def preview_media_type(file_type: Optional[str], mime_type: Optional[str]) -> Optional[str]:
+    """Media kind shown in a conversation preview: image, video, audio or None"""
+    if not file_type:
+        return None
+    file_type = file_type.lower()
+    for kind in ('image', 'video', 'audio'):
+        if file_type == kind or (mime_type and mime_type.startswith(f'{kind}/')):
+            return kind
+    return None
+
+
+def has_unique_message_dedup_index(connection) -> bool:
+    """
+    Check whether the messages table has a UNIQUE index on exactly
+    (conversation_id, creation_timestamp). Databases created before the index was
+    made unique still have a plain index until they are upgraded.
+    """
+    for index_row in connection.exec_driver_sql("PRAGMA index_list('messages')").fetchall():
+        index_name, is_unique = index_row[1], index_row[2]
+        if not is_unique:
+            continue
+        columns = [info_row[2] for info_row in connection.exec_driver_sql(f"PRAGMA index_info('{index_name}')").fetchall()]
+        if tuple(columns) == MESSAGE_DEDUP_COLUMNS:
+            return True
+    return False
+
 
 class StorageService:
     """Handles database operations for Snapchat data"""
     
+    # Cached result of has_unique_message_dedup_index (the schema doesn't change at runtime)
+    _bulk_message_upsert_supported: Optional[bool] = None
+    
+    # Cached result of has_message_fts
+    _message_fts_available: Optional[bool] = None
+    
     def __init__(self, db: Session):
         self.db = db
     
@@ -55,6 +204,12 @@ class StorageService:
         """Get user by ID"""
         return self.db.query(User).filter(User.id == user_id).first()
     
+    def get_users_by_ids(self, user_ids: Set[str]) -> Dict[str, User]:
+        """Get users by ID in one query"""
+        if not user_ids:
+            return {}
+        return {user.id: user for user in self.db.query(User).filter(User.id.in_(user_ids)).all()}
+    
     def get_users(self, limit: int = 100, offset: int = 0) -> List[User]:
         """Get paginated list of users"""
         return self.db.query(User).offset(offset).limit(limit).all()
@@ -70,9 +225,16 @@ class StorageService:
             if existing_conv:
                 # Update existing conversation
                 for key, value in conversation_data.items():
+                    # Messages may be stored out of order (e.g. text-only ones first), so the
+                    # last message time only ever moves forward
+                    if key == "last_message_at" and existing_conv.last_message_at and value and value < existing_conv.last_message_at:
+                        continue
                     if hasattr(existing_conv, key):
                         setattr(existing_conv, key, value)
                 existing_conv.updated_at = datetime.utcnow()
+                if "is_group_chat" in conversation_data and existing_conv.summary is not None:
+                    # The ad flag depends on the chat type as well as on the senders
+                    existing_conv.summary.is_ad = not existing_conv.is_group_chat and existing_conv.summary.sender_count == 1
                 logger.debug(f"Updated conversation {conversation_data['id']}")
                 return existing_conv
             else:
@@ -122,33 +284,200 @@ class StorageService:
     
     def get_conversations(self, limit: int = 100, offset: int = 0, exclude_ads: bool = False) -> List[Conversation]:
         """Get paginated list of conversations"""
-        query = (self.db.query(Conversation)
+        return [conversation for conversation, _, _ in self.get_conversation_list(limit, offset, exclude_ads)]
+
+    def get_conversation_list(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        exclude_ads: bool = False
+    ) -> List[Tuple[Conversation, Optional[ConversationSummary], Optional[User]]]:
+        """
+        Page of conversations ordered by last message, with their summary and the sender
+        of the last message, in one query
+
+        Ads are non-group chats with a single sender (flagged in the summary).
+        Conversations without messages have no summary.
+        """
+        query = (self.db.query(Conversation, ConversationSummary, User)
+                .outerjoin(ConversationSummary, ConversationSummary.conversation_id == Conversation.id)
+                .outerjoin(User, User.id == ConversationSummary.last_sender_id)
                 .order_by(desc(Conversation.last_message_at)))
-        
+
         if exclude_ads:
-            # Filter out conversations that are likely ads:
-            # 1. Non-group chats AND
-            # 2. Have only one unique sender (one-sided conversations)
-            from sqlalchemy import func, and_
-            
-            # Subquery to get conversations with only one unique sender
-            one_sided_convs = (
-                self.db.query(Message.conversation_id)
-                .group_by(Message.conversation_id)
-                .having(func.count(func.distinct(Message.sender_id)) == 1)
-                .subquery()
-            )
-            
-            # Exclude non-group chats that are one-sided
-            query = query.filter(
-                ~and_(
-                    Conversation.is_group_chat == False,
-                    Conversation.id.in_(one_sided_convs)
-                )
-            )
-        
+            query = query.filter(or_(ConversationSummary.is_ad.is_(None), ConversationSummary.is_ad == False))
+
         return query.offset(offset).limit(limit).all()
 
+    def refresh_conversation_summaries(self, conversation_ids: Optional[List[str]] = None) -> int:
+        """
+        Recompute the conversation_summary rows of the given conversations (all when None)
+        from their messages. Called by the ingest writer for every conversation it wrote
+        messages to; the caller commits.
+
+        Returns:
+            Number of conversations refreshed
+        """
+        # The summaries are computed in SQL: pending message changes must be visible (autoflush is off)
+        self.db.flush()
+        if conversation_ids is None:
+            conversation_ids = [conversation_id for (conversation_id,) in self.db.query(Conversation.id).all()]
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        
+        for i in range(0, len(conversation_ids), SUMMARY_REFRESH_BATCH):
+            self._refresh_conversation_summary_batch(conversation_ids[i:i + SUMMARY_REFRESH_BATCH])
+        return len(conversation_ids)
+
+    def refresh_message_aggregates(self, message_keys: List[Tuple[str, int]]) -> None:
+        """
+        Bring the conversation summaries and daily activity rollups in line with messages
+        that were written or changed, given by (conversation_id, creation_timestamp).
+        The caller commits.
+        """
+        self.refresh_conversation_summaries([conversation_id for conversation_id, _ in message_keys])
+        self.refresh_activity_rollups(message_keys)
+
+    def refresh_activity_rollups(self, message_keys: List[Tuple[str, int]]) -> int:
+        """
+        Recompute the message_activity_daily rows of every conversation day touched by the
+        given (conversation_id, creation_timestamp) keys from the messages of those days.
+        Recomputing (rather than adding deltas) keeps re-ingested and updated messages
+        from being counted twice. The caller commits.
+
+        Returns:
+            Number of conversations refreshed
+        """
+        # The rollups are computed in SQL: pending message changes must be visible (autoflush is off)
+        self.db.flush()
+        
+        # First and last touched day per conversation; the days in between are recomputed too
+        day_ranges: Dict[str, Tuple[int, int]] = {}
+        for conversation_id, timestamp in message_keys:
+            if timestamp is None:
+                continue
+            day = activity_day(timestamp)
+            first_day, last_day = day_ranges.get(conversation_id, (day, day))
+            day_ranges[conversation_id] = (min(first_day, day), max(last_day, day))
+        
+        ranges = list(day_ranges.items())
+        for i in range(0, len(ranges), ACTIVITY_REFRESH_BATCH):
+            self._refresh_activity_batch(ranges[i:i + ACTIVITY_REFRESH_BATCH])
+        return len(ranges)
+
+    def _refresh_activity_batch(self, day_ranges: List[Tuple[str, Tuple[int, int]]]) -> None:
+        """Replace the rollup rows of one batch of conversation day ranges with one grouped query"""
+        day = (Message.creation_timestamp // ACTIVITY_DAY_MS).label("day")
+        rows = (self.db.query(day, Message.conversation_id, Message.sender_id,
+                              func.count(Message.id), func.count(Message.media_asset_id))
+                .filter(or_(*[
+                    and_(Message.conversation_id == conversation_id,
+                         Message.creation_timestamp >= first_day * ACTIVITY_DAY_MS,
+                         Message.creation_timestamp < (last_day + 1) * ACTIVITY_DAY_MS)
+                    for conversation_id, (first_day, last_day) in day_ranges
+                ]))
+                .group_by(day, Message.conversation_id, Message.sender_id)
+                .all())
+
+        self.db.query(MessageActivityDaily).filter(or_(*[
+            and_(MessageActivityDaily.conversation_id == conversation_id,
+                 MessageActivityDaily.day.between(first_day, last_day))
+            for conversation_id, (first_day, last_day) in day_ranges
+        ])).delete(synchronize_session=False)
+
+        if rows:
+            self.db.execute(insert(MessageActivityDaily), [
+                {"day": row_day, "conversation_id": conversation_id, "sender_id": sender_id,
+                 "message_count": message_count, "media_count": media_count}
+                for row_day, conversation_id, sender_id, message_count, media_count in rows
+            ])
+
+    def rebuild_activity_rollups(self) -> int:
+        """
+        Recompute all activity rollups from the messages in one INSERT ... SELECT pass.
+        The caller commits.
+
+        Returns:
+            Number of rollup rows written
+        """
+        day = Message.creation_timestamp // ACTIVITY_DAY_MS
+        self.db.query(MessageActivityDaily).delete(synchronize_session=False)
+        self.db.execute(insert(MessageActivityDaily).from_select(
+            ["day", "conversation_id", "sender_id", "message_count", "media_count"],
+            select(day, Message.conversation_id, Message.sender_id,
+                   func.count(Message.id), func.count(Message.media_asset_id))
+            .group_by(day, Message.conversation_id, Message.sender_id)
+        ))
+        return self.db.query(func.count()).select_from(MessageActivityDaily).scalar()
+
+    def _refresh_conversation_summary_batch(self, conversation_ids: List[str]) -> None:
+        """Recompute summaries for one batch of conversations with three grouped queries"""
+        # Per-sender counts: summed into the totals, and the most active senders become avatars
+        totals: Dict[str, Dict[str, Any]] = {}
+        sender_counts = (self.db.query(Message.conversation_id, Message.sender_id,
+                                       func.count(Message.id).label("message_count"),
+                                       func.count(Message.media_asset_id))
+                        .filter(Message.conversation_id.in_(conversation_ids))
+                        .group_by(Message.conversation_id, Message.sender_id)
+                        .order_by(Message.conversation_id, desc("message_count"), Message.sender_id))
+        for conversation_id, sender_id, message_count, media_count in sender_counts:
+            summary = totals.setdefault(conversation_id, {
+                "message_count": 0, "media_count": 0, "sender_count": 0, "avatar_participant_ids": []
+            })
+            summary["message_count"] += message_count
+            summary["media_count"] += media_count
+            summary["sender_count"] += 1
+            if len(summary["avatar_participant_ids"]) < SUMMARY_AVATAR_PARTICIPANTS:
+                summary["avatar_participant_ids"].append(sender_id)
+
+        # Latest message of each conversation ((conversation_id, creation_timestamp) is unique)
+        latest = (self.db.query(Message.conversation_id, func.max(Message.creation_timestamp).label("creation_timestamp"))
+                 .filter(Message.conversation_id.in_(conversation_ids))
+                 .group_by(Message.conversation_id)
+                 .subquery())
+        last_messages = (self.db.query(Message.conversation_id, Message.id, Message.creation_timestamp, Message.text,
+                                       Message.sender_id, Message.media_asset_id, MediaAsset.file_type, MediaAsset.mime_type)
+                        .join(latest, and_(Message.conversation_id == latest.c.conversation_id,
+                                           Message.creation_timestamp == latest.c.creation_timestamp))
+                        .outerjoin(MediaAsset, MediaAsset.id == Message.media_asset_id))
+        group_chats = dict(self.db.query(Conversation.id, Conversation.is_group_chat)
+                          .filter(Conversation.id.in_(conversation_ids)))
+
+        now = datetime.utcnow()
+        rows = []
+        for conversation_id, message_id, timestamp, text, sender_id, media_asset_id, file_type, mime_type in last_messages:
+            summary = totals[conversation_id]
+            rows.append({
+                "conversation_id": conversation_id,
+                "last_message_id": message_id,
+                "last_message_timestamp": timestamp,
+                "last_message_text": text[:SUMMARY_PREVIEW_CHARS] if text else text,
+                "last_message_has_media": media_asset_id is not None,
+                "last_message_media_type": preview_media_type(file_type, mime_type) if media_asset_id is not None else None,
+                "last_sender_id": sender_id,
+                "message_count": summary["message_count"],
+                "media_count": summary["media_count"],
+                "sender_count": summary["sender_count"],
+                "is_ad": not group_chats.get(conversation_id) and summary["sender_count"] == 1,
+                "avatar_participant_ids": summary["avatar_participant_ids"],
+                "updated_at": now
+            })
+
+        # Conversations whose messages are all gone lose their summary
+        self.db.query(ConversationSummary).filter(
+            ConversationSummary.conversation_id.in_(set(conversation_ids) - set(totals))
+        ).delete(synchronize_session=False)
+
+        if rows:
+            stmt = sqlite_insert(ConversationSummary)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["conversation_id"],
+                set_={column: stmt.excluded[column] for column in rows[0] if column != "conversation_id"}
+            )
+            self.db.execute(stmt, rows)
+        # Summaries already loaded in this session are stale now
+        for summary in [obj for obj in self.db.identity_map.values() if isinstance(obj, ConversationSummary)]:
+            self.db.expire(summary)
+
     def upsert_conversation_participants(self, conversation_id: str, participants: List[Dict[str, Any]]) -> List[ConversationParticipant]:
         """Create or update conversation participants for a group chat"""
         try:
@@ -332,14 +661,7 @@ class StorageService:
         """
         updated = False
 
-        # List of fields that can be updated (excluding primary key, foreign keys, and timestamps)
-        updatable_fields = [
-            'server_message_id', 'client_message_id', 'text', 'content_type',
-            'cache_id', 'read_timestamp', 'parsing_successful', 'raw_message_content',
-            'media_asset_id'
-        ]
-
-        for field in updatable_fields:
+        for field in MESSAGE_UPDATABLE_FIELDS:
             if field in new_data:
                 new_value = new_data[field]
                 current_value = getattr(existing_message, field)
@@ -363,6 +685,104 @@ class StorageService:
 
         return updated
     
+    def supports_bulk_message_upsert(self) -> bool:
+        """Whether bulk_upsert_messages can be used (requires the unique dedup index)"""
+        if StorageService._bulk_message_upsert_supported is None:
+            try:
+                StorageService._bulk_message_upsert_supported = has_unique_message_dedup_index(self.db.connection())
+            except Exception as e:
+                logger.warning(f"Could not inspect message indexes, using per-row upserts: {e}")
+                return False
+            if not StorageService._bulk_message_upsert_supported:
+                logger.info("Unique (conversation_id, creation_timestamp) index missing - using per-row message upserts")
+        return StorageService._bulk_message_upsert_supported
+    
+    def bulk_upsert_messages(
+        self,
+        messages_data: List[Dict[str, Any]],
+        errors: Optional[List[str]] = None
+    ) -> Set[Tuple[str, int]]:
+        """
+        Insert or update many messages with a single INSERT ... ON CONFLICT DO UPDATE.
+
+        Follows the same rules as create_message/_update_message_fields: existing
+        non-null values are never replaced with null or empty values, and updated_at
+        only changes when a field actually changed. Requires supports_bulk_message_upsert().
+        If the batch hits an integrity error, it is retried row by row so a malformed
+        message only drops itself.
+
+        Args:
+            messages_data: Message dicts in database format (see DataProcessorService._convert_message_for_db)
+            errors: Optional list that receives one message per row that could not be written
+
+        Returns:
+            Set of (conversation_id, creation_timestamp) keys that were newly inserted
+        """
+        if not messages_data:
+            return set()
+        
+        keys = list(dict.fromkeys(
+            (message_data["conversation_id"], message_data["creation_timestamp"]) for message_data in messages_data
+        ))
+        
+        # One set-based lookup per batch of keys to find which rows already exist
+        existing_keys = set()
+        key_batch_size = 400
+        for i in range(0, len(keys), key_batch_size):
+            key_batch = keys[i:i + key_batch_size]
+            existing_keys.update(
+                tuple(row) for row in self.db.query(Message.conversation_id, Message.creation_timestamp)
+                .filter(tuple_(Message.conversation_id, Message.creation_timestamp).in_(key_batch))
+                .all()
+            )
+        
+        now = datetime.utcnow()
+        rows = []
+        for message_data in messages_data:
+            row = {field: message_data.get(field) for field in MESSAGE_UPDATABLE_FIELDS}
+            row["conversation_id"] = message_data["conversation_id"]
+            row["creation_timestamp"] = message_data["creation_timestamp"]
+            row["sender_id"] = message_data.get("sender_id")
+            if row["parsing_successful"] is None:
+                row["parsing_successful"] = False
+            row["created_at"] = now
+            row["updated_at"] = now
+            rows.append(row)
+        
+        stmt = sqlite_insert(Message)
+        # COALESCE(NULLIF(new, ''), current) keeps the current value when the new one is null/empty
+        merged_values = {
+            field: func.coalesce(func.nullif(stmt.excluded[field], ''), getattr(Message, field))
+            for field in MESSAGE_UPDATABLE_FIELDS
+        }
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(MESSAGE_DEDUP_COLUMNS),
+            set_={**merged_values, "updated_at": now},
+            where=or_(*[
+                merged_values[field].is_distinct_from(getattr(Message, field))
+                for field in MESSAGE_UPDATABLE_FIELDS
+            ])
+        )
+        failed_keys = set()
+        try:
+            self.db.execute(stmt, rows)
+        except IntegrityError as e:
+            logger.warning(f"⚠️ Bulk message upsert failed ({e.orig}) - retrying {len(rows)} rows individually")
+            for row in rows:
+                try:
+                    self.db.execute(stmt, [row])
+                except IntegrityError as row_error:
+                    key = (row["conversation_id"], row["creation_timestamp"])
+                    failed_keys.add(key)
+                    error_msg = f"Failed to store message {key}: {row_error.orig}"
+                    logger.error(error_msg)
+                    if errors is not None:
+                        errors.append(error_msg)
+        
+        new_keys = set(keys) - existing_keys - failed_keys
+        logger.debug(f"Bulk upserted {len(rows)} messages ({len(new_keys)} new)")
+        return new_keys
+    
     def get_messages_by_conversation(
         self,
         conversation_id: str,
@@ -370,50 +790,105 @@ class StorageService:
         offset: int = 0,
         since_timestamp: Optional[int] = None,
         until_timestamp: Optional[int] = None,
-        content_type: Optional[str] = None,
-        has_media: Optional[bool] = None
+        content_type: Optional[int] = None,
+        has_media: Optional[bool] = None,
+        before: Optional[Tuple[int, int]] = None,
+        after: Optional[Tuple[int, int]] = None
     ) -> List[Message]:
-        """Get messages for a conversation in reverse chronological order (newest first), optionally filtered by timestamp and other criteria"""
+        """
+        Get messages for a conversation in reverse chronological order (newest first), optionally filtered by timestamp and other criteria
+
+        before/after are (creation_timestamp, id) keysets, see _page_messages.
+        """
         from sqlalchemy.orm import joinedload
 
         query = (self.db.query(Message)
                 .options(joinedload(Message.sender), joinedload(Message.media_asset))
-                .filter(Message.conversation_id == conversation_id)
-                .order_by(desc(Message.creation_timestamp)))
+                .filter(Message.conversation_id == conversation_id))
+        query = self._filter_messages(query, since_timestamp, until_timestamp, content_type, has_media)
+        return self._page_messages(query, limit, offset, before, after)
+    
+    def get_messages_by_sender(
+        self,
+        sender_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        since_timestamp: Optional[int] = None,
+        until_timestamp: Optional[int] = None,
+        content_type: Optional[int] = None,
+        has_media: Optional[bool] = None,
+        before: Optional[Tuple[int, int]] = None,
+        after: Optional[Tuple[int, int]] = None
+    ) -> List[Message]:
+        """Get messages from a specific sender (newest first), with the same filters as get_messages_by_conversation"""
+        from sqlalchemy.orm import joinedload
 
+        query = (self.db.query(Message)
+                .options(joinedload(Message.sender), joinedload(Message.media_asset))
+                .filter(Message.sender_id == sender_id))
+        query = self._filter_messages(query, since_timestamp, until_timestamp, content_type, has_media)
+        return self._page_messages(query, limit, offset, before, after)
+
+    def _filter_messages(
+        self,
+        query,
+        since_timestamp: Optional[int],
+        until_timestamp: Optional[int],
+        content_type: Optional[int],
+        has_media: Optional[bool]
+    ):
+        """Apply the common message list filters to a query"""
         if since_timestamp:
             query = query.filter(Message.creation_timestamp >= since_timestamp)
 
         if until_timestamp:
             query = query.filter(Message.creation_timestamp <= until_timestamp)
 
-        if content_type:
+        if content_type is not None:
             query = query.filter(Message.content_type == content_type)
 
         if has_media is not None:
             if has_media:
-                query = query.filter(Message.media_references.isnot(None))
+                query = query.filter(Message.media_asset_id.isnot(None))
             else:
-                query = query.filter(Message.media_references.is_(None))
+                query = query.filter(Message.media_asset_id.is_(None))
 
-        return query.offset(offset).limit(limit).all()
-    
-    def get_messages_by_sender(
+        return query
+
+    def _page_messages(
         self,
-        sender_id: str,
-        limit: int = 100,
-        offset: int = 0
+        query,
+        limit: int,
+        offset: int = 0,
+        before: Optional[Tuple[int, int]] = None,
+        after: Optional[Tuple[int, int]] = None
     ) -> List[Message]:
-        """Get messages from a specific sender"""
-        from sqlalchemy.orm import joinedload
+        """
+        One page of a message query, newest first.
+
+        With a keyset - the (creation_timestamp, id) of the oldest (before) or newest
+        (after) message already shown - the page starts by seeking the timeline indexes
+        ((conversation_id|sender_id, creation_timestamp), id being the rowid) instead of
+        reading and discarding offset rows, so deep pages cost the same as the first one
+        and stay stable while new messages are ingested. An after page holds the limit
+        messages immediately newer than the keyset.
+        """
+        sort_key = tuple_(Message.creation_timestamp, Message.id)
 
-        return (self.db.query(Message)
-                .options(joinedload(Message.sender), joinedload(Message.media_asset))
-                .filter(Message.sender_id == sender_id)
-                .order_by(desc(Message.creation_timestamp))
-                .offset(offset)
-                .limit(limit)
-                .all())
+        if after is not None:
+            page = (query.filter(sort_key > tuple(after))
+                    .order_by(asc(Message.creation_timestamp), asc(Message.id))
+                    .limit(limit)
+                    .all())
+            page.reverse()
+            return page
+
+        query = query.order_by(desc(Message.creation_timestamp), desc(Message.id))
+        if before is not None:
+            query = query.filter(sort_key < tuple(before))
+        else:
+            query = query.offset(offset)
+        return query.limit(limit).all()
 
     def find_recent_messages_by_media(
         self,
@@ -763,6 +1238,58 @@ class StorageService:
             logger.warning(f"Failed to get last source timestamp: {e}")
             return 0
     
+    def get_last_source_read_timestamp(self) -> Optional[int]:
+        """Get the latest source read timestamp recorded by the last successful ingest run.
+        Returns None if it was not recorded (runs before read tracking, or on error).
+        """
+        try:
+            last_successful_run = (self.db.query(IngestRun)
+                .filter(IngestRun.status == "completed")
+                .order_by(desc(IngestRun.completed_at))
+                .first())
+            
+            if last_successful_run and last_successful_run.extraction_settings:
+                return last_successful_run.extraction_settings.get('source_latest_read_timestamp')
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to get last source read timestamp: {e}")
+            return None
+    
+    def get_last_full_reconcile_time(self) -> Optional[datetime]:
+        """Get when the last full (non-incremental) message extraction completed.
+        Incremental runs carry the previous value forward in extraction_settings.
+        """
+        try:
+            last_successful_run = (self.db.query(IngestRun)
+                .filter(IngestRun.status == "completed")
+                .order_by(desc(IngestRun.completed_at))
+                .first())
+            
+            if last_successful_run and last_successful_run.extraction_settings:
+                value = last_successful_run.extraction_settings.get('last_full_reconcile_at')
+                if value:
+                    return datetime.fromisoformat(value)
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to get last full reconcile time: {e}")
+            return None
+    
+    def get_earliest_pending_media_timestamp(self, since_timestamp: int) -> Optional[int]:
+        """Get the oldest creation_timestamp (ms) at or after since_timestamp of a message
+        that references media (cache_id) but has no linked media asset yet."""
+        try:
+            return (self.db.query(func.min(Message.creation_timestamp))
+                .filter(
+                    Message.cache_id.isnot(None),
+                    Message.cache_id != '',
+                    Message.media_asset_id.is_(None),
+                    Message.creation_timestamp >= since_timestamp
+                )
+                .scalar())
+        except Exception as e:
+            logger.warning(f"Failed to get earliest pending media timestamp: {e}")
+            return None
+    
     # Bulk operations for unified parser
     def bulk_insert_unified_data(
         self, 
@@ -858,62 +1385,145 @@ class StorageService:
         content_type: Optional[int] = None,
         has_media: Optional[bool] = None,
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        before: Optional[Tuple[int, int]] = None,
+        after: Optional[Tuple[int, int]] = None
     ) -> List[Message]:
-        """Get messages with various filters"""
+        """Get messages with various filters (newest first)"""
         from sqlalchemy.orm import joinedload
         
         query = (self.db.query(Message)
                 .options(joinedload(Message.sender), joinedload(Message.media_asset)))
+        query = self._filter_messages(query, since_timestamp, until_timestamp, content_type, has_media)
+        return self._page_messages(query, limit, offset, before, after)
+    
+    def supports_message_fts(self) -> bool:
+        """Whether search_messages can use the full-text index"""
+        if StorageService._message_fts_available is None:
+            try:
+                StorageService._message_fts_available = has_message_fts(self.db.connection())
+            except Exception as e:
+                logger.warning(f"Could not inspect message search index, using LIKE search: {e}")
+                return False
+            if not StorageService._message_fts_available:
+                logger.info("Message FTS index missing - message search falls back to LIKE scans")
+        return StorageService._message_fts_available
+    
+    def search_messages(
+        self,
+        search_text: str,
+        sender_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        since_timestamp: Optional[int] = None,
+        until_timestamp: Optional[int] = None,
+        order: str = "relevance",
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[List[Tuple[Message, Optional[str], Optional[float]]], int]:
+        """
+        Full-text search over message text.
+
+        Uses the messages_fts index: results are ranked by bm25 (order="relevance") or by
+        time (order="recent") and come with a highlighted snippet. Without the index, falls
+        back to a case-insensitive substring scan (newest first, no snippets).
+
+        Returns:
+            ([(message, snippet, rank)], total number of matches)
+        """
+        from sqlalchemy import text
+        from sqlalchemy.orm import joinedload
         
-        if since_timestamp:
-            query = query.filter(Message.creation_timestamp >= since_timestamp)
+        if not self.supports_message_fts():
+            query = self.db.query(Message).filter(Message.text.ilike(f"%{search_text}%"))
+            if sender_id:
+                query = query.filter(Message.sender_id == sender_id)
+            if conversation_id:
+                query = query.filter(Message.conversation_id == conversation_id)
+            if since_timestamp:
+                query = query.filter(Message.creation_timestamp >= since_timestamp)
+            if until_timestamp:
+                query = query.filter(Message.creation_timestamp <= until_timestamp)
+            total_count = query.count()
+            messages = (query.options(joinedload(Message.sender), joinedload(Message.conversation))
+                        .order_by(desc(Message.creation_timestamp))
+                        .offset(offset).limit(limit).all())
+            return [(message, None, None) for message in messages], total_count
         
+        match_query = build_fts_match_query(search_text)
+        if match_query is None:
+            return [], 0
+        
+        conditions = ["messages_fts MATCH :match"]
+        params: Dict[str, Any] = {"match": match_query}
+        if sender_id:
+            conditions.append("m.sender_id = :sender_id")
+            params["sender_id"] = sender_id
+        if conversation_id:
+            conditions.append("m.conversation_id = :conversation_id")
+            params["conversation_id"] = conversation_id
+        if since_timestamp:
+            conditions.append("m.creation_timestamp >= :since_timestamp")
+            params["since_timestamp"] = since_timestamp
         if until_timestamp:
-            query = query.filter(Message.creation_timestamp <= until_timestamp)
+            conditions.append("m.creation_timestamp <= :until_timestamp")
+            params["until_timestamp"] = until_timestamp
+        where_clause = " AND ".join(conditions)
+        order_clause = "m.creation_timestamp DESC" if order == "recent" else "rank, m.creation_timestamp DESC"
         
-        if content_type is not None:
-            query = query.filter(Message.content_type == content_type)
+        total_count = self.db.execute(text(
+            f"SELECT COUNT(*) FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid WHERE {where_clause}"
+        ), params).scalar()
         
-        if has_media is not None:
-            if has_media:
-                query = query.filter(Message.media_asset_id.isnot(None))
-            else:
-                query = query.filter(Message.media_asset_id.is_(None))
+        sentinels = snippet_sentinels()
+        rows = self.db.execute(text(f"""
+            SELECT m.id,
+                   snippet(messages_fts, 0, :snippet_start, :snippet_end, '…', :snippet_tokens) AS snippet,
+                   bm25(messages_fts) AS rank
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE {where_clause}
+            ORDER BY {order_clause}
+            LIMIT :limit OFFSET :offset
+        """), {
+            **params,
+            "snippet_start": sentinels[0],
+            "snippet_end": sentinels[1],
+            "snippet_tokens": SEARCH_SNIPPET_TOKENS,
+            "limit": limit,
+            "offset": offset,
+        }).fetchall()
         
-        return (query.order_by(desc(Message.creation_timestamp))
-                .offset(offset)
-                .limit(limit)
-                .all())
+        messages_by_id = {
+            message.id: message for message in
+            self.db.query(Message)
+            .options(joinedload(Message.sender), joinedload(Message.conversation))
+            .filter(Message.id.in_([row.id for row in rows]))
+            .all()
+        } if rows else {}
+        
+        results = [(messages_by_id[row.id], highlight_snippet(row.snippet, sentinels), row.rank) for row in rows if row.id in messages_by_id]
+        return results, total_count
     
     def get_message_stats_by_conversation(self, conversation_id: str) -> Dict[str, Any]:
         """Get message statistics for a conversation"""
-        return {
-            "total_messages": self.db.query(Message).filter(Message.conversation_id == conversation_id).count(),
-            "text_messages": self.db.query(Message).filter(
-                and_(Message.conversation_id == conversation_id, Message.content_type == 1)
-            ).count(),
-            "media_messages": self.db.query(Message).filter(
-                and_(Message.conversation_id == conversation_id, Message.content_type.in_([0, 2]))
-            ).count(),
-            "messages_with_media": self.db.query(Message).filter(
-                and_(Message.conversation_id == conversation_id, Message.media_asset_id.isnot(None))
-            ).count()
-        }
+        return self._message_type_counts(Message.conversation_id == conversation_id)
     
     def get_message_stats_by_sender(self, sender_id: str) -> Dict[str, Any]:
         """Get message statistics for a sender"""
+        return self._message_type_counts(Message.sender_id == sender_id)
+    
+    def _message_type_counts(self, condition) -> Dict[str, Any]:
+        """Message counts by kind for the messages matching condition, in one pass"""
+        total, text, media, with_media = (self.db.query(
+            func.count(Message.id),
+            count_where(Message.content_type == 1),
+            count_where(Message.content_type.in_([0, 2])),
+            func.count(Message.media_asset_id)
+        ).filter(condition).one())
         return {
-            "total_messages": self.db.query(Message).filter(Message.sender_id == sender_id).count(),
-            "text_messages": self.db.query(Message).filter(
-                and_(Message.sender_id == sender_id, Message.content_type == 1)
-            ).count(),
-            "media_messages": self.db.query(Message).filter(
-                and_(Message.sender_id == sender_id, Message.content_type.in_([0, 2]))
-            ).count(),
-            "messages_with_media": self.db.query(Message).filter(
-                and_(Message.sender_id == sender_id, Message.media_asset_id.isnot(None))
-            ).count()
+            "total_messages": total,
+            "text_messages": text,
+            "media_messages": media,
+            "messages_with_media": with_media
         }
     
     def get_media_assets_with_filters(
@@ -939,93 +1549,55 @@ class StorageService:
     
     def get_media_stats(self, file_type: Optional[str] = None) -> Dict[str, Any]:
         """Get general media statistics"""
-        query = self.db.query(MediaAsset)
-        if file_type:
-            query = query.filter(MediaAsset.file_type == file_type)
-        
-        total_count = query.count()
-        total_size = query.with_entities(func.sum(MediaAsset.file_size)).scalar() or 0
-        
-        return {
-            "total_assets": total_count,
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "by_type": {
-                "image": self.db.query(MediaAsset).filter(MediaAsset.file_type == "image").count(),
-                "video": self.db.query(MediaAsset).filter(MediaAsset.file_type == "video").count(),
-                "audio": self.db.query(MediaAsset).filter(MediaAsset.file_type == "audio").count(),
-            }
-        }
+        return self._media_totals(self.db.query(MediaAsset), file_type)
     
     def get_media_stats_by_sender(self, sender_id: str, file_type: Optional[str] = None) -> Dict[str, Any]:
         """Get media statistics for a specific sender"""
-        query = self.db.query(MediaAsset).filter(MediaAsset.sender_id == sender_id)
-        if file_type:
-            query = query.filter(MediaAsset.file_type == file_type)
-        
-        total_count = query.count()
-        total_size = query.with_entities(func.sum(MediaAsset.file_size)).scalar() or 0
-        
         return {
             "sender_id": sender_id,
-            "total_assets": total_count,
+            **self._media_totals(self.db.query(MediaAsset).filter(MediaAsset.sender_id == sender_id), file_type)
+        }
+    
+    def _media_totals(self, query, file_type: Optional[str] = None, count_key: str = "total_assets") -> Dict[str, Any]:
+        """
+        Count and size of the media assets of query (restricted to file_type, if given)
+        plus counts by type (never restricted to file_type), in one pass
+        """
+        selected = MediaAsset.file_type == file_type if file_type else None
+        row = query.with_entities(
+            count_where(selected) if file_type else func.count(MediaAsset.id),
+            sum_where(MediaAsset.file_size, selected) if file_type else func.coalesce(func.sum(MediaAsset.file_size), 0),
+            *[count_where(MediaAsset.file_type == media_type) for media_type in MEDIA_STAT_TYPES]
+        ).one()
+        total_count, total_size = row[0], row[1]
+        
+        return {
+            count_key: total_count,
             "total_size_bytes": total_size,
             "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "by_type": {
-                "image": self.db.query(MediaAsset).filter(
-                    and_(MediaAsset.sender_id == sender_id, MediaAsset.file_type == "image")
-                ).count(),
-                "video": self.db.query(MediaAsset).filter(
-                    and_(MediaAsset.sender_id == sender_id, MediaAsset.file_type == "video")
-                ).count(),
-                "audio": self.db.query(MediaAsset).filter(
-                    and_(MediaAsset.sender_id == sender_id, MediaAsset.file_type == "audio")
-                ).count(),
-            }
+            "by_type": dict(zip(MEDIA_STAT_TYPES, row[2:]))
         }
     
     # Additional methods for conversation and user endpoints
     def get_conversation_participants(self, conversation_id: str) -> List[Tuple[User, Dict[str, Any]]]:
-        """Get all participants in a conversation with their message counts"""
-        from sqlalchemy import distinct
-        
-        # Get unique senders in this conversation
-        participant_ids = (self.db.query(distinct(Message.sender_id))
-                         .filter(Message.conversation_id == conversation_id)
-                         .all())
-        
-        participants = []
-        for (sender_id,) in participant_ids:
-            user = self.get_user_by_id(sender_id)
-            if user:
-                message_count = (self.db.query(Message)
-                               .filter(and_(Message.conversation_id == conversation_id, 
-                                          Message.sender_id == sender_id))
-                               .count())
-                participants.append((user, {"message_count": message_count}))
+        """Get all participants in a conversation with their message counts (most active first)"""
+        rows = (self.db.query(User, func.count(Message.id).label("message_count"))
+                .join(Message, Message.sender_id == User.id)
+                .filter(Message.conversation_id == conversation_id)
+                .group_by(User.id)
+                .order_by(desc("message_count"), User.id)
+                .all())
         
-        return participants
+        return [(user, {"message_count": message_count}) for user, message_count in rows]
     
     def get_conversation_media_stats(self, conversation_id: str) -> Dict[str, Any]:
         """Get media statistics for a conversation"""
-        # Get all messages with media in this conversation
+        # Media assets linked to messages of this conversation
         media_query = (self.db.query(MediaAsset)
                       .join(Message, MediaAsset.id == Message.media_asset_id)
                       .filter(Message.conversation_id == conversation_id))
         
-        total_media = media_query.count()
-        total_size = media_query.with_entities(func.sum(MediaAsset.file_size)).scalar() or 0
-        
-        return {
-            "total_media_files": total_media,
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "by_type": {
-                "image": media_query.filter(MediaAsset.file_type == "image").count(),
-                "video": media_query.filter(MediaAsset.file_type == "video").count(),
-                "audio": media_query.filter(MediaAsset.file_type == "audio").count()
-            }
-        }
+        return self._media_totals(media_query, count_key="total_media_files")
     
     def search_users(self, search_term: str, limit: int = 50, offset: int = 0) -> List[User]:
         """Search users by username or display name"""
@@ -1040,63 +1612,31 @@ class StorageService:
                 .all())
     
     def get_user_conversations(self, user_id: str, limit: int = 20) -> List[Tuple[Conversation, Dict[str, Any]]]:
-        """Get conversations that a user has participated in"""
-        # Get unique conversation IDs for this user
-        conv_ids = (self.db.query(distinct(Message.conversation_id))
-                   .filter(Message.sender_id == user_id)
-                   .limit(limit)
-                   .all())
-        
-        conversations = []
-        for (conv_id,) in conv_ids:
-            conversation = self.get_conversation_by_id(conv_id)
-            if conversation:
-                # Get stats for this user in this conversation
-                message_count = (self.db.query(Message)
-                               .filter(and_(Message.conversation_id == conv_id,
-                                          Message.sender_id == user_id))
-                               .count())
-                media_count = (self.db.query(Message)
-                             .filter(and_(Message.conversation_id == conv_id,
-                                        Message.sender_id == user_id,
-                                        Message.media_asset_id.isnot(None)))
-                             .count())
-                
-                conversations.append((conversation, {
-                    "message_count": message_count,
-                    "media_count": media_count
-                }))
+        """Get the conversations a user has sent messages in (most recent first) with the user's counts in each"""
+        rows = (self.db.query(Conversation,
+                              func.count(Message.id),
+                              func.count(Message.media_asset_id))
+                .join(Message, Message.conversation_id == Conversation.id)
+                .filter(Message.sender_id == user_id)
+                .group_by(Conversation.id)
+                .order_by(desc(func.coalesce(Conversation.last_message_at, Conversation.created_at)))
+                .limit(limit)
+                .all())
         
-        return sorted(conversations, key=lambda x: x[0].last_message_at or x[0].created_at, reverse=True)
+        return [
+            (conversation, {"message_count": message_count, "media_count": media_count})
+            for conversation, message_count, media_count in rows
+        ]
     
     def get_user_activity(self, user_id: str, days: int = 30) -> Dict[str, Any]:
-        """Get user activity over the specified number of days"""
-        from datetime import datetime, timedelta
-        
-        # Calculate timestamp range (Snapchat uses milliseconds)
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=days)
-        start_ms = int(start_time.timestamp() * 1000)
-        end_ms = int(end_time.timestamp() * 1000)
-        
-        # Get messages in time range
-        messages_count = (self.db.query(Message)
-                         .filter(and_(
-                             Message.sender_id == user_id,
-                             Message.creation_timestamp >= start_ms,
-                             Message.creation_timestamp <= end_ms
-                         ))
-                         .count())
-        
-        # Get media in time range
-        media_count = (self.db.query(Message)
-                      .filter(and_(
-                          Message.sender_id == user_id,
-                          Message.creation_timestamp >= start_ms,
-                          Message.creation_timestamp <= end_ms,
-                          Message.media_asset_id.isnot(None)
-                      ))
-                      .count())
+        """Get user activity over the last days UTC days (including today), from the daily rollups"""
+        messages_count, media_count = (self.db.query(
+            func.coalesce(func.sum(MessageActivityDaily.message_count), 0),
+            func.coalesce(func.sum(MessageActivityDaily.media_count), 0)
+        ).filter(
+            MessageActivityDaily.sender_id == user_id,
+            self._activity_window(days)
+        ).one())
         
         return {
             "messages_sent": messages_count,
@@ -1105,30 +1645,46 @@ class StorageService:
             "avg_media_per_day": round(media_count / days, 2)
         }
 
+    @staticmethod
+    def _activity_window(days: int):
+        """Rollup filter for the last days UTC days, including today"""
+        today = activity_day(int(datetime.now(timezone.utc).timestamp() * 1000))
+        return MessageActivityDaily.day.between(today - days + 1, today)
+
     @staticmethod
     def get_database_info() -> Dict[str, Any]:
         """Get database information and statistics"""
         with SessionLocal() as db:
             try:
-                # Table counts
-                tables_info = {
-                    "users": db.query(func.count(User.id)).scalar() or 0,
-                    "conversations": db.query(func.count(Conversation.id)).scalar() or 0,
-                    "messages": db.query(func.count(Message.id)).scalar() or 0,
-                    "media_assets": db.query(func.count(MediaAsset.id)).scalar() or 0,
-                    "devices": db.query(func.count(Device.id)).scalar() or 0,
-                    "ingest_runs": db.query(func.count(IngestRun.id)).scalar() or 0,
+                # Table counts (one statement of scalar subqueries)
+                table_models = {
+                    "users": User, "conversations": Conversation, "messages": Message,
+                    "media_assets": MediaAsset, "devices": Device, "ingest_runs": IngestRun,
                 }
+                counts = db.execute(select(*[
+                    select(func.count()).select_from(model).scalar_subquery().label(name)
+                    for name, model in table_models.items()
+                ])).one()
+                tables_info = {name: count or 0 for name, count in zip(table_models, counts)}
                 
                 # Message statistics
                 message_stats = {}
+                linked_media = 0
                 if tables_info["messages"] > 0:
+                    text, media, mixed, successful, failed, linked_media = db.query(
+                        count_where(Message.content_type == 1),
+                        count_where(Message.content_type == 0),
+                        count_where(Message.content_type == 2),
+                        count_where(Message.parsing_successful == True),
+                        count_where(Message.parsing_successful == False),
+                        func.count(Message.media_asset_id)
+                    ).one()
                     message_stats = {
-                        "text_messages": db.query(func.count(Message.id)).filter(Message.content_type == 1).scalar() or 0,
-                        "media_messages": db.query(func.count(Message.id)).filter(Message.content_type == 0).scalar() or 0,
-                        "mixed_messages": db.query(func.count(Message.id)).filter(Message.content_type == 2).scalar() or 0,
-                        "successful_parsing": db.query(func.count(Message.id)).filter(Message.parsing_successful == True).scalar() or 0,
-                        "failed_parsing": db.query(func.count(Message.id)).filter(Message.parsing_successful == False).scalar() or 0,
+                        "text_messages": text,
+                        "media_messages": media,
+                        "mixed_messages": mixed,
+                        "successful_parsing": successful,
+                        "failed_parsing": failed,
                     }
                 
                 # Media statistics
@@ -1136,13 +1692,15 @@ class StorageService:
                 if tables_info["media_assets"] > 0:
                     media_types = db.query(
                         MediaAsset.file_type,
-                        func.count(MediaAsset.id).label('count')
+                        func.count(MediaAsset.id),
+                        func.count(MediaAsset.cache_id)
                     ).group_by(MediaAsset.file_type).all()
                     
                     media_stats = {
-                        "by_type": {media_type: count for media_type, count in media_types},
-                        "with_cache_id": db.query(func.count(MediaAsset.id)).filter(MediaAsset.cache_id.isnot(None)).scalar() or 0,
-                        "linked_to_messages": db.query(func.count(MediaAsset.id)).join(Message, MediaAsset.id == Message.media_asset_id).scalar() or 0,
+                        "by_type": {media_type: count for media_type, count, _ in media_types},
+                        "with_cache_id": sum(with_cache_id for _, _, with_cache_id in media_types),
+                        # media_asset_id is a foreign key, so every set one is a linked asset
+                        "linked_to_messages": linked_media,
                     }
                 
                 # Latest ingest run info
@@ -1236,24 +1794,22 @@ class StorageService:
 
     # Enhanced Statistics Methods
     def get_activity_stats(self, days: int) -> Dict[str, Any]:
-        """Get activity statistics for the specified number of days"""
-        from datetime import timedelta
-        
+        """
+        Get activity statistics for the last days UTC days (including today)
+
+        Message and media counts come from the daily rollups, so the cost depends on the
+        window, not on the size of the archive. Media files are the messages with media.
+        """
         end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=days)
-        start_ms = int(start_time.timestamp() * 1000)
-        end_ms = int(end_time.timestamp() * 1000)
+        today = activity_day(int(datetime.now(timezone.utc).timestamp() * 1000))
+        start_time = datetime.utcfromtimestamp((today - days + 1) * ACTIVITY_DAY_MS // 1000)
+        window = self._activity_window(days)
         
-        # Messages created in time period
-        messages_in_period = (self.db.query(Message)
-                             .filter(Message.creation_timestamp >= start_ms)
-                             .filter(Message.creation_timestamp <= end_ms)
-                             .count())
-        
-        # Media files in time period
-        media_in_period = (self.db.query(MediaAsset)
-                          .filter(MediaAsset.file_timestamp >= start_time)
-                          .count())
+        # Messages and media in time period
+        messages_in_period, media_in_period = (self.db.query(
+            func.coalesce(func.sum(MessageActivityDaily.message_count), 0),
+            func.coalesce(func.sum(MessageActivityDaily.media_count), 0)
+        ).filter(window).one())
         
         # Ingest runs in time period
         runs_in_period = (self.db.query(IngestRun)
@@ -1261,20 +1817,18 @@ class StorageService:
                          .count())
         
         # Top users by message count
-        top_users = (self.db.query(Message.sender_id, func.count(Message.id))
-                    .filter(Message.creation_timestamp >= start_ms)
-                    .filter(Message.creation_timestamp <= end_ms)
-                    .group_by(Message.sender_id)
-                    .order_by(desc(func.count(Message.id)))
+        top_users = (self.db.query(MessageActivityDaily.sender_id, func.sum(MessageActivityDaily.message_count).label("message_count"))
+                    .filter(window)
+                    .group_by(MessageActivityDaily.sender_id)
+                    .order_by(desc("message_count"))
                     .limit(10)
                     .all())
         
         # Top conversations by message count
-        top_conversations = (self.db.query(Message.conversation_id, func.count(Message.id))
-                           .filter(Message.creation_timestamp >= start_ms)
-                           .filter(Message.creation_timestamp <= end_ms)
-                           .group_by(Message.conversation_id)
-                           .order_by(desc(func.count(Message.id)))
+        top_conversations = (self.db.query(MessageActivityDaily.conversation_id, func.sum(MessageActivityDaily.message_count).label("message_count"))
+                           .filter(window)
+                           .group_by(MessageActivityDaily.conversation_id)
+                           .order_by(desc("message_count"))
                            .limit(10)
                            .all())
         
@@ -1376,23 +1930,22 @@ class StorageService:
         # Database size
         db_info = self.get_database_info()
         
-        # File system usage for media files
-        total_media_size = (self.db.query(func.sum(MediaAsset.file_size))
-                           .scalar()) or 0
-        
-        # Media type breakdown
-        media_type_stats = {}
-        for file_type in ['image', 'video', 'audio']:
-            count = self.db.query(MediaAsset).filter(MediaAsset.file_type == file_type).count()
-            size = (self.db.query(func.sum(MediaAsset.file_size))
-                   .filter(MediaAsset.file_type == file_type)
-                   .scalar()) or 0
-            
-            media_type_stats[file_type] = {
-                "count": count,
-                "total_size": size,
-                "avg_size": round(size / count, 2) if count > 0 else 0
-            }
+        # Media type breakdown in one grouped pass; the totals are its sums
+        media_type_stats = {file_type: {"count": 0, "total_size": 0, "avg_size": 0} for file_type in MEDIA_STAT_TYPES}
+        total_media_files = 0
+        total_media_size = 0
+        for file_type, count, size in (self.db.query(MediaAsset.file_type,
+                                                     func.count(MediaAsset.id),
+                                                     func.coalesce(func.sum(MediaAsset.file_size), 0))
+                                       .group_by(MediaAsset.file_type)):
+            total_media_files += count
+            total_media_size += size
+            if file_type in media_type_stats:
+                media_type_stats[file_type] = {
+                    "count": count,
+                    "total_size": size,
+                    "avg_size": round(size / count, 2) if count > 0 else 0
+                }
         
         # Recent media files
         recent_media = (self.db.query(MediaAsset)
@@ -1403,9 +1956,9 @@ class StorageService:
         return {
             "database": db_info,
             "media_storage": {
-                "total_media_files": self.db.query(MediaAsset).count(),
+                "total_media_files": total_media_files,
                 "total_media_size": total_media_size,
-                "avg_file_size": round(total_media_size / max(self.db.query(MediaAsset).count(), 1), 2),
+                "avg_file_size": round(total_media_size / max(total_media_files, 1), 2),
                 "media_types": media_type_stats
             },
             "recent_media": [
@@ -1443,13 +1996,16 @@ class StorageService:
             
             # Link messages to media assets by matching cache_id
             linked_count = 0
+            linked_keys = []
             for message in messages_missing_media:
                 if message.cache_id in media_by_cache_id:
                     message.media_asset_id = media_by_cache_id[message.cache_id].id
                     linked_count += 1
+                    linked_keys.append((message.conversation_id, message.creation_timestamp))
                     logger.info(f"Linked message {message.id} (cache_id: {message.cache_id}) to media_asset {message.media_asset_id}")
             
             if linked_count > 0:
+                self.refresh_message_aggregates(linked_keys)
                 self.db.commit()
                 logger.info(f"Successfully linked {linked_count} messages to media assets")
             
@@ -1491,6 +2047,7 @@ class StorageService:
             }
 
             parser = ProtobufParser()
+            repaired_conversations = set()
 
             for message in broken_messages:
                 try:
@@ -1512,6 +2069,7 @@ class StorageService:
                         message.updated_at = datetime.utcnow()
 
                         stats["messages_repaired"] += 1
+                        repaired_conversations.add(message.conversation_id)
                         logger.info(f"Repaired message {message.id}: restored text = '{text_message[:50]}...'")
                     else:
                         stats["messages_still_broken"] += 1
@@ -1525,6 +2083,7 @@ class StorageService:
 
             # Commit all changes
             if stats["messages_repaired"] > 0:
+                self.refresh_conversation_summaries(list(repaired_conversations))
                 self.db.commit()
                 logger.info(f"Successfully repaired {stats['messages_repaired']} broken text messages")
             else:
@@ -0,0 +1,209 @@
+"""
+Cache ID to cache key resolution for Snapchat media.
+
+Messages reference media by cache_id; cache_controller.db maps CACHE_KEY (the
+on-disk filename prefix) to an EXTERNAL_KEY that contains the cache_id somewhere
+inside it. This module resolves cache_ids against those claims without scanning
+every claim for every message.
+"""
+
+import logging
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# EXTERNAL_KEY segments that can be a cache_id on their own
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_\-]+')
+
+
+class AhoCorasick:
+    """Minimal Aho-Corasick automaton for finding many patterns in one pass over a text"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build_failure_links()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                candidate = self._goto[fail_state].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[str]:
+        """Yield every pattern occurring in text (a pattern may be yielded more than once)"""
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            yield from self._output[state]
+
+
+class SubstringSet:
+    """
+    A set of strings answering "which members occur inside this text".
+
+    Members are grouped by length, so a lookup slides one window per distinct member
+    length over the text and checks it against a hash set. Memory is the members
+    themselves, and a lookup costs len(text) * distinct lengths (IDs come in few lengths).
+    """
+
+    def __init__(self, members: Iterable[str]):
+        self._by_length: Dict[int, Set[str]] = {}
+        for member in members:
+            if member:
+                self._by_length.setdefault(len(member), set()).add(member)
+
+    def members_in(self, text: str) -> Iterator[str]:
+        """Yield every member occurring in text (a member may be yielded more than once)"""
+        for length, members in self._by_length.items():
+            for start in range(len(text) - length + 1):
+                window = text[start:start + length]
+                if window in members:
+                    yield window
+
+    def occurs_in(self, text: str) -> bool:
+        """Whether any member occurs in text"""
+        return next(self.members_in(text), None) is not None
+
+
+class CacheKeyResolver:
+    """
+    Resolves message cache_ids to cache keys using CACHE_FILE_CLAIM rows.
+
+    A cache_id resolves to the first claim (in table order) whose EXTERNAL_KEY contains
+    it. EXTERNAL_KEY tokens are indexed once, in order of first appearance. A cache_id
+    made of token characters can only occur inside a single token, so the tokens are
+    scanned with one Aho-Corasick pass per batch instead of every claim per cache_id.
+    The scan stops once every cache_id of the batch is found, which for whole-token
+    cache_ids is at their own token. Other cache_ids fall back to a pass over the claims.
+    Results, including misses, are memoized.
+    """
+
+    def __init__(self, cache_file_claims: List[Tuple[str, str]]):
+        self.cache_file_claims = cache_file_claims
+        self._token_index: Dict[str, Tuple[int, str]] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+
+        for cache_key, external_key in cache_file_claims:
+            if not external_key:
+                continue
+            for token in TOKEN_PATTERN.findall(external_key):
+                if token not in self._token_index:
+                    self._token_index[token] = (len(self._token_index), cache_key)
+        self._tokens = list(self._token_index)
+
+        logger.debug(f"Indexed {len(self._token_index)} EXTERNAL_KEY tokens from {len(cache_file_claims)} cache file claims")
+
+    def resolve(self, cache_id: str) -> Optional[str]:
+        """Resolve a single cache_id to its cache key, or None if no claim references it"""
+        if not cache_id or not self.cache_file_claims:
+            return None
+        if cache_id not in self._resolved:
+            self.resolve_many([cache_id])
+        return self._resolved.get(cache_id)
+
+    def resolve_many(self, cache_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Resolve many cache_ids at once.
+
+        Returns:
+            Mapping of cache_id -> cache_key for every cache_id that could be resolved
+        """
+        results: Dict[str, str] = {}
+        token_ids = set()
+        other_ids = set()
+
+        for cache_id in cache_ids:
+            if not cache_id:
+                continue
+            if cache_id in self._resolved:
+                if self._resolved[cache_id] is not None:
+                    results[cache_id] = self._resolved[cache_id]
+            elif TOKEN_PATTERN.fullmatch(cache_id):
+                token_ids.add(cache_id)
+            else:
+                other_ids.add(cache_id)
+
+        if token_ids and self.cache_file_claims:
+            results.update(self._resolve_by_token(token_ids))
+        if other_ids and self.cache_file_claims:
+            results.update(self._resolve_by_claim(other_ids))
+
+        return results
+
+    def _resolve_by_token(self, cache_ids: Set[str]) -> Dict[str, str]:
+        """Find token-character cache_ids in the EXTERNAL_KEY tokens, earliest first appearance first"""
+        # Whole-token cache_ids are found at their own token at the latest; anything else may need every token
+        if all(cache_id in self._token_index for cache_id in cache_ids):
+            end = max(self._token_index[cache_id][0] for cache_id in cache_ids) + 1
+        else:
+            end = len(self._tokens)
+
+        automaton = AhoCorasick(cache_ids)
+        remaining = set(cache_ids)
+        found: Dict[str, str] = {}
+
+        for token in self._tokens[:end]:
+            for cache_id in automaton.iter_matches(token):
+                if cache_id in remaining:
+                    remaining.discard(cache_id)
+                    found[cache_id] = self._token_index[token][1]
+            if not remaining:
+                break
+
+        for cache_id in cache_ids:
+            self._resolved[cache_id] = found.get(cache_id)
+
+        logger.debug(f"Token scan resolved {len(found)} of {len(cache_ids)} cache IDs")
+        return found
+
+    def _resolve_by_claim(self, cache_ids: Set[str]) -> Dict[str, str]:
+        """Find cache_ids embedded anywhere in EXTERNAL_KEY with one automaton pass over the claims"""
+        automaton = AhoCorasick(cache_ids)
+        remaining = set(cache_ids)
+        found: Dict[str, str] = {}
+
+        for cache_key, external_key in self.cache_file_claims:
+            if not remaining:
+                break
+            if not external_key:
+                continue
+            for cache_id in automaton.iter_matches(external_key):
+                if cache_id in remaining:
+                    remaining.discard(cache_id)
+                    found[cache_id] = cache_key
+
+        for cache_id in cache_ids:
+            self._resolved[cache_id] = found.get(cache_id)
+
+        logger.debug(f"Claim scan resolved {len(found)} of {len(cache_ids)} cache IDs")
+        return found
@@ -3,8 +3,13 @@ Database utilities for SQLite WAL file handling and other database operations
 """
 
 import os
+import shutil
 import sqlite3
 import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
@@ -84,4 +89,102 @@ class WALConsolidator:
         # Connect to the consolidated database
         conn = sqlite3.connect(str(db_path))
         conn.execute("PRAGMA journal_mode=DELETE;")  # Ensure WAL mode is disabled for consistency
-        return conn
\ No newline at end of file
+        return conn
+
+    @staticmethod
+    def has_pending_wal(db_path: str) -> bool:
+        """Whether a non-empty WAL file sits next to the database"""
+        wal_file = str(db_path) + '-wal'
+        return os.path.exists(wal_file) and os.path.getsize(wal_file) > 0
+
+    @staticmethod
+    def connect_read_only(db_path: str, snapshot_dir: str, immutable: bool = False) -> sqlite3.Connection:
+        """
+        Open a source database without modifying it.
+
+        Databases without pending WAL content are opened in place through a read-only
+        URI. Otherwise the database and its WAL are copied into snapshot_dir and the copy
+        is consolidated, so the source files are never checkpointed, rewritten or deleted.
+
+        Args:
+            db_path: Database file
+            snapshot_dir: Where WAL snapshots are written
+            immutable: The file is a private copy nothing else writes to, so SQLite may
+                skip locking and change detection (immutable=1). Leave False for databases
+                read in place, which another process may still be writing (mode=ro).
+        """
+        db_path = str(db_path)
+
+        if os.path.exists(db_path) and not WALConsolidator.has_pending_wal(db_path):
+            uri = f"file:{quote(os.path.abspath(db_path))}?{'immutable=1' if immutable else 'mode=ro'}"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            logger.info(f"Opened {db_path} read-only ({'immutable' if immutable else 'mode=ro'})")
+            return conn
+
+        wal_file = db_path + '-wal'
+        if not os.path.exists(db_path) and not os.path.exists(wal_file):
+            raise FileNotFoundError(f"Database not found: {db_path}")
+
+        os.makedirs(snapshot_dir, exist_ok=True)
+        snapshot_path = tempfile.mkdtemp(dir=snapshot_dir)
+        snapshot_db = os.path.join(snapshot_path, os.path.basename(db_path))
+        if os.path.exists(db_path):
+            shutil.copy2(db_path, snapshot_db)
+        if os.path.exists(wal_file):
+            shutil.copy2(wal_file, snapshot_db + '-wal')
+
+        if not WALConsolidator.consolidate_wal_database(snapshot_db):
+            raise Exception(f"Failed to consolidate WAL snapshot for {db_path}")
+
+        conn = sqlite3.connect(snapshot_db, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON;")
+        logger.info(f"Opened consolidated snapshot of {db_path}")
+        return conn
+
+
+class SourceDatabaseSet:
+    """
+    Run-scoped, read-only access to the extracted source databases.
+
+    Each database file is opened once (see WALConsolidator.connect_read_only) and the
+    connection is shared by every parser component for the rest of the run. Callers
+    must not close connections obtained here; call close() when the run is finished.
+    Pass immutable=True only when the databases are private copies (e.g. pulled into
+    an extraction directory), never for databases read in place.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None, immutable: bool = False):
+        self._snapshot_dir = snapshot_dir
+        self._immutable = immutable
+        self._owns_snapshot_dir = snapshot_dir is None
+        self._connections: Dict[str, sqlite3.Connection] = {}
+
+    def connect(self, db_path) -> sqlite3.Connection:
+        """Get the shared read-only connection for a database file"""
+        key = str(Path(db_path).resolve())
+        conn = self._connections.get(key)
+        if conn is None:
+            if self._snapshot_dir is None:
+                self._snapshot_dir = tempfile.mkdtemp(prefix="snapstash-snapshots-")
+            conn = WALConsolidator.connect_read_only(key, self._snapshot_dir, immutable=self._immutable)
+            self._connections[key] = conn
+        return conn
+
+    def close(self) -> None:
+        """Close all shared connections and remove snapshots this set created"""
+        for conn in self._connections.values():
+            try:
+                conn.close()
+            except Exception as e:
+                logger.debug(f"Error closing source database connection: {e}")
+        self._connections = {}
+
+        if self._owns_snapshot_dir and self._snapshot_dir:
+            shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+            self._snapshot_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,31 @@
+"""
+Opaque cursors for message timeline pagination.
+
+A cursor is the (creation_timestamp, id) keyset of a message, encoded so clients treat it
+as a token to send back instead of something to construct or do arithmetic with.
+"""
+
+import base64
+import binascii
+from typing import Tuple
+
+
+def encode_message_cursor(creation_timestamp: int, message_id: int) -> str:
+    """Cursor pointing at a message's position in the timeline"""
+    raw = f"{creation_timestamp}:{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_message_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    (creation_timestamp, id) keyset of a cursor
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_message_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        creation_timestamp, message_id = raw.split(":")
+        return int(creation_timestamp), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid message cursor: {cursor!r}")
@@ -0,0 +1,63 @@
+"""
+Wall-clock timing of ingestion phases.
+
+Phases may run concurrently (e.g. remote media discovery while messages are decoded),
+so each phase is recorded with its start offset and duration relative to the start of
+the run. The summary reports how much phase time was hidden by overlapping phases.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class PhaseTimer:
+    """Records (start offset, duration) per named phase of one run"""
+
+    def __init__(self):
+        self._started = time.monotonic()
+        self._phases: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block (also usable around awaits)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._phases[name] = {
+                'start': round(start - self._started, 3),
+                'seconds': round(time.monotonic() - start, 3),
+            }
+
+    async def track(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await a coroutine as a named phase (for phases run as concurrent tasks)"""
+        with self.phase(name):
+            return await awaitable
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dictionary with phases ({name: {start, seconds}} in start order), wall_seconds
+            (since the timer was created) and overlap_seconds (phase time spent concurrently)
+        """
+        wall_seconds = round(time.monotonic() - self._started, 3)
+        phases = dict(sorted(self._phases.items(), key=lambda item: item[1]['start']))
+
+        # Union of the phase intervals: anything above it in the phase total ran concurrently
+        covered = 0.0
+        cursor = 0.0
+        for timing in phases.values():
+            start, end = timing['start'], timing['start'] + timing['seconds']
+            if end > cursor:
+                covered += end - max(start, cursor)
+                cursor = end
+        total = sum(timing['seconds'] for timing in phases.values())
+
+        return {
+            'phases': phases,
+            'wall_seconds': wall_seconds,
+            'overlap_seconds': round(max(total - covered, 0.0), 3),
+        }
@@ -0,0 +1,163 @@
+"""
+Remote-side delta export of arroyo.db rows.
+
+Instead of pulling the whole of arroyo.db (plus its WAL) every cycle, a short script is
+fed to the device's sqlite3 CLI. It prints only the conversation_message rows that are
+new or were read since the last run, plus the conversations they belong to, as SQL
+INSERT statements. The output (optionally compressed on the device) is replayed into a
+small local arroyo.db with the same tables and columns the parsers read, so the rest of
+the pipeline runs unchanged on the delta.
+"""
+
+import io
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from .tar_stream import open_decompressed_stream, stream_command_output
+
+logger = logging.getLogger(__name__)
+
+# Tables/columns read by MessageExtractor and ConversationParser. Columns are left
+# untyped so values keep the storage class they had on the device.
+DELTA_SCHEMA = """
+    CREATE TABLE conversation_message (
+        client_conversation_id,
+        server_message_id,
+        message_content,
+        creation_timestamp,
+        read_timestamp,
+        content_type,
+        sender_id
+    );
+    CREATE INDEX idx_delta_message_creation ON conversation_message (creation_timestamp);
+    CREATE TABLE conversation (
+        client_conversation_id PRIMARY KEY,
+        conversation_metadata
+    );
+"""
+
+# Prints "<latest creation_timestamp>|<latest read_timestamp>" for the device's arroyo.db
+SOURCE_STATE_QUERY = "SELECT MAX(creation_timestamp), MAX(read_timestamp) FROM conversation_message;"
+
+# Statements replayed per transaction
+APPLY_BATCH_SIZE = 1000
+
+# Escapes understood by SQLite's unistr(), which recent sqlite3 CLIs use in insert mode
+# for text containing control characters
+_UNISTR_ESCAPE = re.compile(r'\\(\\|[0-9a-fA-F]{4}|u[0-9a-fA-F]{4}|\+[0-9a-fA-F]{6}|U[0-9a-fA-F]{8})')
+
+
+def _unistr(value: Optional[str]) -> Optional[str]:
+    """Python stand-in for unistr() on local SQLite builds that predate it"""
+    if value is None:
+        return None
+
+    def unescape(match: re.Match) -> str:
+        escape = match.group(1)
+        if escape == '\\':
+            return '\\'
+        return chr(int(escape.lstrip('u+U'), 16))
+
+    return _UNISTR_ESCAPE.sub(unescape, value)
+
+
+def build_delta_export_script(since_timestamp: int, read_since_timestamp: int) -> str:
+    """
+    sqlite3 CLI script exporting the rows changed since the watermarks.
+
+    Args:
+        since_timestamp: Export messages created at or after this timestamp (ms)
+        read_since_timestamp: Also export older messages read at or after this timestamp (ms)
+    """
+    changed_rows = (
+        f"creation_timestamp >= {int(since_timestamp)} "
+        f"OR read_timestamp >= {int(read_since_timestamp)}"
+    )
+    return "\n".join([
+        ".mode insert conversation_message",
+        "SELECT client_conversation_id, server_message_id, message_content, creation_timestamp, "
+        f"read_timestamp, content_type, sender_id FROM conversation_message WHERE {changed_rows};",
+        ".mode insert conversation",
+        "SELECT client_conversation_id, conversation_metadata FROM conversation "
+        f"WHERE client_conversation_id IN (SELECT client_conversation_id FROM conversation_message WHERE {changed_rows});",
+        ""
+    ])
+
+
+def parse_source_state(output: str) -> Optional[Dict[str, int]]:
+    """Parse SOURCE_STATE_QUERY output; None if it is not a single result row"""
+    lines = [line for line in output.strip().splitlines() if line.strip()]
+    if len(lines) != 1 or lines[0].count('|') != 1:
+        return None
+    latest, latest_read = lines[0].split('|')
+    try:
+        return {
+            'latest_timestamp': int(latest) if latest else 0,
+            'latest_read_timestamp': int(latest_read) if latest_read else 0,
+        }
+    except ValueError:
+        return None
+
+
+def apply_delta_from_command(
+    cmd: List[str],
+    db_path: str,
+    timeout: int,
+    script: str,
+    codec: str = 'none',
+    label: str = "delta export"
+) -> Dict[str, Any]:
+    """
+    Run the remote sqlite3 export and replay its INSERT statements into a new database.
+
+    Args:
+        cmd: Command running sqlite3 on the device (the script is written to its stdin)
+        db_path: Local database file to create
+        timeout: Seconds before the command is killed
+        script: Export script (see build_delta_export_script)
+        codec: Compression applied on the device ('none', 'gzip', 'zstd' or 'lz4')
+        label: Name used in log lines
+
+    Returns:
+        Dictionary with success, rows, wire_bytes, seconds, codec and error (on failure)
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.create_function("unistr", 1, _unistr, deterministic=True)
+    conn.executescript(DELTA_SCHEMA)
+    stats = {'rows': 0}
+
+    def consume(wire) -> None:
+        stream = open_decompressed_stream(wire, codec)
+        reader = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8', errors='surrogateescape')
+
+        statement = ""
+        for line in reader:
+            statement += line
+            # Text values may contain raw newlines, so a statement can span several lines
+            if not sqlite3.complete_statement(statement):
+                continue
+            if not statement.lstrip().upper().startswith("INSERT INTO"):
+                raise ValueError(f"Unexpected statement in delta export: {statement[:80]!r}")
+            conn.execute(statement)
+            stats['rows'] += 1
+            statement = ""
+            if stats['rows'] % APPLY_BATCH_SIZE == 0:
+                conn.commit()
+        if statement.strip():
+            raise ValueError("Delta export ended with an incomplete statement")
+        conn.commit()
+
+    try:
+        result = stream_command_output(cmd, consume, timeout, stdin_data=script.encode(), label=label)
+    finally:
+        conn.close()
+
+    result.update({'rows': stats['rows'], 'codec': codec})
+    if result['success']:
+        logger.info(
+            f"{label}: applied {stats['rows']} rows ({result['wire_bytes'] / 1024:.1f} KB on the wire, "
+            f"codec={codec}) in {result['seconds']:.1f}s"
+        )
+    return result
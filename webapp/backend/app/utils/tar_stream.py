@@ -0,0 +1,292 @@
+"""
+Streaming extraction of tar archives written to stdout by a remote (SSH) command.
+
+The archive is read straight from the subprocess pipe with tarfile's stream mode
+('r|') and each member is extracted as soon as it arrives, so the archive is never
+staged on local disk. The stream may be compressed on the device (see
+REMOTE_COMPRESSORS) and is then decompressed on the fly.
+"""
+
+import gzip
+import io
+import logging
+import subprocess
+import tarfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Optional decompressors - gzip is always available through tarfile
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    lz4 = None
+    LZ4_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Log an info-level progress line every N extracted files
+PROGRESS_LOG_INTERVAL = 500
+
+# Device-side compressor command per codec, appended to the tar pipeline
+REMOTE_COMPRESSORS = {
+    'zstd': 'zstd -q -c',
+    'gzip': 'gzip -c',
+    'lz4': 'lz4 -q -c',
+}
+
+# Codec preference per payload type when compression is 'auto'. SQLite databases
+# compress very well; media (JPEG/MP4/WebP) is already compressed, so it is sent as-is.
+AUTO_CODEC_PREFERENCE = {
+    'databases': ['zstd', 'gzip', 'lz4'],
+    'media': [],
+}
+
+# Prints the name of each compressor available on the device, one per line
+COMPRESSOR_PROBE_COMMAND = "for c in zstd gzip lz4; do command -v $c >/dev/null 2>&1 && echo $c; done; true"
+
+
+def local_codecs() -> List[str]:
+    """Codecs that can be decompressed locally"""
+    codecs = ['gzip']
+    if ZSTD_AVAILABLE:
+        codecs.append('zstd')
+    if LZ4_AVAILABLE:
+        codecs.append('lz4')
+    return codecs
+
+
+def parse_compressor_probe(output: str) -> List[str]:
+    """Parse COMPRESSOR_PROBE_COMMAND output into the list of known remote codecs"""
+    return [line.strip() for line in output.splitlines() if line.strip() in REMOTE_COMPRESSORS]
+
+
+def choose_codec(setting: str, payload: str, remote_codecs: List[str]) -> str:
+    """
+    Pick the codec for a payload type.
+
+    Args:
+        setting: 'auto', 'none' or a codec name
+        payload: 'databases' or 'media'
+        remote_codecs: Compressors found on the device
+
+    Returns:
+        A codec usable on both sides, or 'none'
+    """
+    usable = [codec for codec in remote_codecs if codec in local_codecs()]
+    if setting == 'auto':
+        for codec in AUTO_CODEC_PREFERENCE.get(payload, []):
+            if codec in usable:
+                return codec
+        return 'none'
+    if setting in usable:
+        return setting
+    if setting != 'none':
+        logger.warning(f"Compression codec '{setting}' not available on both sides (usable: {usable}), sending uncompressed")
+    return 'none'
+
+
+def compressed_tar_pipeline(tar_command: str, codec: str) -> str:
+    """Append the device-side compressor for codec to a 'tar -cf - ...' command"""
+    compressor = REMOTE_COMPRESSORS.get(codec)
+    return f"{tar_command} | {compressor}" if compressor else tar_command
+
+
+class _CountingReader(io.RawIOBase):
+    """Raw stream wrapper counting the bytes read from the wire"""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        count = self.stream.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        # The pipe belongs to the subprocess; decoders wrapping this reader must not close it
+        pass
+
+
+def open_decompressed_stream(wire, codec: str):
+    """Wrap the wire stream in an on-the-fly decompressor for codec"""
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=wire, mode='rb')
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(wire)
+    if codec == 'lz4':
+        return lz4.frame.LZ4FrameFile(wire, mode='rb')
+    return wire
+
+
+def _open_tar_stream(wire: _CountingReader, codec: str) -> tarfile.TarFile:
+    """Open a streaming TarFile over the (possibly compressed) wire stream"""
+    return tarfile.open(fileobj=open_decompressed_stream(wire, codec), mode='r|')
+
+
+def stream_command_output(
+    cmd: List[str],
+    consume: Callable[[_CountingReader], None],
+    timeout: int,
+    stdin_data: Optional[bytes] = None,
+    label: str = "stream"
+) -> Dict[str, Any]:
+    """
+    Run cmd and hand its stdout to consume() while it is being received.
+
+    stdin and stderr are serviced on their own threads and the command is killed after
+    timeout seconds. consume() may raise to abort the transfer.
+
+    Returns:
+        Dictionary with success, wire_bytes, seconds and error (on failure)
+    """
+    stderr_chunks: List[bytes] = []
+    timed_out = threading.Event()
+    error = None
+
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_data is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    def feed_stdin():
+        try:
+            process.stdin.write(stdin_data)
+        except OSError as e:
+            logger.debug(f"{label}: stdin closed early: {e}")
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def drain_stderr():
+        stderr_chunks.append(process.stderr.read())
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    # stdin and stderr are serviced on their own threads so neither pipe can stall the stream
+    threads = [threading.Thread(target=drain_stderr, daemon=True)]
+    if stdin_data is not None:
+        threads.append(threading.Thread(target=feed_stdin, daemon=True))
+    for thread in threads:
+        thread.start()
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+
+    start_time = time.monotonic()
+    wire = _CountingReader(process.stdout)
+    try:
+        consume(wire)
+        # Drain anything left (e.g. end-of-archive padding) so the remote side can exit cleanly
+        wire.read()
+    except tarfile.ReadError as e:
+        error = f"Invalid or empty tar stream: {e}"
+    except Exception as e:
+        error = str(e)
+    finally:
+        if error:
+            process.kill()
+        returncode = process.wait()
+        timer.cancel()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    stderr_output = b''.join(stderr_chunks).decode(errors='replace')
+    if stderr_output:
+        logger.info(f"{label} stderr output: {stderr_output}")
+
+    if timed_out.is_set():
+        error = f"{label} timed out"
+    elif error is None and returncode != 0:
+        error = stderr_output or f"Command exited with code {returncode}"
+
+    result = {
+        'success': error is None,
+        'wire_bytes': wire.bytes_read,
+        'seconds': round(time.monotonic() - start_time, 3),
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def extract_tar_from_command(
+    cmd: List[str],
+    output_dir: str,
+    timeout: int,
+    stdin_data: Optional[bytes] = None,
+    on_member: Optional[Callable[[tarfile.TarInfo], None]] = None,
+    label: str = "tar stream",
+    codec: str = 'none'
+) -> Dict[str, Any]:
+    """
+    Run cmd and extract the tar archive it writes to stdout while it is being received.
+
+    Args:
+        cmd: Command to run (typically ssh ... 'tar -cf - ...')
+        output_dir: Directory to extract into
+        timeout: Seconds before the command is killed
+        stdin_data: Optional bytes written to the command's stdin (e.g. a tar -T - file list)
+        on_member: Optional callback invoked after each regular file has been extracted
+        label: Name used in progress log lines
+        codec: Compression applied on the device ('none', 'gzip', 'zstd' or 'lz4')
+
+    Returns:
+        Dictionary with success, extracted_files, bytes_extracted, wire_bytes, seconds,
+        codec and error (on failure)
+    """
+    extracted_files: List[str] = []
+    stats = {'bytes_extracted': 0}
+
+    def consume(wire: _CountingReader) -> None:
+        with _open_tar_stream(wire, codec) as tar:
+            for member in tar:
+                tar.extract(member, output_dir)
+                if not member.isfile():
+                    continue
+
+                extracted_files.append(member.name)
+                stats['bytes_extracted'] += member.size
+                logger.debug(f"{label}: extracted {member.name} ({member.size} bytes)")
+                if on_member:
+                    on_member(member)
+                if len(extracted_files) % PROGRESS_LOG_INTERVAL == 0:
+                    logger.info(f"{label}: extracted {len(extracted_files)} files ({stats['bytes_extracted'] / (1024 * 1024):.1f} MB)...")
+
+    result = stream_command_output(cmd, consume, timeout, stdin_data=stdin_data, label=label)
+    result.update({
+        'extracted_files': extracted_files,
+        'bytes_extracted': stats['bytes_extracted'],
+        'codec': codec,
+    })
+    if not result['success']:
+        return result
+
+    logger.info(
+        f"{label}: extracted {len(extracted_files)} files ({stats['bytes_extracted'] / (1024 * 1024):.1f} MB, "
+        f"{result['wire_bytes'] / (1024 * 1024):.1f} MB on the wire, codec={codec}) in {result['seconds']:.1f}s"
+    )
+    return result
@@ -0,0 +1,128 @@
+"""
+Batched media transfer helpers.
+
+The needed media set is split into size-balanced batches so it can be streamed over
+several concurrent SSH channels, and every batch that arrives completely is recorded in
+an append-only journal. A transfer interrupted part way (dropped connection, timeout,
+crash) therefore only has to re-request the batches that had not completed.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE_NAME = ".media_transfer_journal.jsonl"
+
+
+def plan_transfer_batches(files: List[Dict[str, Any]], channels: int, batch_bytes: int) -> List[List[Dict[str, Any]]]:
+    """
+    Split files into size-balanced batches.
+
+    At least one batch per channel is planned (so every channel has work), and more when
+    the total exceeds channels * batch_bytes, so a dropped connection costs at most about
+    one batch. Files are assigned largest first to the currently smallest batch.
+
+    Args:
+        files: File info dicts with 'size' (bytes) and 'remote_path'
+        channels: Number of concurrent transfer channels
+        batch_bytes: Target upper size of a batch in bytes
+
+    Returns:
+        Non-empty batches, largest first
+    """
+    if not files:
+        return []
+
+    total_bytes = sum(max(f.get('size', 0), 0) for f in files)
+    batch_count = max(max(channels, 1), math.ceil(total_bytes / max(batch_bytes, 1)))
+    batch_count = min(batch_count, len(files))
+
+    heap = [(0, index) for index in range(batch_count)]
+    batches: List[List[Dict[str, Any]]] = [[] for _ in range(batch_count)]
+    for file_info in sorted(files, key=lambda f: f.get('size', 0), reverse=True):
+        batch_size, index = heapq.heappop(heap)
+        batches[index].append(file_info)
+        heapq.heappush(heap, (batch_size + max(file_info.get('size', 0), 0), index))
+
+    return sorted(batches, key=lambda batch: sum(f.get('size', 0) for f in batch), reverse=True)
+
+
+def local_media_paths(output_dir: str, remote_path: str) -> List[Path]:
+    """
+    Where a transferred remote file can be found locally: as extracted from the tar stream
+    (absolute member paths are stored relative to /), or after the app data directory was
+    moved into the usual com.snapchat.android layout.
+    """
+    candidates = [Path(output_dir) / remote_path.lstrip('/')]
+    relative_path = os.path.relpath(remote_path, "/data/data")
+    if not relative_path.startswith('..'):
+        candidates.append(Path(output_dir) / relative_path)
+    return candidates
+
+
+def batch_id(batch: List[Dict[str, Any]]) -> str:
+    """Stable identifier of a batch's contents"""
+    digest = hashlib.sha1()
+    for file_info in sorted(batch, key=lambda f: f['remote_path']):
+        digest.update(f"{file_info['remote_path']}\0{file_info.get('size', 0)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class TransferJournal:
+    """
+    Append-only record of completed transfer batches, kept in the extraction directory.
+
+    Each line is one completed batch with the (remote_path, size) of its files. Lines
+    are flushed and fsynced as batches complete, so the journal survives a crash.
+    """
+
+    def __init__(self, output_dir: str):
+        self.path = Path(output_dir) / JOURNAL_FILE_NAME
+
+    def completed_files(self) -> Dict[str, int]:
+        """{remote_path: size} of every file in a recorded batch"""
+        completed: Dict[str, int] = {}
+        try:
+            with open(self.path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from an interrupted write
+                        continue
+                    for remote_path, size in entry.get('files', []):
+                        completed[remote_path] = size
+        except OSError:
+            pass
+        return completed
+
+    def rewrite(self, files: Dict[str, int]) -> None:
+        """Replace the journal with a single entry for files ({remote_path: size}), or remove it if empty"""
+        if not files:
+            self.path.unlink(missing_ok=True)
+            return
+        batch = [{'remote_path': remote_path, 'size': size} for remote_path, size in files.items()]
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as journal_file:
+            journal_file.write(json.dumps({'batch': batch_id(batch), 'files': [[f['remote_path'], f['size']] for f in batch]}) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def record(self, batch: List[Dict[str, Any]]) -> None:
+        """Record files (a batch, or the part of it that arrived) as completely transferred"""
+        entry = {
+            'batch': batch_id(batch),
+            'files': [[f['remote_path'], f.get('size', 0)] for f in batch]
+        }
+        with open(self.path, 'a') as journal_file:
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
@@ -0,0 +1,267 @@
+"""
+WAL-frame replication of SQLite databases.
+
+A replica is a local copy of a device database that is kept current by applying the
+frames of the device's write-ahead log to it, so most cycles only transfer the WAL bytes
+appended since the previous cycle. Frames are validated with SQLite's salt values and
+cumulative checksums, and are only applied up to the last complete commit, so a WAL that
+is being written while it is read never leaves the replica half-updated.
+
+A full copy (database + WAL) is needed when there is no replica yet, or when the device
+has checkpointed and reset its WAL (new salt values, or the WAL was removed and the
+database file changed), since frames may have been folded into the database unseen.
+"""
+
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+# WAL magic numbers: the low bit selects the byte order used for checksums
+WAL_MAGIC_LITTLE_ENDIAN = 0x377f0682
+WAL_MAGIC_BIG_ENDIAN = 0x377f0683
+
+STATE_FILE_NAME = "replica_state.json"
+
+
+def wal_checksum(data: bytes, s1: int, s2: int, big_endian: bool) -> Tuple[int, int]:
+    """SQLite's WAL checksum over data (a multiple of 8 bytes), continuing from (s1, s2)"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s1 = (s1 + words[i] + s2) & 0xFFFFFFFF
+        s2 = (s2 + words[i + 1] + s1) & 0xFFFFFFFF
+    return s1, s2
+
+
+def parse_wal_header(data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Parse and validate a 32-byte WAL header.
+
+    Returns:
+        Dictionary with page_size, checkpoint_sequence, salt1, salt2, big_endian and
+        checksum (the running checksum frames continue from), or None if invalid
+    """
+    if len(data) < WAL_HEADER_SIZE:
+        return None
+
+    magic, version, page_size, checkpoint_sequence, salt1, salt2, checksum1, checksum2 = struct.unpack(
+        '>8I', data[:WAL_HEADER_SIZE]
+    )
+    if magic not in (WAL_MAGIC_LITTLE_ENDIAN, WAL_MAGIC_BIG_ENDIAN):
+        return None
+
+    big_endian = magic == WAL_MAGIC_BIG_ENDIAN
+    if wal_checksum(data[:24], 0, 0, big_endian) != (checksum1, checksum2):
+        return None
+
+    return {
+        'page_size': 65536 if page_size == 1 else page_size,
+        'checkpoint_sequence': checkpoint_sequence,
+        'salt1': salt1,
+        'salt2': salt2,
+        'big_endian': big_endian,
+        'checksum': [checksum1, checksum2],
+    }
+
+
+def apply_wal_frames(db_path: str, header: Dict[str, Any], frames: bytes, checksum: Tuple[int, int]) -> Dict[str, Any]:
+    """
+    Apply valid, committed WAL frames to a database file.
+
+    Args:
+        db_path: Database file to update in place
+        header: Parsed header of the WAL the frames belong to
+        frames: Frame bytes, starting at a frame boundary
+        checksum: Running checksum at the start of frames (header checksum for frame 1)
+
+    Returns:
+        Dictionary with bytes_applied (frame bytes up to and including the last commit),
+        checksum (running checksum at that point), frames and commits
+    """
+    page_size = header['page_size']
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    s1, s2 = checksum
+
+    pending: Dict[int, bytes] = {}
+    applied = {'bytes_applied': 0, 'checksum': [s1, s2], 'frames': 0, 'commits': 0}
+
+    with open(db_path, 'r+b') as db_file:
+        offset = 0
+        while offset + frame_size <= len(frames):
+            frame_header = frames[offset:offset + WAL_FRAME_HEADER_SIZE]
+            page_number, commit_size, salt1, salt2, checksum1, checksum2 = struct.unpack('>6I', frame_header)
+            if (salt1, salt2) != (header['salt1'], header['salt2']) or page_number == 0:
+                break
+
+            page = frames[offset + WAL_FRAME_HEADER_SIZE:offset + frame_size]
+            s1, s2 = wal_checksum(frame_header[:8], s1, s2, header['big_endian'])
+            s1, s2 = wal_checksum(page, s1, s2, header['big_endian'])
+            if (s1, s2) != (checksum1, checksum2):
+                break
+
+            pending[page_number] = page
+            offset += frame_size
+
+            if commit_size:
+                # Transaction complete: write its pages and set the database size it committed
+                for pending_page, pending_data in sorted(pending.items()):
+                    db_file.seek((pending_page - 1) * page_size)
+                    db_file.write(pending_data)
+                db_file.truncate(commit_size * page_size)
+                applied['frames'] += len(pending)
+                applied['commits'] += 1
+                applied['bytes_applied'] = offset
+                applied['checksum'] = [s1, s2]
+                pending = {}
+
+    return applied
+
+
+class SQLiteReplica:
+    """
+    Local replica of one device database plus the WAL position it has been replicated to.
+
+    State (remote database stat, WAL salts, byte offset and running checksum) is kept in a
+    JSON file next to the replica files.
+    """
+
+    def __init__(self, replica_dir: str, db_name: str):
+        self.replica_dir = Path(replica_dir)
+        self.db_name = db_name
+        self.db_path = self.replica_dir / db_name
+        self.replica_dir.mkdir(parents=True, exist_ok=True)
+        self._state_path = self.replica_dir / STATE_FILE_NAME
+
+    def _load_all_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path) as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def state(self) -> Optional[Dict[str, Any]]:
+        state = self._load_all_state().get(self.db_name)
+        if state and self.db_path.exists():
+            return state
+        return None
+
+    def _save_state(self, state: Optional[Dict[str, Any]]) -> None:
+        all_state = self._load_all_state()
+        if state is None:
+            all_state.pop(self.db_name, None)
+        else:
+            all_state[self.db_name] = state
+        tmp_path = self._state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as state_file:
+            json.dump(all_state, state_file)
+        os.replace(tmp_path, self._state_path)
+
+    @property
+    def wal_read_offset(self) -> int:
+        """WAL byte offset an incremental read continues from"""
+        state = self.state or {}
+        return max(state.get('wal_offset', 0), WAL_HEADER_SIZE)
+
+    def plan(self, remote_db_stat: Tuple[int, int], remote_wal_size: int) -> str:
+        """
+        Decide how to bring the replica up to date.
+
+        Args:
+            remote_db_stat: (size, mtime) of the database file on the device
+            remote_wal_size: Size of the device's WAL file (0 if there is none)
+
+        Returns:
+            'current' (nothing to do), 'incremental' (read the WAL header and the WAL past
+            the stored offset) or 'full' (copy database and WAL)
+
+        An existing WAL is never judged by its size alone: after a checkpoint SQLite
+        restarts the WAL in place with new salts without shrinking the file, so a WAL of
+        the replicated size may hold entirely different frames. Its header is always
+        read, and apply_increment asks for a full copy when the salts changed.
+        """
+        state = self.state
+        if state is None:
+            return 'full'
+        if remote_wal_size < WAL_HEADER_SIZE:
+            # No WAL: fine as long as nothing was checkpointed into the database since
+            return 'current' if list(remote_db_stat) == state['db_stat'] else 'full'
+        if state.get('salt') is None:
+            # The WAL appeared after the copy; the replica equals the database it grew from
+            return 'incremental' if list(remote_db_stat) == state['db_stat'] else 'full'
+        if remote_wal_size < state['wal_offset']:
+            return 'full'
+        return 'incremental'
+
+    def rebuild(self, db_source: str, wal_source: Optional[str], remote_db_stat: Tuple[int, int]) -> Dict[str, Any]:
+        """Replace the replica with a freshly copied database and apply its WAL"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.replica_dir, prefix=f".{self.db_name}.")
+        os.close(fd)
+        try:
+            shutil.copyfile(db_source, tmp_path)
+            state = {'db_stat': list(remote_db_stat), 'salt': None, 'wal_offset': 0, 'checksum': None}
+            applied = {'frames': 0, 'commits': 0, 'bytes_applied': 0}
+
+            wal_data = b''
+            if wal_source and os.path.exists(wal_source):
+                with open(wal_source, 'rb') as wal_file:
+                    wal_data = wal_file.read()
+            header = parse_wal_header(wal_data)
+            if header:
+                applied = apply_wal_frames(tmp_path, header, wal_data[WAL_HEADER_SIZE:], tuple(header['checksum']))
+                state.update({
+                    'salt': [header['salt1'], header['salt2']],
+                    'wal_offset': WAL_HEADER_SIZE + applied['bytes_applied'],
+                    'checksum': applied['checksum'],
+                })
+
+            os.replace(tmp_path, self.db_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._save_state(state)
+        logger.info(f"Rebuilt {self.db_name} replica: {applied['commits']} commits ({applied['frames']} pages) applied from WAL")
+        return applied
+
+    def apply_increment(self, data: bytes, remote_db_stat: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """
+        Apply WAL bytes read as: the current 32-byte WAL header, then the WAL from the
+        stored offset onwards (or from just past the header if the WAL is new to us).
+
+        Returns:
+            Apply statistics, or None if the WAL no longer continues the replicated one
+            (it was reset in the meantime) and a full copy is needed
+        """
+        state = self.state
+        header = parse_wal_header(data[:WAL_HEADER_SIZE])
+        if state is None or header is None:
+            return None
+
+        if state.get('salt') is None:
+            checksum = tuple(header['checksum'])
+        elif [header['salt1'], header['salt2']] == state['salt']:
+            checksum = tuple(state['checksum'])
+        else:
+            return None
+
+        applied = apply_wal_frames(str(self.db_path), header, data[WAL_HEADER_SIZE:], checksum)
+        state.update({
+            'db_stat': list(remote_db_stat),
+            'salt': [header['salt1'], header['salt2']],
+            'wal_offset': max(state['wal_offset'], WAL_HEADER_SIZE) + applied['bytes_applied'],
+            'checksum': applied['checksum'],
+        })
+        self._save_state(state)
+        logger.info(f"Applied {applied['commits']} commits ({applied['frames']} pages) to {self.db_name} replica")
+        return applied
@@ -0,0 +1,49 @@
+"""Add the conversation_summary table maintained by ingestion
+
+Revision ID: add_conversation_summary
+Revises: add_message_fts
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_conversation_summary'
+down_revision = 'add_message_fts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'conversation_summary',
+        sa.Column('conversation_id', sa.String(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_message_timestamp', sa.BigInteger(), nullable=True),
+        sa.Column('last_message_text', sa.Text(), nullable=True),
+        sa.Column('last_message_has_media', sa.Boolean(), nullable=True),
+        sa.Column('last_message_media_type', sa.String(), nullable=True),
+        sa.Column('last_sender_id', sa.String(), nullable=True),
+        sa.Column('message_count', sa.Integer(), nullable=True),
+        sa.Column('media_count', sa.Integer(), nullable=True),
+        sa.Column('sender_count', sa.Integer(), nullable=True),
+        sa.Column('is_ad', sa.Boolean(), nullable=True),
+        sa.Column('avatar_participant_ids', sa.JSON(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+        sa.ForeignKeyConstraint(['last_sender_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('conversation_id')
+    )
+    
+    # Conversation list order
+    op.create_index('idx_conversations_last_message_at', 'conversations', ['last_message_at'], unique=False)
+    
+    # Rows are filled from the existing messages at application startup
+    # (init_db.ensure_conversation_summaries) and kept current by ingestion
+
+
+def downgrade():
+    op.drop_index('idx_conversations_last_message_at', table_name='conversations')
+    op.drop_table('conversation_summary')
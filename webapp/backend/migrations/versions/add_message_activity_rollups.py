@@ -0,0 +1,41 @@
+"""Add the message_activity_daily rollup table maintained by ingestion
+
+Revision ID: add_message_activity_rollups
+Revises: add_conversation_summary
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_message_activity_rollups'
+down_revision = 'add_conversation_summary'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'message_activity_daily',
+        sa.Column('day', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.String(), nullable=False),
+        sa.Column('sender_id', sa.String(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=True),
+        sa.Column('media_count', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+        sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('day', 'conversation_id', 'sender_id')
+    )
+    op.create_index('idx_activity_daily_sender_day', 'message_activity_daily', ['sender_id', 'day'], unique=False)
+    op.create_index('idx_activity_daily_conversation_day', 'message_activity_daily', ['conversation_id', 'day'], unique=False)
+    
+    # Rows are filled from the existing messages at application startup
+    # (init_db.ensure_activity_rollups) and kept current by ingestion
+
+
+def downgrade():
+    op.drop_index('idx_activity_daily_conversation_day', table_name='message_activity_daily')
+    op.drop_index('idx_activity_daily_sender_day', table_name='message_activity_daily')
+    op.drop_table('message_activity_daily')
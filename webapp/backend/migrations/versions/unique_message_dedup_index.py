@@ -0,0 +1,62 @@
+"""Make the message (conversation_id, creation_timestamp) index unique
+
+Revision ID: unique_message_dedup_index
+Revises: add_push_device_tokens
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'unique_message_dedup_index'
+down_revision = 'add_push_device_tokens'
+branch_labels = None
+depends_on = None
+
+# Fields merged from duplicates into the surviving (lowest id) row before deleting them
+MERGE_FIELDS = [
+    'server_message_id', 'client_message_id', 'text', 'cache_id',
+    'read_timestamp', 'raw_message_content', 'media_asset_id'
+]
+
+
+def upgrade():
+    # Fill empty fields on the surviving row from its duplicates
+    for field in MERGE_FIELDS:
+        op.execute(f"""
+            UPDATE messages
+            SET {field} = (
+                SELECT d.{field} FROM messages d
+                WHERE d.conversation_id = messages.conversation_id
+                  AND d.creation_timestamp = messages.creation_timestamp
+                  AND d.{field} IS NOT NULL AND d.{field} != ''
+                ORDER BY d.id
+                LIMIT 1
+            )
+            WHERE ({field} IS NULL OR {field} = '')
+              AND id IN (
+                SELECT MIN(id) FROM messages
+                GROUP BY conversation_id, creation_timestamp
+                HAVING COUNT(*) > 1
+              )
+        """)
+    
+    # Remove duplicates, keeping the earliest message
+    op.execute("""
+        DELETE FROM messages
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM messages
+            GROUP BY conversation_id, creation_timestamp
+        )
+    """)
+    
+    # Replace the plain index with a unique one
+    op.drop_index('idx_messages_conversation_timestamp', 'messages')
+    op.create_index('idx_messages_conversation_timestamp', 'messages', ['conversation_id', 'creation_timestamp'], unique=True)
+
+
+def downgrade():
+    op.drop_index('idx_messages_conversation_timestamp', 'messages')
+    op.create_index('idx_messages_conversation_timestamp', 'messages', ['conversation_id', 'creation_timestamp'])
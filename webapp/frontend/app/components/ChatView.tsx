@@ -22,7 +22,9 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
   const [error, setError] = useState<string | null>(null);
   const [conversationDetails, setConversationDetails] = useState<ConversationWithMessages | null>(null);
   const [hasMoreMessages, setHasMoreMessages] = useState(true);
-  const [offset, setOffset] = useState(0);
+  // Opaque cursors of the oldest and newest loaded message, for paging in either direction
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [newerCursor, setNewerCursor] = useState<string | null>(null);
   const [showExportModal, setShowExportModal] = useState(false);
   const [exportStartDate, setExportStartDate] = useState('');
   const [exportEndDate, setExportEndDate] = useState('');
@@ -42,7 +44,8 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
 
       // Reset state when conversation changes
       setMessages([]);
-      setOffset(0);
+      setOlderCursor(null);
+      setNewerCursor(null);
       setHasMoreMessages(true);
       setLoading(false);
       setLoadingMore(false);
@@ -65,7 +68,7 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
 
     container.addEventListener('scroll', handleScroll);
     return () => container.removeEventListener('scroll', handleScroll);
-  }, [loadingMore, hasMoreMessages, offset]);
+  }, [loadingMore, hasMoreMessages, olderCursor]);
 
   const scrollToBottom = (smooth: boolean = true) => {
     if (messagesEndRef.current) {
@@ -133,7 +136,7 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
       // Fetch conversation details and initial messages (most recent 100)
       const [detailsResponse, messagesResponse] = await Promise.all([
         api.getConversation(conversationId, true, 100),
-        api.getMessages({ conversation_id: conversationId, limit: 100, offset: 0 })
+        api.getMessages({ conversation_id: conversationId, limit: 100 })
       ]) as [ConversationWithMessages, MessagesResponse];
 
       // Check if the conversation changed while we were fetching
@@ -158,8 +161,9 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
       }
 
       setMessages(reversedMessages);
-      setOffset(messagesResponse.messages?.length || 0);
-      setHasMoreMessages(messagesResponse.messages?.length === 100);
+      setOlderCursor(messagesResponse.cursors?.before ?? null);
+      setNewerCursor(messagesResponse.cursors?.after ?? null);
+      setHasMoreMessages(messagesResponse.pagination?.has_next ?? false);
 
       // Immediately try to scroll to bottom after setting messages
       setTimeout(() => {
@@ -179,7 +183,7 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
   };
 
   const loadMoreMessages = async () => {
-    if (!conversation || loadingMore || !hasMoreMessages) return;
+    if (!conversation || loadingMore || !hasMoreMessages || !olderCursor) return;
 
     const conversationId = conversation.id;
 
@@ -193,7 +197,7 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
       const messagesResponse = await api.getMessages({
         conversation_id: conversationId,
         limit: 100,
-        offset: offset
+        before: olderCursor
       }) as MessagesResponse;
 
       // Check if the conversation changed while we were fetching
@@ -206,8 +210,8 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
         // Reverse new messages and prepend to existing messages
         const reversedNewMessages = [...messagesResponse.messages].reverse();
         setMessages(prev => [...reversedNewMessages, ...prev]);
-        setOffset(prev => prev + messagesResponse.messages.length);
-        setHasMoreMessages(messagesResponse.messages.length === 100);
+        setOlderCursor(messagesResponse.cursors?.before ?? null);
+        setHasMoreMessages(messagesResponse.pagination.has_next);
 
         // Maintain scroll position after adding messages
         setTimeout(() => {
@@ -229,9 +233,63 @@ export default function ChatView({ conversation, onBack, currentUserId, isMobile
     }
   };
 
+  const loadNewerMessages = async () => {
+    if (!conversation || !newerCursor) return;
+
+    const conversationId = conversation.id;
+
+    try {
+      setLoading(true);
+      let cursor: string = newerCursor;
+      const newerMessages: Message[] = [];
+
+      // Page forward from the newest loaded message until caught up
+      while (true) {
+        const messagesResponse = await api.getMessages({
+          conversation_id: conversationId,
+          limit: 100,
+          after: cursor
+        }) as MessagesResponse;
+
+        if (currentConversationIdRef.current !== conversationId) {
+          console.log('Conversation changed during refresh, ignoring results');
+          return;
+        }
+
+        // Pages are newest first; keep the combined list oldest to newest
+        newerMessages.push(...[...(messagesResponse.messages || [])].reverse());
+        if (messagesResponse.cursors?.after) {
+          cursor = messagesResponse.cursors.after;
+        }
+        if (!messagesResponse.pagination.has_prev) break;
+      }
+
+      if (newerMessages.length > 0) {
+        setMessages(prev => [...prev, ...newerMessages]);
+        setNewerCursor(cursor);
+        setTimeout(() => {
+          scrollToBottom(true);
+        }, 100);
+      }
+    } catch (err) {
+      console.error('Failed to load newer messages:', err);
+    } finally {
+      if (currentConversationIdRef.current === conversationId) {
+        setLoading(false);
+      }
+    }
+  };
+
   const handleRefresh = () => {
+    // Keep the loaded history and only fetch what arrived since
+    if (newerCursor && messages.length > 0 && !error) {
+      loadNewerMessages();
+      return;
+    }
+
     setMessages([]);
-    setOffset(0);
+    setOlderCursor(null);
+    setNewerCursor(null);
     setHasMoreMessages(true);
     isInitialLoadRef.current = true;
     fetchConversationData(true);
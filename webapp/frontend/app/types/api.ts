@@ -95,9 +95,15 @@ export interface ConversationsResponse {
   pagination: PaginationInfo;
 }
 
+export interface MessageCursors {
+  before?: string | null;
+  after?: string | null;
+}
+
 export interface MessagesResponse {
   messages: Message[];
   pagination: PaginationInfo;
+  cursors?: MessageCursors;
 }
 
 export interface MediaResponse {
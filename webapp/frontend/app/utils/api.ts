@@ -58,6 +58,8 @@ export const api = {
     has_media?: boolean;
     limit?: number;
     offset?: number;
+    before?: string;
+    after?: string;
   } = {}) => {
     const searchParams = new URLSearchParams();
     Object.entries(params).forEach(([key, value]) => {
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the media matching index
+MediaMatchIndex must link every cache_id to the same media file as the original linear
+scans in DataLinker (methods 2b, 3 and 4), including IDs that only occur mid-token or
+with different case.
+
+Run with: pytest webapp/test_media_matching.py
+"""
+
+import os
+import random
+import string
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The backend reads DATABASE_URL when it is imported, so point it at a scratch database first
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='snapstash-test-'), 'media.db')}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.parsers._data_linker import DataLinker, MediaMatchIndex  # noqa: E402
+from app.utils.cache_key_resolver import CacheKeyResolver  # noqa: E402
+
+
+def linear_method_2b(cache_key, media_files):
+    for media in media_files:
+        if media.get('original_filename') and (cache_key in media['original_filename'] or media['original_filename'].startswith(cache_key)):
+            return media
+    return None
+
+
+def linear_method_3(cache_id, media_files):
+    for media in media_files:
+        if cache_id in media['original_filename'] or cache_id in media['cache_key']:
+            return media
+    return None
+
+
+def linear_method_4(cache_id, media_files):
+    for media in media_files:
+        media_cache_key = media.get('cache_key', '')
+        if (cache_id and media_cache_key and
+            (cache_id.lower() in media_cache_key.lower() or
+             media_cache_key.lower() in cache_id.lower())):
+            return media
+    return None
+
+
+def linear_map_cache_id(cache_id, cache_file_claims):
+    for cache_key, external_key in cache_file_claims:
+        if external_key and cache_id in external_key:
+            return cache_key
+    return None
+
+
+def linear_find(cache_id, media_files, cache_file_claims):
+    """The original per-message matching in DataLinker.link_media_to_messages"""
+    media_by_cache_key = {media['cache_key']: media for media in media_files}
+    if cache_id in media_by_cache_key:
+        return media_by_cache_key[cache_id]
+    cache_key = linear_map_cache_id(cache_id, cache_file_claims)
+    if cache_key and cache_key in media_by_cache_key:
+        return media_by_cache_key[cache_key]
+    elif cache_key:
+        media = linear_method_2b(cache_key, media_files)
+        if media:
+            return media
+    return linear_method_3(cache_id, media_files) or linear_method_4(cache_id, media_files)
+
+
+def random_id(rng, length):
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+def build_fixture(seed):
+    """Media files, cache file claims and message cache_ids that exercise every matching method"""
+    rng = random.Random(seed)
+    media_files = []
+    for i in range(60):
+        cache_key = random_id(rng, rng.choice([6, 10, 16]))
+        if i % 7 == 0:
+            cache_key = cache_key.upper()
+        filename = f"{cache_key}_{random_id(rng, 8)}{rng.choice(['', '.jpg', '.mp4'])}"
+        if i % 5 == 0:
+            filename = f"{random_id(rng, 4)}{filename}"  # cache key mid-token in the filename
+        media_files.append({'cache_key': cache_key, 'original_filename': filename})
+    # Duplicate cache keys: method 1 takes the last one, the fallbacks the first
+    media_files.append(dict(media_files[3], original_filename=f"dup_{media_files[3]['original_filename']}"))
+
+    cache_file_claims = []
+    cache_ids = []
+    for i, media in enumerate(media_files[:30]):
+        cache_id = random_id(rng, 12)
+        cache_file_claims.append((media['cache_key'] if i % 3 else random_id(rng, 6), f"{random_id(rng, 5)}/{cache_id}~x"))
+        cache_ids.append(cache_id)
+
+    for media in media_files:
+        cache_key = media['cache_key']
+        filename = media['original_filename']
+        cache_ids.extend([
+            cache_key,                                  # method 1
+            cache_key[1:-1],                            # mid-token in cache key and filename
+            cache_key.swapcase(),                       # case-differing cache key
+            f"{random_id(rng, 3)}{cache_key.lower()}",  # cache key inside the cache_id
+            filename[2:9],                              # mid-token in the filename only
+            filename[-5:],                              # across the filename separators
+            random_id(rng, 3),                          # short IDs that hit many files
+        ])
+    cache_ids.extend(random_id(rng, 12) for _ in range(20))  # no match
+    rng.shuffle(cache_ids)
+    return media_files, cache_file_claims, cache_ids
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fallback_lookups_match_linear_scans(seed):
+    """Each fallback lookup returns the same file as its linear scan"""
+    media_files, _, cache_ids = build_fixture(seed)
+    index = MediaMatchIndex(media_files)
+    index.prepare(cache_ids[: len(cache_ids) // 2])  # the rest are matched on demand
+    for cache_id in cache_ids:
+        assert index.find_by_filename(cache_id) is linear_method_2b(cache_id, media_files), cache_id
+        assert index.find_by_filename_or_cache_key(cache_id) is linear_method_3(cache_id, media_files), cache_id
+        assert index.find_by_cache_key_overlap(cache_id) is linear_method_4(cache_id, media_files), cache_id
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_linking_matches_linear_scans(seed):
+    """Linking a chunk picks the same media file for every message as the original scans"""
+    media_files, cache_file_claims, cache_ids = build_fixture(seed)
+    messages = [{'server_message_id': i, 'cache_id': cache_id} for i, cache_id in enumerate(cache_ids)]
+
+    linked = DataLinker(Path(tempfile.gettempdir()))._link_chunk(messages, MediaMatchIndex(media_files), CacheKeyResolver(cache_file_claims))
+
+    for message in linked:
+        expected = linear_find(message['cache_id'], media_files, cache_file_claims)
+        assert message['media_asset'] is expected, message['cache_id']
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the statistics queries
+Each statistics method must issue a fixed number of SQL statements, whatever the
+amount of data, so per-row or per-type queries cannot creep back in. The maintained
+aggregates (daily activity rollups) must match the messages after repairs.
+
+Run with: pytest webapp/test_stats_queries.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pytest
+
+# The backend reads DATABASE_URL when it is imported, so point it at a scratch database first
+DB_DIR = tempfile.mkdtemp(prefix="snapstash-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DB_DIR, 'stats.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from sqlalchemy import event  # noqa: E402
+
+from app.database import SessionLocal, engine  # noqa: E402
+from app.init_db import init_database  # noqa: E402
+from app.models import (  # noqa: E402
+    Conversation, ConversationParticipant, Device, IngestRun, MediaAsset, Message, User
+)
+from app.services.storage import StorageService  # noqa: E402
+
+USERS = ["alice", "bob", "carol"]
+CONVERSATIONS = ["chat-1", "chat-2"]
+FILE_TYPES = ["image", "video", "audio"]
+
+
+@contextmanager
+def count_statements():
+    """Count the SQL statements executed on the engine inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Session on a scratch database with users, conversations, messages, media and an ingest run"""
+    init_database()
+    session = SessionLocal()
+    now = int(time.time() * 1000)
+
+    session.add_all(User(id=user_id, username=user_id, display_name=user_id.title()) for user_id in USERS)
+    session.add_all(Conversation(id=conversation_id, group_name=conversation_id) for conversation_id in CONVERSATIONS)
+    session.add_all(
+        ConversationParticipant(conversation_id=conversation_id, user_id=user_id)
+        for conversation_id in CONVERSATIONS for user_id in USERS
+    )
+    device = Device(name="phone", ssh_host="127.0.0.1", ssh_user="root")
+    session.add(device)
+    session.flush()
+    session.add(IngestRun(device_id=device.id, status="completed", extraction_type="full"))
+
+    for i in range(60):
+        sender_id = USERS[i % len(USERS)]
+        media_asset_id = None
+        if i % 4 == 0:
+            asset = MediaAsset(
+                sender_id=sender_id,
+                cache_id=f"cache-{i}",
+                file_path=f"media_storage/shared/cache-{i}",
+                file_hash=f"hash-{i}",
+                file_size=1000 + i,
+                file_type=FILE_TYPES[i % len(FILE_TYPES)],
+                original_filename=f"cache-{i}",
+            )
+            session.add(asset)
+            session.flush()
+            media_asset_id = asset.id
+        session.add(Message(
+            conversation_id=CONVERSATIONS[i % len(CONVERSATIONS)],
+            sender_id=sender_id,
+            creation_timestamp=now - i * 3_600_000,
+            text=f"message {i}" if media_asset_id is None else None,
+            content_type=1 if media_asset_id is None else 3,
+            media_asset_id=media_asset_id,
+            parsing_successful=True,
+        ))
+    session.commit()
+
+    storage = StorageService(session)
+    storage.refresh_conversation_summaries()
+    storage.rebuild_activity_rollups()
+    session.commit()
+
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("method, args, expected", [
+    ("get_conversation_participants", ("chat-1",), 1),
+    ("get_user_conversations", ("alice",), 1),
+    ("get_message_stats_by_conversation", ("chat-1",), 1),
+    ("get_message_stats_by_sender", ("alice",), 1),
+    ("get_media_stats", (), 1),
+    ("get_media_stats", ("image",), 1),
+    ("get_media_stats_by_sender", ("alice",), 1),
+    ("get_conversation_media_stats", ("chat-1",), 1),
+    # Database info (table counts, message stats, media stats, latest run), media types, recent media
+    ("get_storage_stats", (), 6),
+])
+def test_statement_count(db, method, args, expected):
+    """Each statistics method issues a fixed number of statements"""
+    storage = StorageService(db)
+    db.expire_all()
+    with count_statements() as statements:
+        result = getattr(storage, method)(*args)
+    assert result
+    assert len(statements) == expected, "\n\n".join(statements)
+
+
+def test_activity_media_counts_after_link_repair(db):
+    """Links made by fix_missing_media_links show up in the activity statistics"""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+
+    from app.main import app
+
+    now = int(time.time() * 1000)
+    asset = MediaAsset(
+        sender_id="bob",
+        cache_id="late-cache",
+        file_path="media_storage/shared/late-cache",
+        file_hash="hash-late",
+        file_size=2048,
+        file_type="image",
+        original_filename="late-cache",
+    )
+    db.add(asset)
+    db.add(Message(conversation_id="chat-2", sender_id="bob", creation_timestamp=now - 1000,
+                   cache_id="late-cache", content_type=3, parsing_successful=True))
+    db.commit()
+    storage = StorageService(db)
+    storage.refresh_activity_rollups([("chat-2", now - 1000)])
+    db.commit()
+
+    assert storage.fix_missing_media_links()["links_created"] == 1
+
+    day_start = now // 86_400_000 * 86_400_000
+    expected_media = (db.query(func.count(Message.media_asset_id))
+                      .filter(Message.creation_timestamp >= day_start - 6 * 86_400_000)
+                      .scalar())
+    activity = TestClient(app).get("/api/stats/activity", params={"days": 7}).json()["activity"]
+    assert activity["media_files"] == expected_media